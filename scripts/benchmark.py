@@ -0,0 +1,59 @@
+''' Times the persistence pipeline over a grid of cases and optionally
+    compares against a baseline, e.g.
+
+    $ python -m scripts.benchmark --shapes circle torus pixels \
+          --points 64 128 256 --output benchmark.json
+    $ python -m scripts.benchmark ... --baseline benchmark.json
+
+    Exits with status 1 when a case regressed.
+'''
+import argparse
+import sys
+
+from topology.benchmark import SHAPES
+from topology.benchmark import benchmark_grid
+from topology.benchmark import compare
+from topology.benchmark import load_results
+from topology.benchmark import run_benchmark
+from topology.benchmark import save_results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shapes', nargs='+', default=['circle'],
+                        choices=sorted(SHAPES))
+    parser.add_argument('--points', nargs='+', type=int,
+                        default=[16, 32, 64, 128, 256])
+    parser.add_argument('--max-dimension', nargs='+', type=int, default=[2])
+    parser.add_argument('--skeleton', nargs='+', type=float, default=[1.7])
+    parser.add_argument('--metric', nargs='+', default=['euclidean'])
+    parser.add_argument('--engine', nargs='+', default=['numpy'])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown, as a fraction')
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    cases = benchmark_grid(shapes=args.shapes, n_points=args.points,
+                           max_dimension=args.max_dimension,
+                           skeleton=args.skeleton, metric=args.metric,
+                           engine=args.engine)
+    results = run_benchmark(cases, repeats=args.repeats, warmup=args.warmup,
+                            random_state=args.seed, verbose=True)
+    save_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline),
+                              tolerance=args.tolerance)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(1)
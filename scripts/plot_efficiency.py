@@ -1,11 +1,9 @@
-from time import time
-
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
 
-from topology.persistence import DynamicPersistence
-from topology.data import circle_2D
+from topology.benchmark import benchmark_grid
+from topology.benchmark import run_benchmark
 
 
 if __name__ == '__main__':
@@ -14,24 +12,21 @@ if __name__ == '__main__':
     num_powers = end_power - begin_power + 1
     n_points = np.logspace(begin_power, end_power, num=num_powers, base=2.0)
 
+    cases = benchmark_grid(shapes=('circle',),
+                           n_points=n_points.astype(int))
+    results = run_benchmark(cases, repeats=3, verbose=True)
+
     run_times = []
     samples = []
-    for pts in n_points:
-        X = circle_2D(n_samples=pts, noise=0.2)
-
-        print "=" * 40
-        print "Number of samples:", pts
-
-        start = time()
-        dp = DynamicPersistence(X)
-        dp.run()
-        end = time()
-        duration = end - start
-
-        run_times.append(duration)
-        samples.append(pts)
+    for result in results['cases']:
+        if 'error' in result:
+            # Already reported by run_benchmark(verbose=True).
+            continue
+        run_times.append(result['wall']['run']['median'])
+        samples.append(result['points'])
 
-        print "=" * 40
+    if len(run_times) < 2:
+        raise SystemExit('Too few cases ran to fit a slope')
 
     log2_rt = np.log2(np.array(run_times))
     log2_s = np.log2(np.array(samples))
@@ -42,8 +37,8 @@ if __name__ == '__main__':
 
     plt.plot(log2_s, log2_rt, label='Slope: {}'.format(slope))
     plt.scatter(log2_s, log2_rt)
-    plt.xlabel('$\log_{2}$ Number of Samples')
-    plt.ylabel('$\log_{2}$ Run time (s)')
+    plt.xlabel(r'$\log_{2}$ Number of Samples')
+    plt.ylabel(r'$\log_{2}$ Run time (s)')
     plt.title('Runtime Efficiency (log-log plot)')
     plt.legend(loc='lower right')
     plt.savefig('images/runtime_efficiency.png')
@@ -0,0 +1,181 @@
+''' Alpha complexes of low-dimensional point clouds.
+
+    The alpha complex is the subcomplex of the Delaunay triangulation whose
+    simplices are filtered by the squared radius at which the union of
+    balls around the points first covers them.  It has the homotopy type
+    of that union (and so the persistence of the Cech filtration) with
+    O(n) simplices in the plane and 3-space, where a Rips complex of the
+    same scale has O(n^{d+1}).
+
+    Values are squared radii: a simplex whose smallest circumsphere holds
+    no other vertex of its cofaces (it is Gabriel) enters at its squared
+    circumradius; otherwise it is attached to a coface whose opposite
+    vertex falls inside that sphere and enters with the first such coface.
+    The circumspheres of all simplices of a dimension are solved at once,
+    and the values are propagated from the top dimension down.
+
+    Flat clouds (collinear in the plane, coplanar in 3-space) are
+    triangulated in their affine hull.  Points left out of the
+    triangulation, duplicates in particular, join their nearest vertex by
+    an edge, so there is still one vertex per row (a duplicate is born and
+    dies at 0, as in a Rips complex).
+
+    Simplices are columnar, as in 'rips': per dimension an (m_k, k+1)
+    array of sorted vertex indices and an (m_k,) array of values.
+
+    Example:
+        >>> simplices, values = alpha_complex(X, max_dimension=2)
+        >>> radii = np.sqrt(values[1])
+
+'''
+
+import numpy as np
+from scipy.spatial import Delaunay
+from scipy.spatial import cKDTree
+
+
+def circumspheres(X, simplices):
+    ''' Centre and squared radius of the smallest sphere through the
+        vertices of each simplex (its circumsphere within its own affine
+        hull).
+        INPUT: NxD points, (m, k+1) vertex array
+        OUTPUT: (m, D) centres, (m,) squared radii
+    '''
+    P = X[simplices]
+    if simplices.shape[1] == 1:
+        return P[:, 0], np.zeros(len(simplices))
+
+    # centre = p0 + B^T y with (B B^T) y = |b_i|^2 / 2, for the rows b_i of
+    # B = p_i - p0.
+    B = P[:, 1:] - P[:, :1]
+    G = np.einsum('mid,mjd->mij', B, B)
+    rhs = np.einsum('mid,mid->mi', B, B) / 2.0
+    try:
+        y = np.linalg.solve(G, rhs[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        # Flat (degenerate) simplices: least squares is still finite.
+        y = np.einsum('mij,mj->mi', np.linalg.pinv(G), rhs)
+
+    offset = np.einsum('mi,mid->md', y, B)
+
+    return P[:, 0] + offset, np.einsum('md,md->m', offset, offset)
+
+
+def affine_coordinates(X):
+    ''' Coordinates of X in its affine hull, which preserve distances (X
+        itself when it spans its space).
+        OUTPUT: (N, rank) array
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    centred = X - X.mean(axis=0)
+    if not len(X) or not centred.any():
+        return np.zeros((len(X), 0))
+
+    _, singular, basis = np.linalg.svd(centred, full_matrices=False)
+    rank = int(np.sum(singular > singular[0] * max(X.shape) *
+                      np.finfo(np.float64).eps))
+    if rank == X.shape[1]:
+        return X
+
+    return centred @ basis[:rank].T
+
+
+def delaunay_simplices(X):
+    ''' Top-dimensional simplices of the Delaunay triangulation of X, in
+        its own dimension (flat input should go through
+        'affine_coordinates' first).  Duplicate points, and any qhull
+        leaves out, are in no simplex.
+        OUTPUT: (m, D+1) sorted vertex array
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    if X.shape[1] == 0:
+        return np.zeros((min(len(X), 1), 1), dtype=np.int64)
+    if X.shape[1] == 1:
+        order = np.argsort(X[:, 0], kind='mergesort')
+        distinct = np.r_[True, np.diff(X[order, 0]) > 0]
+        order = order[distinct]
+        return np.sort(np.c_[order[:-1], order[1:]], axis=1)
+
+    return np.sort(Delaunay(X).simplices, axis=1).astype(np.int64)
+
+
+def _attach_missing(X, simplices, values):
+    ''' Joins every point in no simplex to its nearest vertex by an edge
+        entering at the squared radius of that edge (0 for a duplicate),
+        so that the complex keeps one vertex per row of X.
+    '''
+    present = np.zeros(len(X), dtype=bool)
+    present[simplices[0].ravel()] = True
+    missing = np.flatnonzero(~present)
+    if not len(missing):
+        return
+
+    vertices = np.flatnonzero(present)
+    if X.shape[1]:
+        distance, nearest = cKDTree(X[vertices]).query(X[missing])
+    else:
+        distance = np.zeros(len(missing))
+        nearest = np.zeros(len(missing), dtype=np.int64)
+    simplices[0] = np.arange(len(X), dtype=np.int64)[:, np.newaxis]
+    values[0] = np.zeros(len(X))
+    if len(simplices) > 1:
+        edges = np.sort(np.c_[missing, vertices[nearest]], axis=1)
+        simplices[1] = np.r_[simplices[1], edges]
+        values[1] = np.r_[values[1], distance ** 2 / 4.0]
+
+
+def alpha_complex(X, max_dimension=None):
+    ''' Alpha complex of X (1 to 3 dimensional points), with squared radius
+        filtration values.  Flat clouds (e.g. collinear points in the
+        plane) are triangulated in their affine hull, and the dimensions
+        above it are left empty.
+        INPUT: NxD numpy array, highest dimension kept (D when None)
+        OUTPUT: list of vertex arrays and list of value arrays, by dimension
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2 or not 1 <= X.shape[1] <= 3:
+        raise ValueError('Alpha complexes are for 1 to 3 dimensional '
+                         'points, got shape {}'.format(X.shape))
+    if not len(X):
+        raise ValueError('Need at least one point')
+
+    top = X.shape[1] if max_dimension is None else max_dimension
+    Y = affine_coordinates(X)
+    d = Y.shape[1]
+
+    simplices = [None] * (d + 1)
+    values = [None] * (d + 1)
+    simplices[d] = delaunay_simplices(Y)
+    values[d] = circumspheres(Y, simplices[d])[1]
+
+    for k in range(d - 1, -1, -1):
+        cofaces = simplices[k + 1]
+
+        # Facet c of each coface drops vertex c.
+        facets = np.concatenate([np.delete(cofaces, c, axis=1)
+                                 for c in range(k + 2)])
+        opposite = cofaces.T.ravel()
+        coface_values = np.tile(values[k + 1], k + 2)
+
+        S, inverse = np.unique(facets, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        centre, radius = circumspheres(Y, S)
+
+        # Attached: the coface's other vertex is inside the circumsphere.
+        gap = Y[opposite] - centre[inverse]
+        inside = np.einsum('md,md->m', gap, gap) < radius[inverse] * \
+                 (1 - 1e-12)
+
+        attached = np.full(len(S), np.inf)
+        np.minimum.at(attached, inverse[inside], coface_values[inside])
+
+        simplices[k] = S
+        values[k] = np.where(np.isfinite(attached), attached, radius)
+
+    for k in range(d + 1, max(top, 1) + 1):
+        simplices.append(np.empty((0, k + 1), dtype=np.int64))
+        values.append(np.empty(0))
+
+    _attach_missing(Y, simplices, values)
+
+    return simplices[:top + 1], values[:top + 1]
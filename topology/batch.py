@@ -0,0 +1,272 @@
+''' Persistence over many point clouds on a process pool.
+
+    Each worker runs the whole distances -> Rips -> filtration -> pairing
+    pipeline of 'DynamicPersistence' on its clouds and sends back only the
+    'PersistenceDiagram' arrays; the Dionysus objects never leave the worker.
+    Clouds are submitted in chunks with a bounded number in flight, so the
+    input can be a lazy iterable, and results come back in input order.
+
+    A timeout applies to each cloud from when its run starts: the worker
+    arms a timer (SIGALRM) around every cloud, so only the cloud that ran
+    over fails and the rest of its chunk still runs.  Workers report each
+    cloud as it starts and finishes; if one is stuck in code the timer
+    cannot interrupt, the parent fails that cloud once it is TIMEOUT_GRACE
+    seconds past its deadline and restarts the pool for the clouds left.
+    A worker that dies (e.g. killed out of memory) fails its cloud, with
+    or without a timeout, and the rest of its chunk is sent again.
+
+    Example:
+        >>> diagrams = batch_persistence(clouds, n_jobs=8, chunksize=16,
+        ...                              timeout=30, engine='numpy')
+        >>> failed = [d for d in diagrams if isinstance(d, BatchFailure)]
+
+'''
+
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+import numpy as np
+
+from .diagram import PersistenceDiagram
+
+
+# Seconds past a cloud's deadline before the parent gives up on its worker.
+TIMEOUT_GRACE = 2.0
+
+
+class BatchFailure(object):
+    ''' Stands in for the diagram of a cloud whose run raised or timed out.
+    '''
+
+    def __init__(self, index, error):
+        self.index = index
+        self.error = error
+
+    def __repr__(self):
+        return '<BatchFailure {}: {}>'.format(self.index, self.error)
+
+
+class _CloudTimeout(BaseException):
+    # Not an Exception, so the pipeline cannot swallow it.
+    pass
+
+
+def _alarm(signum, frame):
+    raise _CloudTimeout()
+
+
+def _can_alarm():
+    return hasattr(signal, 'setitimer') and \
+           threading.current_thread() is threading.main_thread()
+
+
+def _cloud_diagram(X, min_persistence, kwargs):
+    # Imported here so the module loads without Dionysus in the parent.
+    from .persistence import DynamicPersistence
+
+    dp = DynamicPersistence(np.asarray(X), **kwargs)
+    dp.run()
+
+    # The run's own diagram, which is also there on a cache hit or when
+    # it was paired by component.
+    diagram = dp.diagram.filter(min_persistence)
+    if not kwargs.get('chains'):
+        diagram = PersistenceDiagram.from_dict(diagram.to_dict(cycles=False))
+
+    return diagram
+
+
+def _timed_diagram(index, X, min_persistence, kwargs, timeout):
+    ''' The diagram of one cloud, or a BatchFailure if it raised or ran
+        longer than 'timeout' seconds (where a timer can be armed).
+    '''
+    armed = timeout is not None and _can_alarm()
+    if armed:
+        previous = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return _cloud_diagram(X, min_persistence, kwargs)
+    except _CloudTimeout:
+        return BatchFailure(index, 'timed out')
+    except Exception as e:
+        return BatchFailure(index, '{}: {}'.format(type(e).__name__, e))
+    finally:
+        if armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+_worker_events = None
+
+
+def _init_worker(events):
+    global _worker_events
+    _worker_events = events
+
+
+def _run_chunk(start, clouds, min_persistence, kwargs, timeout):
+    ''' Runs a chunk in a worker, reporting ('start', index, (time, pid))
+        and ('done', index, diagram) for every cloud.
+    '''
+    for offset, X in enumerate(clouds):
+        _worker_events.put(('start', start + offset,
+                            (time.time(), os.getpid())))
+        result = _timed_diagram(start + offset, X, min_persistence, kwargs,
+                                timeout)
+        _worker_events.put(('done', start + offset, result))
+
+
+def _chunks(clouds, chunksize):
+    iterator = iter(clouds)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+class _Workers(object):
+    ''' A pool and the queue its workers report on; restarted when a
+        worker hangs.  The queue lives in a manager process, so a worker
+        killed while reporting cannot leave it locked for the others.
+    '''
+
+    def __init__(self, n_jobs, min_persistence, kwargs, timeout):
+        self.n_jobs = n_jobs
+        self.options = (min_persistence, kwargs, timeout)
+        self.manager = multiprocessing.Manager()
+        self.pool = None
+        self.start()
+
+    def start(self):
+        self.events = self.manager.Queue()
+        self.pool = multiprocessing.Pool(self.n_jobs,
+                                         initializer=_init_worker,
+                                         initargs=(self.events,))
+
+    def stop(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def close(self):
+        self.stop()
+        self.manager.shutdown()
+
+    def submit(self, start, clouds):
+        events = self.events
+
+        def failed(e, start=start, size=len(clouds)):
+            message = '{}: {}'.format(type(e).__name__, e)
+            for index in range(start, start + size):
+                events.put(('failed', index, message))
+
+        self.pool.apply_async(_run_chunk, (start, clouds) + self.options,
+                              error_callback=failed)
+
+
+def batch_persistence(clouds, n_jobs=None, chunksize=8, timeout=None,
+                      min_persistence=0.0, **kwargs):
+    ''' Computes the persistence diagram of every cloud.
+        INPUT: iterable of NxD numpy arrays, number of worker processes
+               (all cores when None, in-process when 1), clouds per task,
+               seconds allowed per cloud from its start, pairs to drop (see
+               PersistenceDiagram.filter), DynamicPersistence keyword
+               arguments
+        OUTPUT: list of PersistenceDiagram, in input order; clouds that
+                raised or timed out get a BatchFailure instead
+
+        Chains are never sent back, so they are not tracked unless asked
+        for (chains=True).  In-process (n_jobs=1) the timeout needs the
+        main thread of a platform with SIGALRM, and is ignored otherwise.
+    '''
+    kwargs.setdefault('chains', False)
+
+    if n_jobs == 1:
+        return [_timed_diagram(start + offset, X, min_persistence, kwargs,
+                               timeout)
+                for start, chunk in _chunks(clouds, chunksize)
+                for offset, X in enumerate(chunk)]
+
+    n_jobs = n_jobs or multiprocessing.cpu_count()
+    workers = _Workers(n_jobs, min_persistence, kwargs, timeout)
+    chunks = _chunks(clouds, chunksize)
+    pending = {}
+    started = {}
+    results = {}
+    exhausted = False
+
+    try:
+        while True:
+            # Keep a couple of chunks queued per worker, no more.
+            while not exhausted and len(pending) < 2 * n_jobs:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending[chunk[0]] = chunk[1]
+                workers.submit(*chunk)
+
+            if not pending:
+                break
+
+            try:
+                kind, index, value = workers.events.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            else:
+                if kind == 'start':
+                    started[index] = value
+                elif index not in results:
+                    results[index] = value if kind == 'done' else \
+                                     BatchFailure(index, value)
+                    started.pop(index, None)
+
+            for start in [s for s, c in pending.items()
+                          if all(s + i in results for i in range(len(c)))]:
+                del pending[start]
+
+            # A dead worker's task is lost: fail its cloud and send the
+            # rest of its chunk again.
+            alive = set(p.pid for p in multiprocessing.active_children()) \
+                    if started else set()
+            for index in [i for i, (_, pid) in started.items()
+                          if pid not in alive]:
+                results[index] = BatchFailure(index, 'worker exited')
+                del started[index]
+                for start, chunk in pending.items():
+                    if start <= index < start + len(chunk):
+                        for offset, X in enumerate(chunk):
+                            if start + offset not in results:
+                                workers.submit(start + offset, [X])
+
+            if timeout is None:
+                continue
+            deadline = time.time() - timeout - TIMEOUT_GRACE
+            hung = [i for i, (t, _) in started.items() if t < deadline]
+            if hung:
+                for index in hung:
+                    results[index] = BatchFailure(index, 'timed out')
+                started.clear()
+
+                # The stuck worker cannot be freed; rerun the clouds that
+                # had not finished on a fresh pool.
+                workers.restart()
+                for start, chunk in pending.items():
+                    for offset, X in enumerate(chunk):
+                        if start + offset not in results:
+                            workers.submit(start + offset, [X])
+    finally:
+        workers.close()
+
+    return [results[i] for i in range(len(results))]
@@ -0,0 +1,268 @@
+''' Reproducible timing of the persistence pipeline.
+
+    A benchmark is a grid of cases: shapes from 'topology.data' (plus
+    MNIST-like pixel clouds) at several sizes, crossed with max_dimension,
+    skeleton, metric and engine.  Every case generates its cloud from a
+    fixed seed and, in a fresh worker process, does a few warm-up runs and
+    then times repeated runs with 'profiling' switched on.  It reports the
+    median, min and max wall time of every stage, the CPU time, the growth
+    of the peak resident memory, and the simplex and pair counts.
+
+    'run_benchmark' returns a JSON-ready dict; 'compare' checks it against
+    a stored baseline and lists the cases and stages that got slower by
+    more than a tolerance (and any case whose counts changed, which means
+    the output changed, not just the speed).
+
+    Example:
+        >>> results = run_benchmark(benchmark_grid(shapes=('circle', 'torus'),
+        ...                                        n_points=(64, 128, 256)))
+        >>> save_results(results, 'benchmark.json')
+        >>> for regression in compare(results, load_results('baseline.json')):
+        ...     print(regression)
+
+'''
+
+import itertools
+import json
+import multiprocessing
+import platform
+import sys
+import time
+
+import numpy as np
+
+from . import data
+from .profiling import peak_rss
+from .utils import check_random_state
+from .utils import pixel_to_xy
+
+
+def _circle(n, rng):
+    return data.circle_2D(n_samples=n, noise=0.2, random_state=rng)
+
+
+def _torus(n, rng):
+    return data.torus(n_samples=n, random_state=rng)
+
+
+def _coffee_mug(n, rng):
+    return data.coffee_mug(n_samples=n, random_state=rng)[0]
+
+
+def _pail(n, rng):
+    return data.pail(n_samples=n, random_state=rng)[0]
+
+
+def _pixels(n, rng):
+    ''' A hand-drawn looking '0': a jittered ring two pixels thick on a
+        square image sized so that about n pixels are lit, as the pixel
+        cloud 'pixel_to_xy' makes of an MNIST digit.
+    '''
+    radius = max(n / (4 * np.pi), 2.0)
+    side = int(np.ceil(2 * radius)) + 6
+
+    y, x = np.mgrid[:side, :side] - (side - 1) / 2.0
+    squash = 1.0 + rng.uniform(-0.2, 0.2)
+    r = np.hypot(x * squash, y / squash)
+    r += rng.normal(0, 0.3, r.shape)
+
+    return pixel_to_xy(np.abs(r - radius) < 1.0)
+
+
+SHAPES = {'circle': _circle,
+          'torus': _torus,
+          'coffee_mug': _coffee_mug,
+          'pail': _pail,
+          'pixels': _pixels}
+
+
+def case_key(case):
+    ''' Stable name of a case, used to match it against a baseline. '''
+    return ','.join('{}={}'.format(name, case[name]) for name in sorted(case))
+
+
+def benchmark_grid(shapes=('circle',), n_points=(16, 32, 64, 128, 256),
+                   max_dimension=(2,), skeleton=(1.7,), metric=('euclidean',),
+                   engine=('numpy',)):
+    ''' Every combination of the given values, as a list of case dicts. '''
+    names = ('shape', 'n_points', 'max_dimension', 'skeleton', 'metric',
+             'engine')
+    unknown = set(shapes) - set(SHAPES)
+    if unknown:
+        raise ValueError('Unknown shapes {}; choose from {}'
+                         .format(sorted(unknown), sorted(SHAPES)))
+
+    return [dict(zip(names, values))
+            for values in itertools.product(shapes, n_points, max_dimension,
+                                            skeleton, metric, engine)]
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=np.float64)
+
+    return {'median': float(np.median(values)),
+            'min': float(values.min()),
+            'max': float(values.max())}
+
+
+def run_case(case, repeats=5, warmup=1, random_state=0):
+    ''' Times one case in this process.
+        OUTPUT: dict with the case, the actual number of points, per-stage
+                wall time summaries, total CPU time, peak RSS growth in
+                bytes and the counts reported by the stages
+    '''
+    # Imported here so that importing this module does not need Dionysus.
+    from .persistence import DynamicPersistence
+    from .profiling import RunStats
+
+    rng = check_random_state(random_state)
+    X = np.asarray(SHAPES[case['shape']](int(case['n_points']), rng))
+
+    options = dict(max_dimension=case['max_dimension'],
+                   skeleton=case['skeleton'], metric=case['metric'],
+                   engine=case['engine'])
+    if case['engine'] == 'numpy':
+        options['chains'] = False
+
+    rss = peak_rss()
+    walls, cpus, counts = {}, [], {}
+    for i in range(warmup + repeats):
+        stats = RunStats()
+        DynamicPersistence(X, stats=stats, **options).run()
+        if i < warmup:
+            continue
+
+        cpus.append(sum(r.cpu for r in stats if r.name == 'run'))
+        for record in stats:
+            walls.setdefault(record.name, []).append(record.wall)
+            counts.update(record.counts)
+
+    if rss is not None:
+        rss = peak_rss() - rss
+
+    return {'case': case,
+            'key': case_key(case),
+            'points': len(X),
+            'wall': dict((stage, _summary(values))
+                         for stage, values in walls.items()),
+            'cpu': _summary(cpus),
+            'peak_rss_delta': rss,
+            'counts': counts}
+
+
+def _isolated_case(args):
+    case, repeats, warmup, random_state = args
+    try:
+        return run_case(case, repeats, warmup, random_state)
+    except Exception as e:
+        return {'case': case, 'key': case_key(case),
+                'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def run_benchmark(cases, repeats=5, warmup=1, random_state=0, isolate=True,
+                  verbose=False):
+    ''' Runs every case, each in a fresh process when 'isolate' so that
+        memory high-water marks and allocator state do not leak between
+        cases.  A case that raises is recorded with its 'error'.
+        OUTPUT: dict with 'meta' (versions, platform, settings) and 'cases'
+    '''
+    jobs = [(case, repeats, warmup, random_state) for case in cases]
+
+    results = []
+    if isolate:
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            for result in pool.imap(_isolated_case, jobs):
+                results.append(result)
+                if verbose:
+                    _report(result)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for job in jobs:
+            results.append(_isolated_case(job))
+            if verbose:
+                _report(results[-1])
+
+    return {'meta': {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'python': sys.version.split()[0],
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'machine': platform.machine(),
+                     'repeats': repeats,
+                     'warmup': warmup,
+                     'random_state': random_state},
+            'cases': results}
+
+
+def _report(result):
+    if 'error' in result:
+        sys.stderr.write('{}: {}\n'.format(result['key'], result['error']))
+    else:
+        sys.stderr.write('{}: {:0.4f}s\n'.format(
+                            result['key'], result['wall']['run']['median']))
+
+
+def save_results(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+class Regression(object):
+    ''' A stage of a case that got slower than its baseline (or, for
+        stage='counts', whose output sizes changed).
+    '''
+
+    def __init__(self, key, stage, baseline, current):
+        self.key = key
+        self.stage = stage
+        self.baseline = baseline
+        self.current = current
+
+    def __repr__(self):
+        if self.stage == 'counts':
+            return '<Regression {}: counts {} -> {}>'.format(
+                        self.key, self.baseline, self.current)
+
+        return '<Regression {} {}: {:0.4f}s -> {:0.4f}s ({:+0.0%})>'.format(
+                    self.key, self.stage, self.baseline, self.current,
+                    self.current / self.baseline - 1 if self.baseline else 0)
+
+    def as_dict(self):
+        return {'key': self.key, 'stage': self.stage,
+                'baseline': self.baseline, 'current': self.current}
+
+
+def compare(results, baseline, tolerance=0.2, min_seconds=0.005):
+    ''' Regressions of 'results' against 'baseline' (both as from
+        'run_benchmark').  A stage regresses when its median wall time grew
+        by more than 'tolerance' (a fraction) and by more than
+        'min_seconds'; cases missing from either side are not compared.
+    '''
+    previous = dict((case['key'], case) for case in baseline['cases']
+                    if 'error' not in case)
+
+    regressions = []
+    for case in results['cases']:
+        before = previous.get(case['key'])
+        if before is None or 'error' in case:
+            continue
+
+        if before['counts'] != case['counts']:
+            regressions.append(Regression(case['key'], 'counts',
+                                          before['counts'], case['counts']))
+
+        for stage, wall in sorted(case['wall'].items()):
+            if stage not in before['wall']:
+                continue
+            old, new = before['wall'][stage]['median'], wall['median']
+            if new > old * (1 + tolerance) and new - old > min_seconds:
+                regressions.append(Regression(case['key'], stage, old, new))
+
+    return regressions
@@ -0,0 +1,217 @@
+''' Bootstrap and subsampling confidence sets for persistence diagrams.
+
+    Every subsample of a point cloud has, as its Rips complex, the full
+    complex restricted to its vertices, so the neighbourhood graph of the
+    whole cloud (every pair within 'skeleton') is computed once and each
+    subsample only selects its edges from it, before the clique expansion
+    and reduction.  The subsamples run on a worker pool that holds the
+    shared edges, and each worker also measures the bottleneck distance
+    from its diagram to the full one, per homology dimension.
+
+    From those distances (Fasy et al. 2014) the (1 - alpha) quantile c is
+    the radius of a bottleneck ball around the full diagram, and points
+    more than 2c from the diagonal are significant.  'landscape_band'
+    gives a simultaneous band around the mean persistence landscape of the
+    subsamples.
+
+    Bootstrap samples are drawn with replacement; repeated points only add
+    zero-persistence pairs, so each subsample runs on its distinct points.
+    Classes still alive at the skeleton are essential and ignored by the
+    distances.
+
+    Example:
+        >>> engine = SubsamplePersistence(X, max_dimension=2, skeleton=1.5,
+        ...                               n_jobs=8)
+        >>> engine.run(n_subsamples=200, random_state=0)
+        >>> engine.quantiles(alpha=0.05)
+        array([ 0.11,  0.08])
+        >>> significant = engine.significant(alpha=0.05)
+
+'''
+
+import multiprocessing
+
+import numpy as np
+
+from .components import graph_diagram
+from .diagram_distances import bottleneck
+from .rips import radius_edges
+from .utils import check_random_state
+from .vectorization import PersistenceLandscape
+
+
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _subsample_diagram(vertices):
+    ''' Diagram of the subcomplex on 'vertices' and its bottleneck distance
+        to the full diagram in each dimension.
+    '''
+    edges, lengths, n_points, max_dimension, diagram, dimensions = \
+        _worker_graph
+
+    position = np.full(n_points, -1, dtype=np.int64)
+    position[vertices] = np.arange(len(vertices))
+    local = position[edges]
+    keep = (local >= 0).all(axis=1)
+
+    sub = graph_diagram(vertices, local[keep], lengths[keep],
+                        max_dimension)
+    distances = np.array([bottleneck(diagram, sub, dimension=d)
+                          for d in dimensions])
+
+    return sub, distances
+
+
+class SubsamplePersistence(object):
+    ''' Persistence of many subsamples of X over one shared neighbourhood
+        graph.
+        INPUT: NxD numpy array (NxN for metric='precomputed'),
+               max_dimension and skeleton as for DynamicPersistence, metric,
+               optional CondensedDistances already computed for X, homology
+               dimensions to measure (all below max_dimension when None),
+               worker processes (all cores when None, in-process when 1),
+               subsamples per task
+    '''
+
+    def __init__(self, X, max_dimension=2, skeleton=1.7, metric='euclidean',
+                 distances=None, dimensions=None, n_jobs=1, chunk_size=4):
+        self.X = X
+        self.max_dimension = max_dimension
+        self.skeleton = skeleton
+        self.metric = metric
+        self.distances = distances
+        if dimensions is None:
+            dimensions = range(max_dimension)
+        self.dimensions = list(dimensions)
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+
+        self.n_points = len(X) if distances is None else distances.n_points
+        self.edges = None
+        self.lengths = None
+        self.diagram_ = None
+        self.subsets_ = None
+        self.diagrams_ = None
+        self.distances_ = None
+
+    def fit(self):
+        ''' The shared edges and the diagram of the whole cloud. '''
+        self.edges, self.lengths = radius_edges(self.X, self.skeleton,
+                                                metric=self.metric,
+                                                distances=self.distances)
+        self.edges = np.asarray(self.edges, dtype=np.int64)
+        self.diagram_ = graph_diagram(np.arange(self.n_points), self.edges,
+                                      self.lengths, self.max_dimension)
+
+        return self
+
+    def subsets(self, n_subsamples=200, size=None, replace=True,
+                random_state=None):
+        ''' Sorted distinct point indices of each subsample: bootstrap
+            samples of 'size' (N when None) drawn with replacement, or
+            subsamples without it.
+        '''
+        size = self.n_points if size is None else size
+        if not replace and size > self.n_points:
+            raise ValueError('Cannot draw {} of {} points without '
+                             'replacement'.format(size, self.n_points))
+
+        rng = check_random_state(random_state)
+
+        return [np.unique(rng.choice(self.n_points, size, replace=replace))
+                for _ in range(n_subsamples)]
+
+    def subsample_diagrams(self, subsets):
+        ''' Diagrams of the given vertex subsets, and their bottleneck
+            distances to the full diagram.
+            OUTPUT: list of PersistenceDiagram, (n_subsets, n_dimensions)
+                    array
+        '''
+        if self.diagram_ is None:
+            self.fit()
+
+        graph = (self.edges, self.lengths, self.n_points, self.max_dimension,
+                 self.diagram_, self.dimensions)
+        subsets = [np.asarray(s, dtype=np.int64) for s in subsets]
+
+        if self.n_jobs == 1:
+            _init_worker(graph)
+            results = [_subsample_diagram(s) for s in subsets]
+        else:
+            pool = multiprocessing.Pool(self.n_jobs or
+                                        multiprocessing.cpu_count(),
+                                        initializer=_init_worker,
+                                        initargs=(graph,))
+            try:
+                results = pool.map(_subsample_diagram, subsets,
+                                   chunksize=self.chunk_size)
+            finally:
+                pool.terminate()
+                pool.join()
+
+        diagrams = [diagram for diagram, _ in results]
+        distances = np.array([d for _, d in results]).reshape(
+                        len(results), len(self.dimensions))
+
+        return diagrams, distances
+
+    def run(self, n_subsamples=200, size=None, replace=True,
+            random_state=None):
+        self.subsets_ = self.subsets(n_subsamples, size, replace,
+                                     random_state)
+        self.diagrams_, self.distances_ = self.subsample_diagrams(
+                                            self.subsets_)
+
+        return self
+
+    def quantiles(self, alpha=0.05):
+        ''' (1 - alpha) quantile of the bottleneck distances, per dimension.
+        '''
+        if self.distances_ is None:
+            raise ValueError('Call run() first')
+
+        return np.quantile(self.distances_, 1 - alpha, axis=0)
+
+    def significant(self, alpha=0.05):
+        ''' The pairs of the full diagram (in the measured dimensions) more
+            than twice the quantile from the diagonal; essential classes
+            are kept.
+        '''
+        diagram = self.diagram_
+        threshold = np.full(len(diagram), np.inf)
+        for d, c in zip(self.dimensions, self.quantiles(alpha)):
+            threshold[diagram.dimension == d] = 2 * c
+
+        return diagram._select(diagram.persistence > threshold)
+
+    def landscape_band(self, dimension=1, alpha=0.05, n_layers=1,
+                       resolution=100, sample_range=None):
+        ''' Simultaneous (1 - alpha) band around the mean landscape of the
+            subsamples: the mean +- the quantile of the largest deviation of
+            a subsample's landscape from it.
+            OUTPUT: grid, mean, lower, upper; the landscape arrays are
+                    (n_layers, resolution)
+        '''
+        if self.diagrams_ is None:
+            raise ValueError('Call run() first')
+
+        landscape = PersistenceLandscape(n_layers=n_layers,
+                                         resolution=resolution,
+                                         sample_range=sample_range,
+                                         dimensions=(dimension,))
+        L = landscape.fit(self.diagrams_ + [self.diagram_]).transform(
+                self.diagrams_).reshape(-1, n_layers, resolution)
+
+        mean = L.mean(axis=0)
+        deviation = np.abs(L - mean).max(axis=(1, 2))
+        width = np.quantile(deviation, 1 - alpha)
+        low, high = landscape.ranges_[0]
+
+        return np.linspace(low, high, resolution), mean, \
+               np.maximum(mean - width, 0), mean + width
@@ -0,0 +1,183 @@
+''' Content-addressed on-disk cache of persistence diagrams.
+
+    Entries are .npz files named by a hash of the input array's bytes, shape
+    and dtype together with the parameters that determine the result
+    (max_dimension, skeleton, metric, engine, ...).  Writes go to a
+    temporary file that then replaces the entry atomically, so concurrent
+    processes only ever see complete entries; a hit refreshes the entry's
+    modification time, and once the directory grows past max_bytes the
+    least recently used entries are deleted.
+
+    Example:
+        >>> cache = PersistenceCache('~/.cache/topology', max_bytes=2**30)
+        >>> dp = DynamicPersistence(X, engine='numpy', cache=cache)
+        >>> dp.run()          # a repeat run only reads dp.diagram from disk
+        >>> cache.hits, cache.misses
+
+'''
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from .diagram import PersistenceDiagram
+
+
+SUFFIX = '.npz'
+
+
+def _describe(value):
+    ''' Stable text for a key parameter (callables by qualified name). '''
+    if callable(value) and not isinstance(value, type):
+        return '{}.{}'.format(getattr(value, '__module__', ''),
+                              getattr(value, '__name__', repr(value)))
+    if isinstance(value, type):
+        return value.__name__
+    if isinstance(value, np.dtype):
+        return value.name
+
+    return repr(value)
+
+
+class PersistenceCache(object):
+    ''' LRU-evicted directory of diagrams.  With cycles=True entries also
+        hold the representative cycles (runs then need chains=True); runs
+        that need cycles do not use a cache without them.
+    '''
+
+    def __init__(self, directory, max_bytes=2**30, cycles=False):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.cycles = cycles
+
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Another process may have just created it.
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def __repr__(self):
+        return '<PersistenceCache {} hits: {} misses: {}>'.format(
+                    self.directory, self.hits, self.misses)
+
+    def key(self, X, **params):
+        X = np.ascontiguousarray(X)
+
+        digest = hashlib.sha1()
+        digest.update(X.dtype.str.encode())
+        digest.update(repr(X.shape).encode())
+        digest.update(X.view(np.uint8).ravel().data if X.size else b'')
+
+        params['cycles'] = self.cycles
+        for name in sorted(params):
+            digest.update('{}={};'.format(name, _describe(params[name]))
+                          .encode())
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key, cycles=False):
+        ''' The cached diagram, or None (also when cycles=True and the
+            entry holds none).
+        '''
+        path = self._path(key)
+        try:
+            with np.load(path) as arrays:
+                diagram = PersistenceDiagram.from_dict(arrays)
+        except (IOError, OSError, ValueError):
+            # Missing, evicted meanwhile by another process, or unreadable.
+            self.misses += 1
+            return None
+
+        if cycles and not diagram.has_cycles:
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted since it was read; the diagram is still good.
+            pass
+
+        self.hits += 1
+        return diagram
+
+    def put(self, key, diagram):
+        ''' Stores 'diagram' under 'key'.  A cache of cycles does not take
+            a diagram without them.
+        '''
+        if self.cycles and not diagram.has_cycles:
+            return
+
+        handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                             suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                np.savez(f, **diagram.to_dict(cycles=self.cycles))
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+        self.evict()
+
+    def entries(self):
+        ''' (mtime, size, path) of every entry, least recently used first. '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        ''' Deletes least recently used entries until under max_bytes. '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = self.entries()
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
@@ -0,0 +1,172 @@
+''' Persistence by connected components of the neighbourhood graph.
+
+    No simplex of a Rips (or witness) complex spans two components of its
+    neighbourhood graph at the skeleton radius, so the filtration is the
+    disjoint union of the filtrations of the components, and its pairing
+    is the union of theirs.  The components are found with a union-find
+    over the sparse edges (scipy's connected_components), each component's
+    clique expansion, sort and reduction runs on a worker pool, and the
+    diagrams are concatenated.  Components never merge below the skeleton,
+    so each keeps its own essential H0 class, exactly as in the monolithic
+    run; isolated vertices are only that class and skip the pool.
+
+    Vertices in the merged diagram's cycles are the graph's; birth_index
+    and death_index are left at -1, as there is no global filtration.
+
+    Example:
+        >>> labels = graph_components(graph)
+        >>> diagram = component_persistence(graph, labels, max_dimension=2,
+        ...                                 chains=False, n_jobs=8)
+
+'''
+
+import multiprocessing
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from .diagram import FIELDS
+from .diagram import PersistenceDiagram
+from .filtration import SimplexFiltration
+from .reduction import MatrixPersistence
+from .rips import NeighborhoodGraph
+from .rips import expand_cliques
+
+
+def graph_components(graph):
+    ''' Component label of every vertex of a NeighborhoodGraph. '''
+    n = graph.n_vertices
+    adjacency = sparse.coo_matrix((np.ones(len(graph.edges), dtype=bool),
+                                   (graph.edges[:, 0], graph.edges[:, 1])),
+                                  shape=(n, n))
+    _, labels = connected_components(adjacency, directed=False)
+
+    return labels
+
+
+def merge_diagrams(diagrams):
+    ''' Concatenation of diagrams (cycles are kept if all have them). '''
+    diagrams = list(diagrams)
+    columns = [np.concatenate([getattr(d, name) for d in diagrams])
+               for name in FIELDS]
+    if not diagrams or not all(d.has_cycles for d in diagrams):
+        return PersistenceDiagram(*columns)
+
+    width = max(d.cycle_simplices.shape[1] for d in diagrams)
+    counts = np.concatenate([np.diff(d.cycle_ptr) for d in diagrams])
+    cycle_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=cycle_ptr[1:])
+
+    simplices = np.full((cycle_ptr[-1], width), -1, dtype=np.int64)
+    start = 0
+    for d in diagrams:
+        rows = d.cycle_simplices
+        simplices[start:start + len(rows), :rows.shape[1]] = rows
+        start += len(rows)
+
+    return PersistenceDiagram(*columns + [
+                cycle_ptr, simplices,
+                np.concatenate([d.cycle_values for d in diagrams])])
+
+
+def graph_diagram(vertices, edges, lengths, max_dimension, chains=False):
+    ''' Diagram of the flag complex on a subset of a graph's vertices.
+        INPUT: the vertices (graph numbering), their edges relabelled to
+               positions in 'vertices', edge lengths, max_dimension,
+               whether to keep cycles
+        OUTPUT: PersistenceDiagram, cycles in the graph's numbering and
+                no filtration indices
+    '''
+    graph = NeighborhoodGraph(len(vertices), edges, lengths)
+    simplices, values = expand_cliques(graph, max_dimension)
+    filtration = SimplexFiltration(simplices, values)
+    filtration.sort()
+
+    persistence = MatrixPersistence(filtration, chains=chains)
+    persistence.pair_simplices()
+
+    diagram = PersistenceDiagram._from_matrix(persistence, filtration, 0.0,
+                                              max_dimension, chains)
+    diagram.birth_index[:] = -1
+    diagram.death_index[:] = -1
+    if chains:
+        local = diagram.cycle_simplices
+        diagram.cycle_simplices = np.where(local >= 0,
+                                           vertices[np.maximum(local, 0)],
+                                           -1)
+
+    return diagram
+
+
+def _component_diagram(args):
+    return graph_diagram(*args)
+
+
+def _component_tasks(graph, labels, max_dimension, chains):
+    ''' One task per component with an edge, largest first, with the edges
+        relabelled to the component's vertices.
+    '''
+    order = np.argsort(labels, kind='mergesort')
+    vertex_ptr = np.zeros(labels.max() + 2, dtype=np.int64)
+    np.cumsum(np.bincount(labels), out=vertex_ptr[1:])
+
+    edge_labels = labels[graph.edges[:, 0]]
+    edge_order = np.argsort(edge_labels, kind='mergesort')
+    edge_ptr = np.zeros(labels.max() + 2, dtype=np.int64)
+    np.cumsum(np.bincount(edge_labels, minlength=labels.max() + 1),
+              out=edge_ptr[1:])
+
+    sizes = np.diff(edge_ptr)
+    tasks = []
+    for c in np.argsort(-sizes, kind='mergesort'):
+        if not sizes[c]:
+            break
+        vertices = order[vertex_ptr[c]:vertex_ptr[c + 1]]
+        rows = edge_order[edge_ptr[c]:edge_ptr[c + 1]]
+        edges = np.searchsorted(vertices, graph.edges[rows])
+        tasks.append((vertices, edges, graph.lengths[rows], max_dimension,
+                      chains))
+
+    return tasks
+
+
+def _isolated_diagram(vertices, max_dimension, chains):
+    ''' The essential H0 classes of isolated vertices (born at 0). '''
+    n = len(vertices) if max_dimension > 0 else 0
+    columns = [np.zeros(n), np.full(n, np.inf), np.zeros(n, dtype=np.int64),
+               np.full(n, -1), np.full(n, -1)]
+    if not chains:
+        return PersistenceDiagram(*columns)
+
+    return PersistenceDiagram(*columns + [
+                np.zeros(n + 1, dtype=np.int64),
+                np.empty((0, max_dimension + 1), dtype=np.int64),
+                np.empty(0)])
+
+
+def component_persistence(graph, labels, max_dimension=2, chains=True,
+                          n_jobs=None):
+    ''' Diagram of the flag complex of 'graph', component by component.
+        INPUT: NeighborhoodGraph, component labels (as from
+               'graph_components'), max_dimension, whether to keep cycles,
+               worker processes (all cores when None, in-process when 1)
+        OUTPUT: PersistenceDiagram
+    '''
+    tasks = _component_tasks(graph, labels, max_dimension, chains)
+    isolated = np.flatnonzero(np.bincount(labels)[labels] == 1)
+
+    if n_jobs == 1 or len(tasks) < 2:
+        diagrams = [_component_diagram(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(n_jobs or multiprocessing.cpu_count(),
+                                        len(tasks)))
+        try:
+            diagrams = pool.map(_component_diagram, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    diagrams.append(_isolated_diagram(isolated, max_dimension, chains))
+
+    return merge_diagrams(diagrams)
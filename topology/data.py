@@ -10,185 +10,187 @@
     * Coffee Mug
     * Bucket with handle
 
+    Every generator draws the requested number of points directly with
+    whole-array numpy operations, takes a 'random_state' (None, an int seed
+    or a numpy.random.Generator) for reproducible samples, and accepts
+    'n_clouds' to build a stack of independent clouds in one call, e.g.
+
+        >>> X = torus(n_samples=1000, n_clouds=32, random_state=0)
+        >>> X.shape
+        (32, 1000, 3)
+
     TODO: Add 'real-world' topological data sets.
 
 '''
 
 import numpy as np
 
+from .utils import check_random_state
+
+
+def _sample_shape(n_samples, n_clouds):
+    if n_clouds is None:
+        return (int(n_samples),)
 
-def circle_2D(radius=1.0, center=(0.0,0.0), n_samples=100., noise=0.01):
-    pi = np.pi
-    angle = np.linspace(0, 2 * pi, n_samples)
-    r = radius + np.random.normal(0, noise, angle.shape)
+    return (int(n_clouds), int(n_samples))
+
+
+def _circle_2D(rng, shape, radius, center, noise):
+    angle = np.linspace(0, 2 * np.pi, shape[-1])
+    r = radius + rng.normal(0, noise, shape)
 
     x = r * np.cos(angle) + center[0]
     y = r * np.sin(angle) + center[1]
 
-    X = np.c_[x, y]
-    
-    return X
+    return np.stack([x, y], axis=-1)
 
 
-def disk_2D(radius=1.0, center=(0.0,0.0), n_samples=100., noise=0.01):
-    X = np.array([]).reshape(0,2)
+def _disk_2D(rng, shape, radius, center):
+    # Inverse transform sampling of the radius gives points uniform in area.
+    r = radius * np.sqrt(rng.uniform(0, 1, shape))
+    angle = rng.uniform(0, 2 * np.pi, shape)
 
-    count = 0
-    while count < n_samples:
-        x = np.random.uniform(-radius, radius)
-        y = np.random.uniform(-radius, radius)
+    x = r * np.cos(angle) + center[0]
+    y = r * np.sin(angle) + center[1]
 
-        if x**2 + y**2 <= radius:
-            sample = np.c_[x, y]
-            X = np.append(X, sample, axis=0)
-            count += 1
+    return np.stack([x, y], axis=-1)
 
-    return X
 
+def _cylinder(rng, shape, radius, height, center, noise):
+    z = rng.uniform(-height/2.0, height/2.0, shape)
+    angle = rng.uniform(0, 2 * np.pi, shape)
+    r = radius + rng.normal(0, noise, shape)
 
-def cylinder(radius=1.0, height=1.0, center=(0.0,0.0,0.0), n_samples=100,
-             noise=0.01):
-    z = np.random.uniform(-height/2.0, height/2.0, n_samples) 
+    x = r * np.cos(angle) + center[0]
+    y = r * np.sin(angle) + center[1]
 
-    cylinder = np.array([]).reshape(0,3)
+    return np.stack([x, y, z + center[2]], axis=-1)
 
-    for ring_height in z:
-        ring = circle_2D(radius=radius, center=center[:2], n_samples=n_samples,
-                         noise=noise)
 
-        ring_z = np.array([ring_height] * len(ring))
-        ring_3D = np.c_[ring, ring_z]
+def _torus(rng, shape, radius, thickness, start_angle, end_angle, center,
+           noise):
+    # Position along the tube and around the (noisy) cross-section ring.
+    theta = rng.uniform(start_angle, end_angle, shape)
+    phi = rng.uniform(0, 2 * np.pi, shape)
+    r = thickness + rng.normal(0, noise, shape)
 
-        cylinder = np.append(cylinder, ring_3D, axis=0)
+    # Cross-section ring shifted over to 'radius', then rotated about the
+    # x-axis to its place along the torus.
+    ring_y = r * np.sin(phi) + radius
 
-    # Thin to proper number of samples.
-    # NOTE: Not necessarily uniformly distributed area-wise...
-    keep_indices = np.random.choice(cylinder.shape[0],
-                                      n_samples,
-                                      replace=False)
-    cylinder = cylinder[keep_indices]
+    x = r * np.cos(phi) + center[0]
+    y = np.cos(theta) * ring_y + center[1]
+    z = np.sin(theta) * ring_y + center[2]
 
-    return cylinder
+    return np.stack([x, y, z], axis=-1)
 
 
-def torus(radius=1.0, thickness=0.1, start_angle=0.0, end_angle=2*np.pi,
-          center=(0.0,0.0,0.0), n_samples=100, noise=0.01):
+def _bottom_3D(rng, shape, radius, height, center):
+    bottom = _disk_2D(rng, shape, radius, center[:2])
+    bottom_z = np.full(shape + (1,), center[2] - height/2.0)
 
-    theta = np.linspace(start_angle, end_angle, n_samples)
-    torus = np.array([]).reshape(0,3)
+    return np.concatenate([bottom, bottom_z], axis=-1)
 
-    for angle in theta:
-        # Create a noisy circle
-        ring = circle_2D(radius=thickness, center=(0.0,0.0),
-                         n_samples=n_samples, noise=noise)
-        ring_z = np.zeros(len(ring))
-        ring_3D = np.c_[ring, ring_z]
 
-        # Shift the circle over to the 'radius'
-        offset = np.array([[0.0, radius, 0.0]])
-        ring_3D += offset
+def _choose_parts(rng, shape, part_sizes):
+    ''' Assigns each of the requested samples to a part (bottom, side,
+        handle), as if 'shape[-1]' points were thinned without replacement
+        from a pool holding 'part_sizes' points of each part.
+    '''
+    pool = np.repeat(np.arange(len(part_sizes)), part_sizes)
+    keys = rng.random(shape[:-1] + (len(pool),))
 
-        # Rotate the circle along the torus to the proper location
-        rotation_matrix = np.array([[1,             0,              0],
-                                    [0, np.cos(angle), -np.sin(angle)],
-                                    [0, np.sin(angle),  np.cos(angle)]])
-        ring_3D = rotation_matrix.dot(ring_3D.T)
-        ring_3D = ring_3D.T
+    return pool[np.argsort(keys, axis=-1)[..., :shape[-1]]]
 
-        # Add to torus
-        torus = np.append(torus, ring_3D, axis=0)
 
-    torus += np.array(center).reshape(-1, 3)
+def _assemble(parts, which, part_labels):
+    ''' Picks, per sample, the point of the part it was assigned to. '''
+    points = np.choose(which[..., np.newaxis], parts)
+    labels = np.asarray(part_labels)[which]
+
+    return points, labels
 
-    # Thin to proper number of samples.
-    # NOTE: Not necessarily uniformly distributed area-wise...
-    keep_indices = np.random.choice(torus.shape[0],
-                                    n_samples,
-                                    replace=False)
-    torus = torus[keep_indices]
 
-    return torus
+def circle_2D(radius=1.0, center=(0.0,0.0), n_samples=100, noise=0.01,
+              n_clouds=None, random_state=None):
+    rng = check_random_state(random_state)
+    shape = _sample_shape(n_samples, n_clouds)
+
+    return _circle_2D(rng, shape, radius, center, noise)
+
+
+def disk_2D(radius=1.0, center=(0.0,0.0), n_samples=100, noise=0.01,
+            n_clouds=None, random_state=None):
+    rng = check_random_state(random_state)
+    shape = _sample_shape(n_samples, n_clouds)
+
+    return _disk_2D(rng, shape, radius, center)
+
+
+def cylinder(radius=1.0, height=1.0, center=(0.0,0.0,0.0), n_samples=100,
+             noise=0.01, n_clouds=None, random_state=None):
+    rng = check_random_state(random_state)
+    shape = _sample_shape(n_samples, n_clouds)
+
+    return _cylinder(rng, shape, radius, height, center, noise)
+
+
+def torus(radius=1.0, thickness=0.1, start_angle=0.0, end_angle=2*np.pi,
+          center=(0.0,0.0,0.0), n_samples=100, noise=0.01, n_clouds=None,
+          random_state=None):
+    rng = check_random_state(random_state)
+    shape = _sample_shape(n_samples, n_clouds)
+
+    return _torus(rng, shape, radius, thickness, start_angle, end_angle,
+                  center, noise)
 
 
 def coffee_mug(radius=1.0, height=1.0, center=(0.0,0.0,0.0), n_samples=100,
-               noise=0.01, bottom_label=0, side_label=0, handle_label=1):
-    bottom_label = bottom_label
-    side_label = side_label
-    handle_label = handle_label
-
-    bottom = disk_2D(radius=radius, center=center[:2],
-                     n_samples=n_samples//3,
-                     noise=noise)
-    bottom_z = np.array([-height/2.0] * len(bottom))
-    bottom_3D = np.c_[bottom, bottom_z]
-    labels = np.array([bottom_label] * len(bottom_3D))
-
-    side = cylinder(radius=radius, height=height, center=center,
-                    n_samples=n_samples, noise=noise)
-
-    mug = np.append(bottom_3D, side, axis=0)
-    labels = np.append(labels, np.array([side_label] * len(side)), axis=0)
-
-    handle = torus(radius=height/4.0,
-                   thickness=height/16.0,
-                   start_angle=-np.pi/2.0,
-                   end_angle=np.pi/2.0,
-                   center=(0.0,radius,0.0),
-                   n_samples=n_samples//3,
-                   noise=noise)
-
-    mug = np.append(mug, handle, axis=0)
-    labels = np.append(labels, np.array([handle_label] * len(handle)), axis=0)
-
-    # Thin to proper number of samples.
+               noise=0.01, bottom_label=0, side_label=0, handle_label=1,
+               n_clouds=None, random_state=None):
+    rng = check_random_state(random_state)
+    shape = _sample_shape(n_samples, n_clouds)
+    n = shape[-1]
+
+    bottom = _bottom_3D(rng, shape, radius, height, center)
+    side = _cylinder(rng, shape, radius, height, center, noise)
+    handle = _torus(rng, shape,
+                    radius=height/4.0,
+                    thickness=height/16.0,
+                    start_angle=-np.pi/2.0,
+                    end_angle=np.pi/2.0,
+                    center=(center[0],center[1]+radius,center[2]),
+                    noise=noise)
+
     # NOTE: Not necessarily uniformly distributed area-wise...
-    keep_indices = np.random.choice(mug.shape[0],
-                                    n_samples,
-                                    replace=False)
-    mug = mug[keep_indices]
-    labels = labels[keep_indices]
+    which = _choose_parts(rng, shape, [n//3, n, n//3])
+
+    return _assemble([bottom, side, handle], which,
+                     [bottom_label, side_label, handle_label])
 
-    return mug, labels
 
 def pail(radius=1.0, height=1.0, center=(0.0,0.0,0.0), n_samples=100,
-         noise=0.01, bottom_label=0, side_label=0, handle_label=1):
-    bottom_label = bottom_label
-    side_label = side_label
-    handle_label = handle_label
-
-    bottom = disk_2D(radius=radius, center=center[:2],
-                     n_samples=n_samples//3,
-                     noise=noise)
-    bottom_z = np.array([-height/2.0] * len(bottom))
-    bottom_3D = np.c_[bottom, bottom_z]
-    labels = np.array([bottom_label] * len(bottom_3D))
-
-    side = cylinder(radius=radius, height=height, center=center,
-                    n_samples=n_samples, noise=noise)
-
-    pail = np.append(bottom_3D, side, axis=0)
-    labels = np.append(labels, np.array([side_label] * len(side)), axis=0)
-
-    handle = torus(radius=1.5*radius,
-                   thickness=height/16.0,
-                   start_angle=-np.pi/3.0,
-                   end_angle=4*np.pi/3.0,
-                   center=(0.0,0.0,height/2.0),
-                   n_samples=n_samples//3,
-                   noise=noise)
-
-    pail = np.append(pail, handle, axis=0)
-    labels = np.append(labels, np.array([handle_label] * len(handle)), axis=0)
-
-    # Thin to proper number of samples.
+         noise=0.01, bottom_label=0, side_label=0, handle_label=1,
+         n_clouds=None, random_state=None):
+    rng = check_random_state(random_state)
+    shape = _sample_shape(n_samples, n_clouds)
+    n = shape[-1]
+
+    bottom = _bottom_3D(rng, shape, radius, height, center)
+    side = _cylinder(rng, shape, radius, height, center, noise)
+    handle = _torus(rng, shape,
+                    radius=1.5*radius,
+                    thickness=height/16.0,
+                    start_angle=-np.pi/3.0,
+                    end_angle=4*np.pi/3.0,
+                    center=(center[0],center[1],center[2]+height/2.0),
+                    noise=noise)
+
     # NOTE: Not necessarily uniformly distributed area-wise...
-    keep_indices = np.random.choice(pail.shape[0],
-                                    n_samples,
-                                    replace=False)
-    pail = pail[keep_indices]
-    labels = labels[keep_indices]
+    which = _choose_parts(rng, shape, [n//3, n, n//3])
 
-    return pail, labels
+    return _assemble([bottom, side, handle], which,
+                     [bottom_label, side_label, handle_label])
 
 if __name__ == '__main__':
 
@@ -0,0 +1,321 @@
+''' Columnar persistence diagrams.
+
+    A 'PersistenceDiagram' is a handful of aligned numpy arrays (birth,
+    death, homology dimension and the filtration indices of the pair), so it
+    is cheap to pickle across processes, to store and to vectorize.
+    Essential classes (never killed) have death = inf and death_index = -1.
+
+    'DynamicPersistence.run' reads the pairing into one of these in a single
+    pass; the barcode, feature extraction, cycle plotting and network code
+    all work from it instead of re-walking the Dionysus chains.
+
+    Example:
+        >>> dp.run()
+        >>> dp.diagram.in_dimension(1)
+        array([[ 0.2,  1.5]])
+        >>> simplices, values = dp.diagram.cycle(0)
+
+'''
+
+import numpy as np
+
+from .utils import concatenated_ranges
+
+
+FIELDS = ('birth', 'death', 'dimension', 'birth_index', 'death_index')
+CYCLE_FIELDS = ('cycle_ptr', 'cycle_simplices', 'cycle_values')
+
+
+class PersistenceDiagram(object):
+    ''' Pairs as aligned arrays, optionally with the representative cycle
+        of each pair in CSR form: the simplices of pair i are rows
+        cycle_ptr[i]:cycle_ptr[i+1] of cycle_simplices (vertex indices,
+        padded with -1) and of cycle_values.  Essential classes have empty
+        cycles.
+    '''
+
+    def __init__(self, birth, death, dimension, birth_index=None,
+                 death_index=None, cycle_ptr=None, cycle_simplices=None,
+                 cycle_values=None):
+        self.birth = np.asarray(birth, dtype=np.float64)
+        self.death = np.asarray(death, dtype=np.float64)
+        self.dimension = np.asarray(dimension, dtype=np.int64)
+
+        if birth_index is None:
+            birth_index = np.full(len(self.birth), -1)
+        if death_index is None:
+            death_index = np.full(len(self.birth), -1)
+        self.birth_index = np.asarray(birth_index, dtype=np.int64)
+        self.death_index = np.asarray(death_index, dtype=np.int64)
+
+        self.cycle_ptr = cycle_ptr
+        self.cycle_simplices = cycle_simplices
+        self.cycle_values = cycle_values
+
+    def __len__(self):
+        return len(self.birth)
+
+    def __repr__(self):
+        dims = np.unique(self.dimension)
+        counts = ', '.join('H{}: {}'.format(d, np.sum(self.dimension == d))
+                           for d in dims)
+
+        return '<PersistenceDiagram {}>'.format(counts or 'empty')
+
+    @property
+    def persistence(self):
+        return self.death - self.birth
+
+    @property
+    def has_cycles(self):
+        return self.cycle_ptr is not None
+
+    def in_dimension(self, dimension):
+        ''' (k, 2) array of the (birth, death) pairs of H_dimension. '''
+        mask = self.dimension == dimension
+
+        return np.c_[self.birth[mask], self.death[mask]]
+
+    def cycle(self, i):
+        ''' Representative cycle of pair i.
+            OUTPUT: (m, dimension+1) vertex array, length m values
+        '''
+        if not self.has_cycles:
+            raise ValueError('This diagram holds no cycles; run with '
+                             'chains=True')
+
+        rows = slice(self.cycle_ptr[i], self.cycle_ptr[i + 1])
+        width = self.dimension[i] + 1
+
+        return self.cycle_simplices[rows, :width], self.cycle_values[rows]
+
+    def cycles(self):
+        ''' Yields (i, cycle simplices, cycle values) for every pair with a
+            non-empty cycle.
+        '''
+        if not self.has_cycles:
+            raise ValueError('This diagram holds no cycles; run with '
+                             'chains=True')
+
+        for i in np.flatnonzero(np.diff(self.cycle_ptr)):
+            simplices, values = self.cycle(i)
+            yield i, simplices, values
+
+    def finite(self):
+        return self._select(np.isfinite(self.death))
+
+    def filter(self, min_persistence, inclusive=False):
+        ''' Keeps the pairs living longer than min_persistence (or exactly
+            as long, with inclusive=True).
+        '''
+        if inclusive:
+            return self._select(self.persistence >= min_persistence)
+
+        return self._select(self.persistence > min_persistence)
+
+    def truncate(self, skeleton=None, max_dimension=None):
+        ''' The diagram of the same filtration cut to the simplices of value
+            <= skeleton and dimension <= max_dimension, without recomputing.
+            The cut filtration is a prefix of the sorted one (the value
+            comes first in the order), so its pairing is the restriction of
+            this one: pairs born after the cut go, pairs dying after it
+            become essential, and with no simplices of max_dimension + 1
+            only the classes below max_dimension are kept.
+        '''
+        mask = np.ones(len(self), dtype=bool)
+        if max_dimension is not None:
+            mask &= self.dimension < max_dimension
+        if skeleton is not None:
+            mask &= self.birth <= skeleton
+        diagram = self._select(mask)
+        if skeleton is None:
+            return diagram
+
+        cut = diagram.death > skeleton
+        diagram.death[cut] = np.inf
+        diagram.death_index[cut] = -1
+        if diagram.has_cycles and cut.any():
+            counts = np.where(cut, 0, np.diff(diagram.cycle_ptr))
+            rows = concatenated_ranges(diagram.cycle_ptr[:-1], counts)
+            np.cumsum(counts, out=diagram.cycle_ptr[1:])
+            diagram.cycle_simplices = diagram.cycle_simplices[rows]
+            diagram.cycle_values = diagram.cycle_values[rows]
+
+        return diagram
+
+    def _select(self, mask):
+        columns = [getattr(self, name)[mask] for name in FIELDS]
+
+        if not self.has_cycles:
+            return PersistenceDiagram(*columns)
+
+        counts = np.diff(self.cycle_ptr)[mask]
+        rows = concatenated_ranges(self.cycle_ptr[:-1][mask], counts)
+        cycle_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=cycle_ptr[1:])
+
+        return PersistenceDiagram(*columns + [cycle_ptr,
+                                              self.cycle_simplices[rows],
+                                              self.cycle_values[rows]])
+
+    def to_array(self):
+        ''' (k, 3) array of (dimension, birth, death) rows. '''
+        return np.c_[self.dimension, self.birth, self.death]
+
+    @classmethod
+    def from_array(cls, array):
+        array = np.asarray(array, dtype=np.float64).reshape(-1, 3)
+
+        return cls(array[:, 1], array[:, 2], array[:, 0].astype(np.int64))
+
+    def to_dict(self, cycles=True):
+        ''' All the arrays by name, e.g. for np.savez. '''
+        arrays = dict((name, getattr(self, name)) for name in FIELDS)
+        if cycles and self.has_cycles:
+            arrays.update((name, getattr(self, name))
+                          for name in CYCLE_FIELDS)
+
+        return arrays
+
+    @classmethod
+    def from_dict(cls, arrays):
+        return cls(**dict((name, arrays[name]) for name in arrays))
+
+    @classmethod
+    def from_dynamic_persistence(cls, dynamic_persistence,
+                                 min_persistence=0.0, cycles=False):
+        ''' Reads the pairs of a run DynamicPersistence, either engine, in a
+            single pass, and with cycles=True their representative cycles
+            (which needs a run with chains).  Pairs with
+            death - birth <= min_persistence are left out, and so are the
+            essential classes of dimension max_dimension: with no simplices
+            above them to kill them, they are artefacts of the truncation.
+        '''
+        dp = dynamic_persistence.dynamic_persistence
+        top = dynamic_persistence.max_dimension
+
+        if hasattr(dp, 'partner'):
+            return cls._from_matrix(dp, dynamic_persistence.filtration,
+                                    min_persistence, top, cycles)
+
+        return cls.from_chains(dp, dynamic_persistence.simplex_map,
+                               dynamic_persistence.evaluator,
+                               min_persistence, top, cycles)
+
+    @classmethod
+    def _from_matrix(cls, persistence, filtration, min_persistence, top,
+                     cycles):
+        if cycles and persistence.cycles is None:
+            raise ValueError('Cycles were not tracked; run with chains=True')
+
+        values = filtration.filtration_values()
+        births, deaths = persistence.pairs()
+        essential = persistence.essential()
+        essential = essential[filtration.dimension[essential] < top]
+
+        birth_index = np.concatenate([births, essential])
+        death_index = np.concatenate([deaths, np.full(len(essential), -1)])
+        birth = values[birth_index]
+        death = np.concatenate([values[deaths],
+                                np.full(len(essential), np.inf)])
+
+        keep = death - birth > min_persistence
+        birth_index = birth_index[keep]
+        death_index = death_index[keep]
+        columns = [birth[keep], death[keep],
+                   filtration.dimension[birth_index],
+                   birth_index, death_index]
+
+        if not cycles:
+            return cls(*columns)
+
+        empty = np.empty(0, dtype=np.int64)
+        members = [persistence.cycles[j] if j >= 0 else empty
+                   for j in death_index]
+        cycle_ptr = np.zeros(len(members) + 1, dtype=np.int64)
+        np.cumsum([len(m) for m in members], out=cycle_ptr[1:])
+
+        index = np.concatenate(members + [empty])
+        simplex_dimension = filtration.dimension[index]
+        simplices = np.full((len(index), filtration.max_dimension + 1), -1,
+                            dtype=np.int64)
+        for k in np.unique(simplex_dimension):
+            mask = simplex_dimension == k
+            simplices[mask, :k + 1] = \
+                filtration.simplices[k][filtration.row[index[mask]]]
+
+        return cls(*columns + [cycle_ptr, simplices, values[index]])
+
+    @classmethod
+    def from_chains(cls, persistence, smap, evaluator, min_persistence=0.0,
+                    top=None, cycles=True):
+        ''' Reads a Dionysus style pairing (nodes with sign, pair, unpaired
+            and cycle, plus a simplex map and evaluator) in one pass.
+            Essential classes of dimension 'top' are left out.
+        '''
+        index_of = {}
+        birth, death, dimension = [], [], []
+        birth_index, death_index = [], []
+        counts, cycle_simplices, cycle_values = [], [], []
+
+        for i, node in enumerate(persistence):
+            simplex = smap[node]
+            index_of[tuple(simplex.vertices)] = i
+
+            if node.sign():
+                if not node.unpaired() or simplex.dimension() == top:
+                    continue
+                birth.append(evaluator(simplex))
+                death.append(np.inf)
+                dimension.append(simplex.dimension())
+                birth_index.append(i)
+                death_index.append(-1)
+                counts.append(0)
+                continue
+
+            pair = smap[node.pair()]
+            b, d = evaluator(pair), evaluator(simplex)
+            if d - b <= min_persistence:
+                continue
+
+            birth.append(b)
+            death.append(d)
+            dimension.append(pair.dimension())
+            birth_index.append(index_of[tuple(pair.vertices)])
+            death_index.append(i)
+
+            if cycles:
+                cycle = [smap[ii] for ii in node.cycle]
+                counts.append(len(cycle))
+                cycle_simplices.extend([v for v in s.vertices]
+                                       for s in cycle)
+                cycle_values.extend(evaluator(s) for s in cycle)
+
+        columns = [birth, death, dimension, birth_index, death_index]
+        if not cycles:
+            return cls(*columns)
+
+        cycle_ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=cycle_ptr[1:])
+
+        width = max([len(s) for s in cycle_simplices] or [1])
+        simplices = np.full((len(cycle_simplices), width), -1,
+                            dtype=np.int64)
+        for row, vertices in enumerate(cycle_simplices):
+            simplices[row, :len(vertices)] = vertices
+
+        return cls(*columns + [cycle_ptr, simplices,
+                               np.array(cycle_values, dtype=np.float64)])
+
+
+def as_diagram(persistence, smap=None, evaluator=None):
+    ''' Accepts a PersistenceDiagram, a run DynamicPersistence, or the
+        legacy (dynamic_persistence, simplex_map, evaluator) triple.
+    '''
+    if isinstance(persistence, PersistenceDiagram):
+        return persistence
+
+    if getattr(persistence, 'diagram', None) is not None:
+        return persistence.diagram
+
+    return PersistenceDiagram.from_chains(persistence, smap, evaluator)
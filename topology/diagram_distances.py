@@ -0,0 +1,313 @@
+''' Bottleneck and Wasserstein distances between persistence diagrams.
+
+    Points are compared in the L-infinity norm and may be matched to the
+    diagonal, at half their persistence.  Both distances are computed on an
+    augmented square problem: each diagram gets a diagonal slot for every
+    point of the other, so that a perfect matching always exists.
+
+    * wasserstein(A, B, p): optimal assignment by scipy's
+      linear_sum_assignment.
+    * bottleneck(A, B): bisection over the candidate costs, with maximum
+      bipartite matchings of the points off the diagonal at each threshold.
+
+    Sorted persistence gives cheap lower bounds on both (a matched pair's
+    persistences differ by at most twice their distance), which
+    'nearest_diagrams' uses to skip candidates, and 'distance_matrix'
+    computes all pairs on a worker pool.  Essential (infinite) pairs are
+    ignored.
+
+    approximate=True first drops the points nearest the diagonal, as many
+    as the triangle inequality allows while keeping the error within
+    'delta' times that lower bound.  Diagrams of noisy data are mostly such
+    points, so the assignment problem usually shrinks a lot.
+
+    Example:
+        >>> D = distance_matrix(diagrams, metric='wasserstein', p=1,
+        ...                     dimension=1, n_jobs=8)
+        >>> indices, distances = nearest_diagrams(diagrams[0], diagrams, k=5)
+
+'''
+
+import multiprocessing
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import maximum_bipartite_matching
+
+from .diagram import PersistenceDiagram
+from .distances import condensed_pairs
+from .distances import condensed_size
+
+
+METRICS = ('bottleneck', 'wasserstein')
+
+
+def diagram_points(diagram, dimension=None):
+    ''' Finite (birth, death) points of 'diagram' (a PersistenceDiagram, or
+        (k, 2) / (k, 3) rows as for 'PersistenceDiagram.to_array'), in one
+        homology dimension or all.
+    '''
+    if not isinstance(diagram, PersistenceDiagram):
+        rows = np.asarray(diagram, dtype=np.float64)
+        if rows.size == 0:
+            return np.empty((0, 2))
+        if rows.shape[-1] == 2:
+            if dimension is not None:
+                raise ValueError('(birth, death) rows carry no dimension')
+            rows = np.c_[np.zeros(len(rows)), rows]
+        diagram = PersistenceDiagram.from_array(rows)
+
+    diagram = diagram.finite()
+    if dimension is not None:
+        return diagram.in_dimension(dimension)
+
+    return np.c_[diagram.birth, diagram.death]
+
+
+def _cost_matrix(A, B, p):
+    ''' Augmented (n+m) x (m+n) cost matrix: rows are A's points then
+        diagonal slots for B's, columns B's points then slots for A's.
+    '''
+    n, m = len(A), len(B)
+    half_a = (A[:, 1] - A[:, 0]) / 2.0
+    half_b = (B[:, 1] - B[:, 0]) / 2.0
+
+    C = np.zeros((n + m, m + n))
+    C[:n, :m] = np.abs(A[:, np.newaxis, :] - B[np.newaxis, :, :]).max(axis=2)
+    C[:n, m:] = half_a[:, np.newaxis]
+    C[n:, :m] = half_b[np.newaxis, :]
+
+    return C if p == np.inf else C ** p
+
+
+def _prune(P, budget, p):
+    ''' Drops the lowest-persistence points of P while the Wasserstein-p
+        (p=inf: bottleneck) distance between P and what is left, the cost
+        of sending the dropped points to the diagonal, stays within
+        'budget'.
+    '''
+    half = (P[:, 1] - P[:, 0]) / 2.0
+    order = np.argsort(half)
+    if p == np.inf:
+        cost = half[order]
+    else:
+        cost = np.cumsum(half[order] ** p) ** (1.0 / p)
+    dropped = np.searchsorted(cost, budget, side='right')
+
+    return P[np.sort(order[dropped:])]
+
+
+def _approximate(A, B, p, delta):
+    ''' Prunes both diagrams so that, by the triangle inequality, the
+        distance between what is left is within delta times the persistence
+        lower bound, hence within delta times the exact distance.
+    '''
+    metric = 'bottleneck' if p == np.inf else 'wasserstein'
+    bound = lower_bounds(_sorted(A), _sorted(B)[np.newaxis, :], metric,
+                         p)[0]
+    budget = delta * bound / 2.0
+
+    return _prune(A, budget, p), _prune(B, budget, p)
+
+
+def wasserstein(A, B, p=1, dimension=None, approximate=False, delta=0.01):
+    ''' Wasserstein-p distance between two diagrams (see 'diagram_points'
+        for the accepted forms).  With approximate=True the result is within
+        a relative error delta of the exact distance.  p=inf is the
+        bottleneck distance.
+    '''
+    if p == np.inf:
+        return bottleneck(A, B, dimension, approximate, delta)
+
+    A = diagram_points(A, dimension)
+    B = diagram_points(B, dimension)
+    if approximate:
+        A, B = _approximate(A, B, p, delta)
+    if not len(A) and not len(B):
+        return 0.0
+
+    C = _cost_matrix(A, B, p)
+    row, col = linear_sum_assignment(C)
+
+    return float(C[row, col].sum() ** (1.0 / p))
+
+
+def _covers(D, rows, threshold):
+    ''' Whether the points 'rows' can all be matched to distinct columns
+        within 'threshold'.
+    '''
+    if not rows.any():
+        return True
+    graph = sparse.csr_matrix(D[rows] <= threshold)
+    matching = maximum_bipartite_matching(graph, perm_type='column')
+
+    return np.all(matching >= 0)
+
+
+def bottleneck(A, B, dimension=None, approximate=False, delta=0.01):
+    ''' Bottleneck distance between two diagrams.  With approximate=True
+        the result is within a relative error delta of the exact distance.
+    '''
+    A = diagram_points(A, dimension)
+    B = diagram_points(B, dimension)
+    if approximate:
+        A, B = _approximate(A, B, np.inf, delta)
+    if not len(A) and not len(B):
+        return 0.0
+
+    D = np.abs(A[:, np.newaxis, :] - B[np.newaxis, :, :]).max(axis=2)
+    half_a = (A[:, 1] - A[:, 0]) / 2.0
+    half_b = (B[:, 1] - B[:, 0]) / 2.0
+
+    # Within t, the diagonal takes every point with half persistence <= t,
+    # so a matching exists iff the others can be matched among the points;
+    # by the Mendelsohn-Dulmage theorem it is enough to match those of A
+    # and those of B separately, two problems only as large as the points
+    # far from the diagonal.
+    candidates = np.unique(np.concatenate([D.ravel(), half_a, half_b]))
+    low, high = 0, len(candidates) - 1
+    while low < high:
+        middle = (low + high) // 2
+        t = candidates[middle]
+        if _covers(D, half_a > t, t) and _covers(D.T, half_b > t, t):
+            high = middle
+        else:
+            low = middle + 1
+
+    return float(candidates[low])
+
+
+def diagram_distance(A, B, metric='wasserstein', p=1, dimension=None,
+                     approximate=False, delta=0.01):
+    if metric == 'bottleneck':
+        return bottleneck(A, B, dimension, approximate, delta)
+    if metric == 'wasserstein':
+        return wasserstein(A, B, p, dimension, approximate, delta)
+
+    raise ValueError('metric must be one of {}, got {!r}'
+                     .format(METRICS, metric))
+
+
+def sorted_persistence(diagrams, dimension=None):
+    ''' Persistence of each diagram's points, sorted in decreasing order and
+        zero-padded into one (n_diagrams, max points) array.
+    '''
+    rows = [_sorted(diagram_points(d, dimension)) for d in diagrams]
+    width = max([len(row) for row in rows] or [0])
+
+    S = np.zeros((len(rows), width))
+    for i, row in enumerate(rows):
+        S[i, :len(row)] = row
+
+    return S
+
+
+def _sorted(P):
+    return np.sort(P[:, 1] - P[:, 0])[::-1]
+
+
+def lower_bounds(query, S, metric='wasserstein', p=1):
+    ''' Lower bounds on the distance from a query to each diagram, from
+        their sorted persistence (rows of 'sorted_persistence'; 'query' is
+        one such row).  Matching points change persistence by at most twice
+        their distance, and a point matched to the diagonal costs half its
+        persistence, so the sorted one-dimensional matching bounds the
+        real one from below.
+    '''
+    width = max(len(query), S.shape[1])
+    q = np.zeros(width)
+    q[:len(query)] = query
+    S = np.pad(S, ((0, 0), (0, width - S.shape[1])))
+
+    gap = np.abs(S - q) / 2.0
+    if metric == 'bottleneck':
+        return gap.max(axis=1) if width else np.zeros(len(S))
+
+    return (gap ** p).sum(axis=1) ** (1.0 / p)
+
+
+_worker_points = None
+
+
+def _init_worker(points):
+    global _worker_points
+    _worker_points = points
+
+
+def _distance_block(args):
+    start, stop, n, options = args
+    i, j = condensed_pairs(n, np.arange(start, stop))
+
+    return start, np.array([diagram_distance(_worker_points[a],
+                                             _worker_points[b], **options)
+                            for a, b in zip(i, j)])
+
+
+def distance_matrix(diagrams, metric='wasserstein', p=1, dimension=None,
+                    approximate=False, delta=0.01, n_jobs=None,
+                    chunk_size=256):
+    ''' Distances between all pairs of diagrams, in condensed (pdist) order;
+        scipy.spatial.distance.squareform makes the square matrix.
+        INPUT: list of diagrams, metric ('wasserstein' or 'bottleneck'), p,
+               homology dimension (all when None), approximate and delta as
+               for 'wasserstein', worker processes (all cores when None,
+               in-process when 1), pairs per task
+    '''
+    points = [diagram_points(d, dimension) for d in diagrams]
+    n = len(points)
+    size = condensed_size(n)
+    options = dict(metric=metric, p=p, approximate=approximate, delta=delta)
+    tasks = [(start, min(start + chunk_size, size), n, options)
+             for start in range(0, size, chunk_size)]
+
+    condensed = np.empty(size)
+    if n_jobs == 1:
+        _init_worker(points)
+        results = map(_distance_block, tasks)
+        for start, block in results:
+            condensed[start:start + len(block)] = block
+        return condensed
+
+    pool = multiprocessing.Pool(n_jobs or multiprocessing.cpu_count(),
+                                initializer=_init_worker, initargs=(points,))
+    try:
+        for start, block in pool.imap_unordered(_distance_block, tasks):
+            condensed[start:start + len(block)] = block
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return condensed
+
+
+def nearest_diagrams(query, diagrams, k=1, metric='wasserstein', p=1,
+                     dimension=None, approximate=False, delta=0.01,
+                     persistence=None):
+    ''' The k diagrams closest to 'query'.  Candidates are visited in order
+        of their persistence lower bound and the search stops once that
+        bound exceeds the k-th best distance so far, so distant diagrams
+        are never matched.  'persistence' can hold a precomputed
+        sorted_persistence(diagrams, dimension) for repeated queries.
+        OUTPUT: indices, distances (ascending)
+    '''
+    if persistence is None:
+        persistence = sorted_persistence(diagrams, dimension)
+    query_points = diagram_points(query, dimension)
+    bounds = lower_bounds(_sorted(query_points), persistence, metric, p)
+
+    best_index, best_distance = [], []
+    for i in np.argsort(bounds, kind='stable'):
+        if len(best_distance) == k and bounds[i] >= best_distance[-1]:
+            break
+
+        d = diagram_distance(query_points, diagram_points(diagrams[i],
+                                                          dimension),
+                             metric, p, None, approximate, delta)
+        if len(best_distance) < k or d < best_distance[-1]:
+            position = np.searchsorted(best_distance, d, side='right')
+            best_distance.insert(position, d)
+            best_index.insert(position, i)
+            del best_distance[k:], best_index[k:]
+
+    return np.array(best_index, dtype=np.int64), np.array(best_distance)
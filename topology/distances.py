@@ -0,0 +1,217 @@
+''' Condensed pairwise distance matrices computed straight from a numpy
+    array.  Rows are processed in blocks, so the only full-size allocation
+    is the condensed output itself (n(n-1)/2 entries), which may be float32
+    and may live in a memory-mapped file.  Metrics are looked up in
+    'METRICS' by name, or can be given as a callable taking two blocks of
+    points and returning their distance block.
+
+    Example:
+        >>> d = pairwise_distances(X, metric='cosine', dtype=np.float32,
+        ...                        filename='distances.dat')
+        >>> distances = CondensedDistances(d, len(X))
+        >>> distances(0, 5)
+
+'''
+
+import numpy as np
+
+
+def _euclidean(A, B):
+    sq_A = np.einsum('ij,ij->i', A, A)
+    sq_B = np.einsum('ij,ij->i', B, B)
+
+    D = np.dot(A, B.T)
+    D *= -2.0
+    D += sq_A[:, np.newaxis]
+    D += sq_B[np.newaxis, :]
+    np.maximum(D, 0.0, out=D)
+
+    return np.sqrt(D, out=D)
+
+
+def _sqeuclidean(A, B):
+    D = _euclidean(A, B)
+
+    return np.square(D, out=D)
+
+
+def _cosine(A, B):
+    norm_A = np.sqrt(np.einsum('ij,ij->i', A, A))
+    norm_B = np.sqrt(np.einsum('ij,ij->i', B, B))
+    norm_A[norm_A == 0.0] = 1.0
+    norm_B[norm_B == 0.0] = 1.0
+
+    D = np.dot(A / norm_A[:, np.newaxis], (B / norm_B[:, np.newaxis]).T)
+    np.subtract(1.0, D, out=D)
+
+    return np.clip(D, 0.0, 2.0, out=D)
+
+
+def _cityblock(A, B):
+    return np.abs(A[:, np.newaxis, :] - B[np.newaxis, :, :]).sum(axis=-1)
+
+
+def _chebyshev(A, B):
+    return np.abs(A[:, np.newaxis, :] - B[np.newaxis, :, :]).max(axis=-1)
+
+
+METRICS = {'euclidean': _euclidean,
+           'sqeuclidean': _sqeuclidean,
+           'cosine': _cosine,
+           'cityblock': _cityblock,
+           'chebyshev': _chebyshev}
+
+
+def get_metric(metric):
+    ''' Returns the block function for 'metric' (a name in METRICS or a
+        callable f(A, B) -> len(A) x len(B) distances).
+    '''
+    if callable(metric):
+        return metric
+
+    try:
+        return METRICS[metric]
+    except KeyError:
+        raise ValueError('Unknown metric {!r}; expected one of {} or '
+                         "'precomputed'".format(metric, sorted(METRICS)))
+
+
+def condensed_size(n_points):
+    return n_points * (n_points - 1) // 2
+
+
+def condensed_index(n_points, i, j):
+    ''' Position of the pair (i, j), i != j, in a condensed matrix.  Works
+        elementwise on arrays of indices.
+    '''
+    i, j = np.minimum(i, j), np.maximum(i, j)
+
+    return n_points * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def _row_start(n_points, i):
+    return n_points * i - i * (i + 1) // 2
+
+
+def condensed_pairs(n_points, k):
+    ''' Inverse of 'condensed_index': positions k -> index arrays (i, j),
+        with i < j.
+    '''
+    starts = _row_start(n_points, np.arange(n_points))
+    i = np.searchsorted(starts, k, side='right') - 1
+    j = k - starts[i] + i + 1
+
+    return i, j
+
+
+def _allocate(size, dtype, filename):
+    if filename is None:
+        return np.empty(size, dtype=dtype)
+
+    # A zero-length memmap cannot be created, but also holds nothing.
+    return np.memmap(filename, dtype=dtype, mode='w+', shape=(max(size, 1),))
+
+
+def iter_distance_blocks(X, metric='euclidean', chunk_size=None):
+    ''' Yields (start, stop, D) where D holds the distances from points
+        X[start:stop] to every point X[start+1:], one block of rows at a
+        time.  Only D[r, c] with c >= r are above the diagonal.
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    block = get_metric(metric)
+
+    if chunk_size is None:
+        chunk_size = max(1, 2**22 // max(n, 1))
+
+    for start in range(0, max(n - 1, 0), chunk_size):
+        stop = min(start + chunk_size, n - 1)
+        yield start, stop, block(X[start:stop], X[start + 1:])
+
+
+def _precomputed_blocks(X, chunk_size=None):
+    ''' As 'iter_distance_blocks', for a square matrix of distances: views
+        of its rows, so nothing larger than a block is copied.
+    '''
+    n = len(X)
+    if chunk_size is None:
+        chunk_size = max(1, 2**22 // max(n, 1))
+
+    for start in range(0, max(n - 1, 0), chunk_size):
+        stop = min(start + chunk_size, n - 1)
+        yield start, stop, X[start:stop, start + 1:]
+
+
+def pairwise_distances(X, metric='euclidean', dtype=np.float64,
+                       chunk_size=None, filename=None):
+    ''' Computes the condensed distance matrix of the rows of X.
+        INPUT: NxD numpy array (or NxN matrix, for metric='precomputed'),
+               metric name or callable, output dtype, rows per block,
+               optional path for a memory-mapped output file
+        OUTPUT: 1D numpy array (or np.memmap) of length N(N-1)/2, in the
+                same pair order as scipy.spatial.distance.pdist
+    '''
+    X = np.asarray(X)
+    n = len(X)
+    D = _allocate(condensed_size(n), dtype, filename)
+
+    if metric == 'precomputed':
+        if X.ndim != 2 or X.shape[0] != X.shape[1]:
+            raise ValueError('Precomputed distances must be a square matrix, '
+                             'got shape {}'.format(X.shape))
+        blocks = _precomputed_blocks(X, chunk_size)
+    else:
+        blocks = iter_distance_blocks(X, metric, chunk_size)
+
+    for start, stop, block in blocks:
+        # Row r of the block is point start+r; keep only its pairs (i, j)
+        # with j > i, which are consecutive in the condensed layout.
+        rows = np.arange(stop - start)[:, np.newaxis]
+        cols = np.arange(block.shape[1])[np.newaxis, :]
+        D[_row_start(n, start):_row_start(n, stop)] = block[cols >= rows]
+
+    if isinstance(D, np.memmap):
+        D.flush()
+
+    return D
+
+
+class CondensedDistances(object):
+    ''' Distance oracle over a condensed matrix.  It provides the
+        '__len__'/'__call__' protocol Dionysus' Rips expects of a distances
+        object, so no Python list of points or dense NxN copy is needed.
+    '''
+
+    def __init__(self, condensed, n_points):
+        self.condensed = condensed
+        self.n_points = n_points
+
+    @classmethod
+    def from_points(cls, X, metric='euclidean', dtype=np.float64,
+                    chunk_size=None, filename=None):
+        condensed = pairwise_distances(X, metric=metric, dtype=dtype,
+                                       chunk_size=chunk_size,
+                                       filename=filename)
+
+        return cls(condensed, len(X))
+
+    def __len__(self):
+        return self.n_points
+
+    def __call__(self, i, j):
+        if i == j:
+            return 0.0
+
+        return float(self.condensed[condensed_index(self.n_points, i, j)])
+
+    def pairs(self, i, j):
+        ''' Vectorized lookup of the distances between i[k] and j[k]. '''
+        i = np.asarray(i)
+        j = np.asarray(j)
+        d = np.zeros(np.broadcast(i, j).shape, dtype=self.condensed.dtype)
+
+        off_diagonal = i != j
+        k = condensed_index(self.n_points, i, j)
+        d[off_diagonal] = self.condensed[k[off_diagonal]]
+
+        return d
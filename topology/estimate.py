@@ -0,0 +1,259 @@
+''' Pre-flight estimates of the size of a Rips complex.
+
+    The number of k-simplices is the sum over vertices v of the number of
+    k-simplices containing v, divided by k+1, and the simplices containing
+    v are the cliques of v's neighbourhood.  So a random sample of vertices
+    gives an unbiased estimate: for each sampled vertex the cliques of its
+    skeleton-neighbourhood are counted exactly (dimension by dimension, as
+    in 'rips.expand_cliques'), and the totals are scaled up.  It costs a
+    few hundred neighbourhoods instead of the whole complex, and it is
+    computed before anything large is allocated.
+
+    'largest_skeleton' searches the sampled distance distribution for the
+    largest skeleton whose estimate fits a simplex or memory budget, which
+    is what DynamicPersistence(skeleton='auto', max_simplices=...) uses;
+    with a budget and a fixed skeleton the run fails with ComplexTooLarge
+    before generating the complex.
+
+    Example:
+        >>> estimate = estimate_complex(X, skeleton=0.5, max_dimension=2)
+        >>> estimate.simplices, estimate.memory
+        >>> skeleton = largest_skeleton(X, 2, max_memory=2**30)
+
+'''
+
+import numpy as np
+
+from .landmarks import _distances_to
+from .rips import NeighborhoodGraph
+from .utils import check_random_state
+
+
+# Rough peak bytes per simplex of a run, measured on the numpy engine
+# (per simplex: vertex, value, order and boundary arrays plus the working
+# columns of the reduction).  Dionysus keeps chains, so it is taken to
+# cost about what the numpy engine does with chains.
+BYTES_PER_SIMPLEX = {('numpy', False): 600,
+                     ('numpy', True): 2600,
+                     ('dionysus', False): 2600,
+                     ('dionysus', True): 2600}
+
+
+class ComplexTooLarge(MemoryError):
+    ''' Raised before generation when the estimated complex exceeds the
+        budget.  'estimate' is the ComplexEstimate that did.
+    '''
+
+    def __init__(self, message, estimate=None):
+        super(ComplexTooLarge, self).__init__(message)
+        self.estimate = estimate
+
+
+class ComplexEstimate(object):
+    ''' Estimated simplex counts by dimension and peak memory in bytes.
+        'lower_bound' is set when some neighbourhood held more cliques than
+        the counting limit, so the true numbers are larger still.
+    '''
+
+    def __init__(self, skeleton, max_dimension, counts, memory,
+                 lower_bound=False):
+        self.skeleton = skeleton
+        self.max_dimension = max_dimension
+        self.counts = counts
+        self.memory = memory
+        self.lower_bound = lower_bound
+
+    @property
+    def simplices(self):
+        return int(np.sum(self.counts))
+
+    def __repr__(self):
+        return '<ComplexEstimate skeleton={:0.4g}: {}{} simplices, {:0.3g} ' \
+               'MB>'.format(self.skeleton, '>=' if self.lower_bound else '',
+                            self.simplices, self.memory / 2.0**20)
+
+    def exceeds(self, max_simplices=None, max_memory=None):
+        return (max_simplices is not None and
+                self.simplices > max_simplices) or \
+               (max_memory is not None and self.memory > max_memory)
+
+
+def budget_simplices(max_simplices=None, max_memory=None, engine='numpy',
+                     chains=True, distance_bytes=0):
+    ''' Most simplices a budget allows (None without a budget). '''
+    limits = []
+    if max_simplices is not None:
+        limits.append(max_simplices)
+    if max_memory is not None:
+        limits.append((max_memory - distance_bytes) /
+                      float(BYTES_PER_SIMPLEX[(engine, bool(chains))]))
+
+    return min(limits) if limits else None
+
+
+def _sample_vertices(n, n_samples, random_state):
+    if n_samples is None or n_samples >= n:
+        return np.arange(n)
+
+    rng = check_random_state(random_state)
+
+    return np.sort(rng.choice(n, size=n_samples, replace=False))
+
+
+def _local_counts(X, v, skeleton, max_dimension, metric, max_local):
+    ''' Number of k-simplices containing v, k = 0..max_dimension, and
+        whether counting stopped at max_local cliques.
+    '''
+    counts = np.zeros(max_dimension + 1, dtype=np.float64)
+    counts[0] = 1
+
+    row = _distances_to(X[[v]], X, np.arange(len(X)), metric).ravel()
+    row[v] = np.inf
+    neighbours = np.flatnonzero(row <= skeleton)
+    if max_dimension < 1:
+        return counts, False
+    counts[1] = len(neighbours)
+    if max_dimension < 2 or not len(neighbours):
+        return counts, False
+
+    # Cliques of k vertices among the neighbours are the k-simplices on v,
+    # so the edges among them are the triangles.  They are found a block of
+    # rows at a time, so that a huge neighbourhood stops at max_local
+    # instead of filling memory.
+    m = len(neighbours)
+    chunk_size = max(1, 2**20 // m)
+    edges, lengths = [], []
+    for start in range(0, m, chunk_size):
+        D = _distances_to(X[neighbours[start:start + chunk_size]], X,
+                          neighbours, metric)
+        i, j = np.nonzero(D <= skeleton)
+        upper = j > i + start
+        edges.append(np.c_[i[upper] + start, j[upper]])
+        lengths.append(D[i[upper], j[upper]])
+
+        counts[2] += upper.sum()
+        if counts[2] > max_local:
+            return counts, True
+
+    graph = NeighborhoodGraph(m, np.concatenate(edges),
+                              np.concatenate(lengths))
+    simplices, values = graph.edges, graph.lengths
+    for k in range(3, max_dimension + 1):
+        simplices, values = graph.cofaces(simplices, values)
+        counts[k] = len(simplices)
+        if len(simplices) > max_local:
+            return counts, True
+
+    return counts, False
+
+
+def estimate_complex(X, skeleton, max_dimension=2, metric='euclidean',
+                     n_samples=100, engine='numpy', chains=True,
+                     distance_bytes=0, max_local=10**6, stop_above=None,
+                     random_state=0):
+    ''' Estimates the Rips complex of X up to 'skeleton'.
+        INPUT: NxD numpy array (NxN for metric='precomputed'), skeleton,
+               max_dimension, metric, number of vertices to sample (all when
+               None), engine and chains (for the memory model), bytes of any
+               distance matrix held alongside, cap on the cliques counted
+               per neighbourhood, simplex count beyond which to give up,
+               seed of the vertex sample
+        OUTPUT: ComplexEstimate
+
+        Each simplex on a sampled vertex is counted at most k+1 times, so
+        the unscaled counts divided by k+1 are a lower bound on the complex;
+        once that passes 'stop_above' the rest of the sample is skipped and
+        the estimate is marked as a lower bound.
+    '''
+    X = np.asarray(X)
+    n = len(X)
+    vertices = _sample_vertices(n, n_samples, random_state)
+
+    share = 1.0 / np.arange(1, max_dimension + 2)
+    total = np.zeros(max_dimension + 1)
+    lower_bound = False
+    for sampled, v in enumerate(vertices, 1):
+        counts, capped = _local_counts(X, v, skeleton, max_dimension, metric,
+                                       max_local)
+        total += counts
+        lower_bound |= capped
+
+        if stop_above is not None and np.dot(total, share) > stop_above:
+            lower_bound = True
+            break
+
+    scale = n / float(max(sampled, 1)) if len(vertices) else 0.0
+    counts = np.rint(total * scale * share)
+    counts = counts.astype(np.int64)
+
+    memory = counts.sum() * BYTES_PER_SIMPLEX[(engine, bool(chains))] + \
+             distance_bytes
+
+    return ComplexEstimate(skeleton, max_dimension, counts, memory,
+                           lower_bound)
+
+
+def largest_skeleton(X, max_dimension=2, max_simplices=None, max_memory=None,
+                     metric='euclidean', n_samples=100, engine='numpy',
+                     chains=True, distance_bytes=0, n_candidates=64,
+                     random_state=0):
+    ''' Largest skeleton whose estimated complex fits the budget, found by
+        bisection over quantiles of the distances from sampled vertices.
+        OUTPUT: skeleton, its ComplexEstimate
+        Raises ComplexTooLarge when even the smallest candidate does not
+        fit.
+    '''
+    if max_simplices is None and max_memory is None:
+        raise ValueError('Give max_simplices or max_memory')
+
+    # One vertex sample for every candidate keeps the estimates monotone.
+    random_state = int(check_random_state(random_state).integers(2**31))
+
+    X = np.asarray(X)
+    vertices = _sample_vertices(len(X), n_samples, random_state)
+    D = _distances_to(X[vertices], X, np.arange(len(X)), metric)
+    D = D[np.isfinite(D) & (D > 0)]
+
+    # Complexes grow fast with the skeleton, so the candidates are packed
+    # towards the short distances.
+    levels = np.geomspace(1.0 / len(D), 1.0, n_candidates)
+    candidates = np.unique(np.quantile(D, levels))
+
+    stop_above = budget_simplices(max_simplices, max_memory, engine, chains,
+                                  distance_bytes)
+
+    def estimate(skeleton):
+        return estimate_complex(X, skeleton, max_dimension, metric,
+                                n_samples, engine, chains, distance_bytes,
+                                stop_above=stop_above,
+                                random_state=random_state)
+
+    # Counts grow with the skeleton (on a fixed vertex sample), so bisect.
+    low, high = 0, len(candidates)
+    best = None
+    while low < high:
+        middle = (low + high) // 2
+        current = estimate(candidates[middle])
+        if current.exceeds(max_simplices, max_memory):
+            high = middle
+        else:
+            best = current
+            low = middle + 1
+
+    if best is None:
+        smallest = estimate(candidates[0])
+        raise ComplexTooLarge('No skeleton fits the budget; the smallest '
+                              'candidate gives {!r}'.format(smallest),
+                              smallest)
+
+    return best.skeleton, best
+
+
+def check_budget(estimate, max_simplices=None, max_memory=None):
+    ''' Raises ComplexTooLarge if 'estimate' exceeds the budget. '''
+    if estimate.exceeds(max_simplices, max_memory):
+        raise ComplexTooLarge('Estimated {!r} exceeds the budget (max '
+                              'simplices {}, max memory {} bytes); lower '
+                              'the skeleton or use skeleton=\'auto\''
+                              .format(estimate, max_simplices, max_memory),
+                              estimate)
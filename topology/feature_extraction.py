@@ -1,37 +1,18 @@
 import numpy as np
 
+from .diagram import as_diagram
+
 
 class BirthDeathFeatures(object):
 
 
     def __init__(self, dynamic_persistence):
-        self.dp = dynamic_persistence.dynamic_persistence
-	self.smap = dynamic_persistence.simplex_map
-	self.evaluator = dynamic_persistence.rips.eval
+        self.diagram = as_diagram(dynamic_persistence)
 
 
     def extract(self):
-	features = []
-	for node in self.dp:
-	    if not node.sign():
-		death = self.evaluator(self.smap[node])
-		birth = self.evaluator(self.smap[node.pair()])
-
-		if (death - birth) < 0.001:
-		    continue
-
-		cycle = [self.smap[ii] for ii in node.cycle]
-		chain = [self.smap[ii] for ii in node.chain]
-
-		if not chain or not cycle:
-		    continue
-
-		dim = chain[0].dimension()
-
-#            features.append(dim)
-		features.append(birth)
-		features.append(death-birth)
+        diagram = self.diagram.finite().filter(0.001, inclusive=True)
 
-        self._features = np.array(features)
+        self._features = np.c_[diagram.birth, diagram.persistence].ravel()
 
         return self._features
@@ -0,0 +1,162 @@
+''' Columnar simplicial filtrations for the numpy persistence engine.
+
+    Simplices are held per dimension, as (m_k, k+1) arrays of sorted vertex
+    indices with an (m_k,) array of filtration values, exactly as produced by
+    'rips.expand_cliques'.  After 'sort' every simplex also has a position in
+    the filtration, and 'boundary' gives the boundary matrix of the whole
+    filtration in compressed sparse column form.
+
+    Example:
+        >>> filtration = SimplexFiltration(*rips_complex(X, 2, 1.7))
+        >>> filtration.sort()
+        >>> indptr, indices = filtration.boundary()
+
+'''
+
+import numpy as np
+
+
+def _row_lookup(table, queries):
+    ''' Row index in 'table' of each row of 'queries' (all must exist). '''
+    if not len(queries):
+        return np.empty(0, dtype=np.int64)
+
+    stacked = np.concatenate([table, queries])
+    _, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    position = np.empty(inverse.max() + 1, dtype=np.int64)
+    position[inverse[:len(table)]] = np.arange(len(table))
+
+    return position[inverse[len(table):]]
+
+
+class FiltrationSimplex(object):
+    ''' Read-only view of one simplex, with the parts of dionysus.Simplex
+        the plotting and feature extraction code relies on.
+    '''
+    __slots__ = ('vertices', 'data')
+
+    def __init__(self, vertices, data):
+        self.vertices = vertices
+        self.data = data
+
+    def dimension(self):
+        return len(self.vertices) - 1
+
+    def __repr__(self):
+        return '<{} {}>'.format(' '.join(str(v) for v in self.vertices),
+                                self.data)
+
+
+class SimplexFiltration(object):
+    ''' A filtered simplicial complex stored as per-dimension arrays.
+        'facets' optionally gives, for each k >= 1, the (m_k, k+1) rows of
+        the (k-1)-simplices that are the facets of the k-simplices, when
+        the construction already knows them (e.g. a regular grid); 'boundary'
+        then skips looking them up.
+    '''
+
+    def __init__(self, simplices, values, facets=None):
+        self.simplices = [np.asarray(s, dtype=np.int64) for s in simplices]
+        self.values = [np.asarray(v, dtype=np.float64) for v in values]
+        self.facets = facets
+
+        # Filled in by 'sort': dimension and row of each filtration index,
+        # and the filtration index of each row of each dimension.
+        self.dimension = None
+        self.row = None
+        self.positions = None
+
+    def __len__(self):
+        return sum(len(s) for s in self.simplices)
+
+    @property
+    def max_dimension(self):
+        return len(self.simplices) - 1
+
+    def sort(self):
+        ''' Orders simplices by value, then dimension (faces before cofaces
+            at equal values), like Dionysus' Rips.cmp / data_dim_cmp.
+        '''
+        dimension = np.repeat(np.arange(len(self.simplices)),
+                              [len(s) for s in self.simplices])
+        row = np.concatenate([np.arange(len(s)) for s in self.simplices])
+        value = np.concatenate(self.values)
+
+        order = np.lexsort((dimension, value))
+        self.dimension = dimension[order]
+        self.row = row[order]
+
+        self.positions = [None] * len(self.simplices)
+        for k in range(len(self.simplices)):
+            self.positions[k] = np.empty(len(self.simplices[k]),
+                                         dtype=np.int64)
+        index = np.arange(len(order))
+        for k in range(len(self.simplices)):
+            mask = self.dimension == k
+            self.positions[k][self.row[mask]] = index[mask]
+
+    def value(self, index):
+        return self.values[self.dimension[index]][self.row[index]]
+
+    def vertices(self, index):
+        return self.simplices[self.dimension[index]][self.row[index]]
+
+    def simplex(self, index):
+        return FiltrationSimplex([int(v) for v in self.vertices(index)],
+                                 float(self.value(index)))
+
+    def filtration_values(self):
+        ''' Value of every simplex, in filtration order. '''
+        values = np.empty(len(self))
+        for k, positions in enumerate(self.positions):
+            values[positions] = self.values[k]
+
+        return values
+
+    def boundary(self):
+        ''' Boundary matrix (Z/2) in compressed sparse column form.
+            OUTPUT: indptr (N+1,), indices; column j lists the filtration
+                    indices of the facets of simplex j, ascending.
+        '''
+        counts = np.where(self.dimension > 0, self.dimension + 1, 0)
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int64)
+
+        for k in range(1, len(self.simplices)):
+            S = self.simplices[k]
+            if not len(S):
+                continue
+
+            if self.facets is not None:
+                facet_rows = np.asarray(self.facets[k]).T.ravel()
+            else:
+                # Facets: drop each vertex in turn.
+                facets = np.concatenate([np.delete(S, c, axis=1)
+                                         for c in range(k + 1)])
+                facet_rows = _row_lookup(self.simplices[k - 1], facets)
+            facet_index = self.positions[k - 1][facet_rows]
+            facet_index = np.sort(facet_index.reshape(k + 1, -1).T, axis=1)
+
+            start = indptr[self.positions[k]]
+            target = start[:, np.newaxis] + np.arange(k + 1)
+            indices[target] = facet_index
+
+        return indptr, indices
+
+
+class SimplexMap(object):
+    ''' Maps filtration indices (or persistence nodes) to simplices, like
+        the map returned by Dionysus' make_simplex_map.
+    '''
+
+    def __init__(self, filtration):
+        self.filtration = filtration
+
+    def __getitem__(self, key):
+        return self.filtration.simplex(getattr(key, 'index', key))
+
+    def __len__(self):
+        return len(self.filtration)
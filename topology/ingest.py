@@ -0,0 +1,307 @@
+''' Out-of-core ingestion of point clouds larger than memory.
+
+    'iter_chunks' reads a cloud a block of rows at a time from a .npy file
+    (memory-mapped, so only the block is paged in), from delimited text
+    such as CSV, or from any iterable of arrays (e.g. batches from a
+    columnar reader).  Single-pass accumulators consume the blocks:
+
+    * StreamingSummary: count, mean, variance, min and max per column,
+      merged block by block (Chan et al.);
+    * ReservoirSample: a uniform random sample of fixed size (algorithm R,
+      a block of draws at a time);
+    * StreamingLandmarks: max-min landmarks, by reducing the current
+      landmarks and each new block back to n_landmarks with
+      'maxmin_landmarks'.  Every point seen is within 'covering_bound' of
+      a landmark; 'covering_radius' measures the true radius in a second
+      pass.
+
+    Memory is bounded by the block and the sample, not by the cloud.
+    'ingest' runs them over a source in one pass and hands the selected
+    points to DynamicPersistence.
+
+    Example:
+        >>> points, indices, summary = select_points('cloud.npy', 2000,
+        ...                                          method='maxmin')
+        >>> dp = ingest('cloud.csv', 2000, chunk_size=100000, skiprows=1,
+        ...             max_dimension=2, skeleton=0.5, engine='numpy')
+
+'''
+
+import itertools
+import os
+
+import numpy as np
+
+from .distances import get_metric
+from .landmarks import maxmin_landmarks
+from .utils import check_random_state
+
+
+METHODS = ('maxmin', 'reservoir')
+
+
+def iter_chunks(source, chunk_size=65536, delimiter=',', skiprows=0,
+                usecols=None, dtype=np.float64):
+    ''' Blocks of rows of a point cloud.
+        INPUT: array (or np.memmap), path to a .npy file, path to a
+               delimited text file, or iterable of arrays; rows per block,
+               and for text files the delimiter, header rows to skip and
+               columns to read
+        OUTPUT: generator of (index of the first row, block) pairs, blocks
+                as 2-D arrays of 'dtype'
+    '''
+    if isinstance(source, str):
+        source = os.path.expanduser(source)
+        if source.endswith('.npy'):
+            source = np.load(source, mmap_mode='r')
+        else:
+            return _text_chunks(source, chunk_size, delimiter, skiprows,
+                                usecols, dtype)
+
+    if isinstance(source, np.ndarray):
+        return ((start, np.asarray(source[start:start + chunk_size],
+                                   dtype=dtype).reshape(-1, source.shape[-1]))
+                for start in range(0, len(source), chunk_size))
+
+    return _block_chunks(source, dtype)
+
+
+def _text_chunks(path, chunk_size, delimiter, skiprows, usecols, dtype):
+    with open(path) as f:
+        for _ in range(skiprows):
+            next(f, None)
+
+        start = 0
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            block = np.loadtxt(lines, delimiter=delimiter, usecols=usecols,
+                               dtype=dtype, ndmin=2)
+            yield start, block
+            start += len(block)
+
+
+def _block_chunks(blocks, dtype):
+    start = 0
+    for block in blocks:
+        block = np.atleast_2d(np.asarray(block, dtype=dtype))
+        yield start, block
+        start += len(block)
+
+
+class StreamingSummary(object):
+    ''' Per-column count, mean, variance, min and max of a stream of blocks.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    def update(self, block, start=None):
+        block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+        n = len(block)
+        if not n:
+            return self
+
+        mean = block.mean(axis=0)
+        m2 = ((block - mean) ** 2).sum(axis=0)
+        if not self.count:
+            self.count, self.mean, self.m2 = n, mean, m2
+            self.min, self.max = block.min(axis=0), block.max(axis=0)
+            return self
+
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+        np.minimum(self.min, block.min(axis=0), out=self.min)
+        np.maximum(self.max, block.max(axis=0), out=self.max)
+
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else None
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance) if self.count else None
+
+    def __repr__(self):
+        return '<StreamingSummary {} rows>'.format(self.count)
+
+
+class ReservoirSample(object):
+    ''' Uniform sample of n_samples rows of a stream (all of them if the
+        stream is shorter).  Row t (counting from 0) replaces a random slot
+        with probability n_samples / (t + 1).
+    '''
+
+    def __init__(self, n_samples, random_state=None):
+        self.n_samples = int(n_samples)
+        self.rng = check_random_state(random_state)
+        self.seen = 0
+        self.points = None
+        self.indices = np.empty(0, dtype=np.int64)
+
+    def update(self, block, start=None):
+        block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+        if start is None:
+            start = self.seen
+        if self.points is None:
+            self.points = np.empty((0, block.shape[1]))
+
+        # Fill the reservoir first.
+        room = min(self.n_samples - len(self.points), len(block))
+        if room > 0:
+            self.points = np.r_[self.points, block[:room]]
+            self.indices = np.r_[self.indices,
+                                 start + np.arange(room, dtype=np.int64)]
+
+        t = self.seen + np.arange(room, len(block))
+        slot = (self.rng.random(len(t)) * (t + 1)).astype(np.int64)
+        replace = np.flatnonzero(slot < self.n_samples) + room
+
+        # Later rows win a slot drawn more than once.
+        slots, last = np.unique(slot[replace - room][::-1],
+                                return_index=True)
+        rows = replace[::-1][last]
+        self.points[slots] = block[rows]
+        self.indices[slots] = start + rows
+
+        self.seen += len(block)
+
+        return self
+
+    def __repr__(self):
+        return '<ReservoirSample {} of {} rows>'.format(len(self.indices),
+                                                       self.seen)
+
+
+class StreamingLandmarks(object):
+    ''' Max-min landmarks of a stream.  Each block is pooled with the
+        current landmarks and reduced back to n_landmarks, starting from
+        the first landmark, so the landmarks stay spread over everything
+        seen.  'covering_bound' is an upper bound on the distance from any
+        row seen to its nearest landmark: the rows dropped at a reduction
+        were within its covering radius of a new landmark.  It adds up over
+        the blocks, so it is loose; 'covering_radius' measures the true one.
+    '''
+
+    def __init__(self, n_landmarks, metric='euclidean', random_state=None):
+        self.n_landmarks = int(n_landmarks)
+        self.metric = metric
+        self.random_state = random_state
+        self.seen = 0
+        self.points = None
+        self.indices = np.empty(0, dtype=np.int64)
+        self.radii = np.empty(0)
+        self.covering_bound = 0.0
+
+    def update(self, block, start=None):
+        block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+        if start is None:
+            start = self.seen
+
+        if self.points is None:
+            pool = block
+            indices = start + np.arange(len(block), dtype=np.int64)
+            first = None
+        else:
+            pool = np.r_[self.points, block]
+            indices = np.r_[self.indices,
+                            start + np.arange(len(block), dtype=np.int64)]
+            first = 0
+
+        selected, radii, radius = maxmin_landmarks(
+                                    pool, self.n_landmarks,
+                                    metric=self.metric, start=first,
+                                    random_state=self.random_state)
+
+        self.points = pool[selected]
+        self.indices = indices[selected]
+        self.radii = radii
+        self.covering_bound += radius
+        self.seen += len(block)
+
+        return self
+
+    def __repr__(self):
+        return '<StreamingLandmarks {} of {} rows>'.format(
+                    len(self.indices), self.seen)
+
+
+def covering_radius(source, landmarks, metric='euclidean', **options):
+    ''' Distance from the farthest row of 'source' to its nearest
+        landmark, in one more pass over the chunks.
+        INPUT: source and 'iter_chunks' options, landmark points
+    '''
+    distance = get_metric(metric)
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+
+    radius = 0.0
+    for _, block in iter_chunks(source, **options):
+        radius = max(radius, float(distance(block, landmarks)
+                                   .min(axis=1).max()))
+
+    return radius
+
+
+def select_points(source, n_samples, method='maxmin', metric='euclidean',
+                  random_state=None, **options):
+    ''' Summary and selected subset of a cloud, in one pass over its
+        chunks.
+        INPUT: source and 'iter_chunks' options, number of points to keep,
+               'maxmin' landmarks or a 'reservoir' sample, metric (for
+               maxmin)
+        OUTPUT: selected points, their row indices in the source,
+                StreamingSummary
+    '''
+    if method not in METHODS:
+        raise ValueError('method must be one of {}, got {!r}'
+                         .format(METHODS, method))
+
+    if method == 'maxmin':
+        selector = StreamingLandmarks(n_samples, metric=metric,
+                                      random_state=random_state)
+    else:
+        selector = ReservoirSample(n_samples, random_state=random_state)
+    summary = StreamingSummary()
+
+    for start, block in iter_chunks(source, **options):
+        summary.update(block)
+        selector.update(block, start)
+
+    order = np.argsort(selector.indices, kind='mergesort')
+
+    return selector.points[order], selector.indices[order], summary
+
+
+def ingest(source, n_samples, method='maxmin', chunk_size=65536,
+           delimiter=',', skiprows=0, usecols=None, random_state=None,
+           **kwargs):
+    ''' Runs DynamicPersistence on points selected from 'source' (see
+        'select_points').  The selected rows are in 'indices_' and the
+        column summary in 'summary_' of the returned run.
+    '''
+    # Imported here so the module loads without Dionysus.
+    from .persistence import DynamicPersistence
+
+    points, indices, summary = select_points(
+                                source, n_samples, method,
+                                metric=kwargs.get('metric', 'euclidean'),
+                                random_state=random_state,
+                                chunk_size=chunk_size, delimiter=delimiter,
+                                skiprows=skiprows, usecols=usecols)
+
+    dp = DynamicPersistence(points, random_state=random_state, **kwargs)
+    dp.indices_ = indices
+    dp.summary_ = summary
+    dp.run()
+
+    return dp
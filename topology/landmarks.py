@@ -0,0 +1,152 @@
+''' Landmark subsampling and lazy witness complexes.
+
+    A few hundred landmarks picked by max-min (farthest point) sampling cover
+    the cloud to within the reported covering radius; the lazy witness
+    complex over them uses every point of the full cloud as a witness.  This
+    is how 'DynamicPersistence(..., n_landmarks=...)' gets diagrams for
+    clouds far too large for a Rips complex on all points.
+
+    Example:
+        >>> landmarks, radii, covering_radius = maxmin_landmarks(X, 200)
+        >>> simplices, values = witness_complex(X, landmarks, 2, 1.7)
+
+'''
+
+import numpy as np
+
+from .distances import get_metric
+from .rips import NeighborhoodGraph
+from .rips import expand_cliques
+from .utils import check_random_state
+
+
+def _distances_to(A, X, points, metric):
+    ''' Distances from the rows of A to the points X[points]
+        (len(A) x len(points)).  For metric='precomputed', A holds rows of
+        the distance matrix X.
+    '''
+    points = np.atleast_1d(points)
+
+    if metric == 'precomputed':
+        return A[:, points]
+
+    return get_metric(metric)(A, X[points])
+
+
+def maxmin_landmarks(X, n_landmarks, metric='euclidean', start=None,
+                     random_state=None):
+    ''' Greedy max-min (farthest point) landmark selection.
+        INPUT: NxD numpy array (NxN for metric='precomputed'), number of
+               landmarks, metric, index of the first landmark (random when
+               None)
+        OUTPUT: landmark indices, insertion radius of each landmark (its
+                distance to the earlier landmarks, inf for the first) and
+                the covering radius (largest distance from any point to its
+                nearest landmark)
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    n_landmarks = min(int(n_landmarks), n)
+
+    if start is None:
+        start = check_random_state(random_state).integers(n)
+
+    landmarks = np.empty(n_landmarks, dtype=np.int64)
+    radii = np.empty(n_landmarks)
+    nearest = np.full(n, np.inf)
+
+    # Euclidean distances to one point are a single matrix-vector product
+    # once the squared norms are known; work with squared distances.
+    squared = metric == 'euclidean'
+    if squared:
+        sq_norms = np.einsum('ij,ij->i', X, X)
+
+    current, radius = start, np.inf
+    for i in range(n_landmarks):
+        landmarks[i] = current
+        radii[i] = radius
+
+        if squared:
+            d = np.dot(X, -2.0 * X[current])
+            d += sq_norms
+            d += sq_norms[current]
+        else:
+            d = _distances_to(X, X, current, metric).ravel()
+        np.minimum(nearest, d, out=nearest)
+
+        current = np.argmax(nearest)
+        radius = nearest[current]
+        if squared:
+            radius = np.sqrt(max(radius, 0.0))
+
+    covering_radius = float(nearest.max()) if n else 0.0
+    if squared:
+        covering_radius = np.sqrt(max(covering_radius, 0.0))
+
+    return landmarks, radii, covering_radius
+
+
+def witness_edges(X, landmarks, radius, nu=2, metric='euclidean',
+                  n_neighbors=None, chunk_size=None):
+    ''' Edges of the lazy witness complex on 'landmarks' up to 'radius'.
+
+        Landmarks a and b are joined at time
+            min over witnesses w of max(d(w, a), d(w, b)) - m_nu(w),
+        where m_nu(w) is the distance from w to its nu-th nearest landmark
+        (0 for nu=0).  Every row of X is a witness.  With 'n_neighbors',
+        each witness only vouches for pairs among its n_neighbors nearest
+        landmarks.  That is much cheaper, but long edges are then missing, so
+        large cycles may never be filled in (they show up as essential).
+
+        OUTPUT: Mx2 array of landmark positions (i < j), length M values
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    L = len(landmarks)
+    if not 0 <= nu <= L:
+        raise ValueError('nu must be between 0 and the number of landmarks '
+                         '({}), got {}'.format(L, nu))
+    k = L if n_neighbors is None else min(int(n_neighbors), L)
+
+    if chunk_size is None:
+        chunk_size = max(1, 2**22 // max(L * k, 1))
+
+    times = np.full(L * L, np.inf)
+    for start in range(0, len(X), chunk_size):
+        D = _distances_to(X[start:start + chunk_size], X, landmarks, metric)
+
+        if nu > 0:
+            m = np.partition(D, nu - 1, axis=1)[:, nu - 1]
+        else:
+            m = np.zeros(len(D))
+
+        if k < L:
+            nearest = np.argpartition(D, k - 1, axis=1)[:, :k]
+            D = np.take_along_axis(D, nearest, axis=1)
+        else:
+            nearest = np.broadcast_to(np.arange(L), D.shape)
+
+        t = np.maximum(D[:, :, np.newaxis], D[:, np.newaxis, :])
+        t -= m[:, np.newaxis, np.newaxis]
+
+        if k == L:
+            np.minimum(times, t.min(axis=0).ravel(), out=times)
+        else:
+            pair = nearest[:, :, np.newaxis] * L + nearest[:, np.newaxis, :]
+            np.minimum.at(times, pair.ravel(), t.ravel())
+
+    times = np.maximum(times.reshape(L, L), 0.0)
+    i, j = np.nonzero(np.triu(times <= radius, k=1))
+
+    return np.c_[i, j], times[i, j]
+
+
+def witness_complex(X, landmarks, max_dimension=2, skeleton=1.7, nu=2,
+                    metric='euclidean', n_neighbors=None):
+    ''' Lazy witness complex (the flag complex of 'witness_edges') over the
+        landmarks, as per-dimension arrays of landmark positions and values.
+    '''
+    edges, lengths = witness_edges(X, landmarks, skeleton, nu=nu,
+                                   metric=metric, n_neighbors=n_neighbors)
+    graph = NeighborhoodGraph(len(landmarks), edges, lengths)
+
+    return expand_cliques(graph, max_dimension)
@@ -2,27 +2,71 @@
     Date: March 6, 2017
 
     Functions for producing a dimensional reduction, or topological network.
-    So far this only includes 'circle_network' which yields a networkx graph
-    with labels colored by given binary classification.
+
+    'Mapper' builds the topological network of a point cloud: a lens maps
+    the points to one or a few values, an overlapping cubical cover of the
+    lens range splits the cloud into overlapping pieces, each piece is
+    clustered, and the clusters become nodes, joined when they share points
+    (the nerve of the cover of the data by clusters).  Cover membership and
+    cluster membership are sparse point x element matrices, so the nerve
+    is one sparse product.  The default clustering is single linkage at a
+    scale 'eps': the radius graph at 'eps' is built once for the whole
+    cloud, and the clusters of every cover element at once are the
+    connected components of its lift to (point, element) pairs.  Any
+    scikit-learn style clusterer can be used instead; the cover elements
+    are then clustered in parallel worker processes.
+
+    'circle_network' yields a networkx graph of the persistent cycles
+    instead, with nodes coloured by label.
+
+    Example:
+        >>> mapper = Mapper(lens='pca', cover=CubicalCover(10, 0.3), eps=0.2)
+        >>> network = mapper.fit(X)
+        >>> network.label_counts(y)
+        >>> g = network.to_networkx(labels=y)
 
     TODO:
         * Work on having better layout.
-        * Add more label schemes.
         * Think of how to best represent persistence.
 
 '''
 
+import multiprocessing
+
+import numpy as np
 import networkx as nx
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from .diagram import as_diagram
+from .distances import get_metric
+from .rips import radius_edges
+from .utils import concatenated_ranges
 
 
-def circle_network(dynamic_persistence, smap, evaluator, labels=None):
+def label_colors(labels):
+    ''' Colour of each distinct label: blue and red for binary 0/1 labels
+        (as always), otherwise matplotlib's colour cycle, 'C0', 'C1', ...
+        OUTPUT: dict label -> colour
+    '''
+    classes = sorted(set(np.asarray(labels).tolist()))
+    if set(classes) <= set([0, 1]):
+        return {0: 'b', 1: 'r'}
+
+    return dict((label, 'C{}'.format(i % 10))
+                for i, label in enumerate(classes))
+
+
+def circle_network(dynamic_persistence, smap=None, evaluator=None,
+                   labels=None):
     ''' Creates a topological netowrk, based on the persistent features found
         in the data.
-        INPUT: 
+        INPUT: diagram with cycles, run DynamicPersistence or the legacy
+               (dynamic_persistence, smap, evaluator) triple; labels
         OUTPUT: nx.Graph, list (colors of nodes)
 
         Example:
-            >>> g, c = circle_network(dp, smap, rips.eval, labels=y)
+            >>> g, c = circle_network(dp.diagram, labels=y)
             >>> pos = nx.spring_layout(graphs)
             >>> nx.draw_networkx(graphs, node_color=colors, pos=pos)
 
@@ -31,54 +75,363 @@ def circle_network(dynamic_persistence, smap, evaluator, labels=None):
     graph = nx.Graph()
     colors_dict = dict()
 
-    label_colors = {0: 'b', 1: 'r'}
+    if labels is not None:
+        colors_of = label_colors(labels)
+
+    diagram = as_diagram(dynamic_persistence, smap, evaluator).finite()
+
+    for i, simplices, values in diagram.cycles():
+        if diagram.persistence[i] < 0.001: continue
 
-    for sigma in dynamic_persistence:
-        if not sigma.sign():
-            bd = evaluator(smap[sigma]) - evaluator(smap[sigma.pair()])
+        dim = diagram.dimension[i]
 
-            if bd < 0.001: continue
+        for pair_vertices, value in zip(simplices.tolist(), values):
+            if len(pair_vertices) > 1:
+                v1 = pair_vertices[0]
+                v2 = pair_vertices[1]
+                graph.add_edge(v1, v2, weight=1/(value + 0.1))
 
-            cycle = [smap[ii] for ii in sigma.cycle]
-            chain = [smap[ii] for ii in sigma.chain]
-            if not cycle or not chain: continue
+                if labels is not None:
+                    colors_dict[v1] = colors_of[labels[v1]]
+                    colors_dict[v2] = colors_of[labels[v2]]
+                else:
+                    colors_dict[v1] = 'b' if dim == 0 else 'r'
+                    colors_dict[v2] = 'b' if dim == 0 else 'r'
+            elif len(pair_vertices) == 1:
+                v = pair_vertices[0]
+                graph.add_node(v)
 
-            dim = chain[0].dimension()
+                if labels is not None:
+                    colors_dict[v] = colors_of[labels[v]]
+                else:
+                    colors_dict[v] = 'b' if dim == 0 else 'r'
 
-            for s in cycle:
-                pair_vertices = [v for v in s.vertices]
+    # Isolated vertices (H0 births) are tied together in a star hanging off
+    # the rest of the graph, so the layout keeps them close by.
+    disconnected = [n for n in graph.nodes() if graph.degree(n) == 0]
+    connected = [n for n in graph.nodes() if graph.degree(n) > 0]
 
-                if len(pair_vertices) > 1:
-                    v1 = pair_vertices[0]
-                    v2 = pair_vertices[1]
-                    graph.add_edge(v1, v2, weight=1/(evaluator(s) + 0.1))
+    if disconnected:
+        start_connector = disconnected[0]
+        for node in disconnected[1:]:
+            graph.add_edge(start_connector, node, weight=10)
+        if connected:
+            graph.add_edge(connected[0], start_connector, weight=0.1)
 
-                    if labels is not None:
-                        colors_dict[v1] = label_colors[labels[v1]]
-                        colors_dict[v2] = label_colors[labels[v2]]
-                    else:
-                        colors_dict[v1] = 'b' if dim == 1 else 'r'
-                        colors_dict[v2] = 'b' if dim == 1 else 'r'
-                elif len(pair_vertices) == 1:
-                    v = pair_vertices[0]
-                    graph.add_node(v)
+    colors = [colors_dict[n] for n in graph.nodes()]
 
-                    if labels is not None:
-                        colors_dict[v] = label_colors[labels[v]]
-                    else:
-                        colors_dict[v] = 'b' if dim == 1 else 'r'
+    return graph, colors
 
-    disconnected_indices = [i for i,n in enumerate(graph.adjacency_list())
-                              if not n]
-    connected_indices = [i for i,n in enumerate(graph.adjacency_list())
-                           if n]
 
-    start_connector = disconnected_indices[0]
-    for idx in disconnected_indices[1:]:
-        graph.add_edge(start_connector, idx, weight=10)
+def _eccentricity(X, metric='euclidean', chunk_size=1024):
+    ''' Mean distance from each point to all the others. '''
+    if metric == 'precomputed':
+        return np.asarray(X).mean(axis=1)
 
-    graph.add_edge(connected_indices[0], idx, weight=0.1)
+    f = get_metric(metric)
 
-    colors = [colors_dict[n] for n in graph.nodes()]
+    return np.concatenate([f(X[start:start + chunk_size], X).mean(axis=1)
+                           for start in range(0, len(X), chunk_size)])
 
-    return graph, colors
+
+def _pca(X, metric='euclidean', n_components=1):
+    ''' Projection on the leading principal components. '''
+    centred = X - X.mean(axis=0)
+    _, _, Vt = np.linalg.svd(centred, full_matrices=False)
+
+    return np.dot(centred, Vt[:n_components].T)
+
+
+LENSES = {'eccentricity': _eccentricity,
+          'pca': _pca}
+
+
+def _cross(ptr_a, index_a, ptr_b, index_b, n_b):
+    ''' Per point, every pair of an 'a' and a 'b' index (CSR rows),
+        combined as a * n_b + b.
+    '''
+    count_a, count_b = np.diff(ptr_a), np.diff(ptr_b)
+    counts = count_a * count_b
+
+    point = np.repeat(np.arange(len(counts)), counts)
+    within = concatenated_ranges(np.zeros(len(counts), dtype=np.int64),
+                                 counts)
+    i = ptr_a[point] + within // count_b[point]
+    j = ptr_b[point] + within % count_b[point]
+
+    ptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=ptr[1:])
+
+    return ptr, index_a[i] * n_b + index_b[j]
+
+
+class CubicalCover(object):
+    ''' Cover of the lens range by overlapping hypercubes: every lens
+        coordinate is split into n_intervals equal intervals, each widened
+        by 'overlap' (a fraction of its length) shared with its neighbours.
+    '''
+
+    def __init__(self, n_intervals=10, overlap=0.3):
+        if overlap < 0 or overlap >= 1:
+            raise ValueError('overlap must be in [0, 1), got {!r}'
+                             .format(overlap))
+        self.n_intervals = n_intervals
+        self.overlap = overlap
+
+    def fit(self, values):
+        values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+        self.low_ = values.min(axis=0)
+        self.step_ = (values.max(axis=0) - self.low_) / self.n_intervals
+        self.step_[self.step_ == 0] = 1.0
+
+        return self
+
+    @property
+    def n_elements(self):
+        return self.n_intervals ** len(self.low_)
+
+    def membership(self, values):
+        ''' Sparse (points x cover elements) boolean matrix. '''
+        values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+        n = self.n_intervals
+        pad = self.overlap * self.step_ / 2.0
+
+        ptr = np.arange(len(values) + 1)
+        elements = np.zeros(len(values), dtype=np.int64)
+        for d in range(values.shape[1]):
+            u = (values[:, d] - self.low_[d]) / self.step_[d]
+            first = np.clip(np.ceil(u - pad[d] / self.step_[d] - 1), 0, n - 1)
+            last = np.clip(np.floor(u + pad[d] / self.step_[d]), 0, n - 1)
+            counts = (last - first + 1).astype(np.int64)
+
+            interval_ptr = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum(counts, out=interval_ptr[1:])
+            intervals = concatenated_ranges(first.astype(np.int64), counts)
+
+            ptr, elements = _cross(ptr, elements, interval_ptr, intervals, n)
+
+        return sparse.csr_matrix((np.ones(len(elements), dtype=bool),
+                                  elements, ptr),
+                                 shape=(len(values), self.n_elements))
+
+
+_worker_X = None
+
+
+def _init_worker(X):
+    global _worker_X
+    _worker_X = X
+
+
+def _cluster_elements(args):
+    clusterer, groups = args
+
+    return [clusterer.fit_predict(_worker_X[points]) for points in groups]
+
+
+class MapperGraph(object):
+    ''' A Mapper network: node i is a cluster of the points
+        membership[:, i].nonzero() inside cover element node_element[i];
+        'edges' join clusters sharing points, 'weights' counts them.
+    '''
+
+    def __init__(self, membership, node_element, edges, weights):
+        self.membership = membership.tocsc()
+        self.node_element = node_element
+        self.edges = edges
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.node_element)
+
+    def __repr__(self):
+        return '<MapperGraph: {} nodes, {} edges>'.format(len(self),
+                                                          len(self.edges))
+
+    @property
+    def node_size(self):
+        return np.diff(self.membership.indptr)
+
+    def node_points(self, i):
+        return self.membership.indices[self.membership.indptr[i]:
+                                       self.membership.indptr[i + 1]]
+
+    def node_mean(self, values):
+        ''' Mean of per-point values (N or NxK) over each node. '''
+        values = np.asarray(values, dtype=np.float64)
+        total = self.membership.T.dot(values)
+        size = self.node_size.astype(np.float64)
+
+        return total / size.reshape((-1,) + (1,) * (values.ndim - 1))
+
+    def label_counts(self, labels):
+        ''' How many points of each label every node holds, for any set
+            of labels.
+            OUTPUT: (n_nodes, n_classes) counts, the sorted classes
+        '''
+        classes, codes = np.unique(labels, return_inverse=True)
+        one_hot = sparse.csr_matrix((np.ones(len(codes)), codes.ravel(),
+                                     np.arange(len(codes) + 1)),
+                                    shape=(len(codes), len(classes)))
+        counts = self.membership.T.dot(one_hot).toarray()
+
+        return counts.astype(np.int64), classes
+
+    def majority_label(self, labels):
+        counts, classes = self.label_counts(labels)
+
+        return classes[counts.argmax(axis=1)]
+
+    def to_networkx(self, labels=None):
+        ''' nx.Graph with 'size' (and with labels, 'label', the majority
+            label, and 'color', from 'label_colors') on every node and
+            'weight' on every edge.
+        '''
+        graph = nx.Graph()
+        size = self.node_size
+        for i in range(len(self)):
+            graph.add_node(i, size=int(size[i]),
+                           element=int(self.node_element[i]))
+
+        if labels is not None:
+            colors = label_colors(labels)
+            for i, label in enumerate(self.majority_label(labels)):
+                graph.nodes[i]['label'] = label
+                graph.nodes[i]['color'] = colors[label]
+
+        graph.add_weighted_edges_from(
+            (int(u), int(v), int(w))
+            for (u, v), w in zip(self.edges, self.weights))
+
+        return graph
+
+
+class Mapper(object):
+    ''' Builds Mapper networks.
+        INPUT: lens (a name in LENSES, a callable X -> values or an array of
+               precomputed values), cover (CubicalCover(10, 0.3) when None),
+               single linkage scale 'eps', or a scikit-learn style
+               'clusterer' (anything with fit_predict; label -1 is noise),
+               metric, worker processes for the clusterer (all cores when
+               None, in-process when 1)
+    '''
+
+    def __init__(self, lens='pca', cover=None, eps=None, clusterer=None,
+                 metric='euclidean', n_jobs=1):
+        if eps is None and clusterer is None:
+            raise ValueError('Give the clustering scale eps or a clusterer')
+        self.lens = lens
+        self.cover = cover if cover is not None else CubicalCover()
+        self.eps = eps
+        self.clusterer = clusterer
+        self.metric = metric
+        self.n_jobs = n_jobs
+
+    def lens_values(self, X):
+        if callable(self.lens):
+            return np.asarray(self.lens(X))
+        if isinstance(self.lens, str):
+            if self.lens not in LENSES:
+                raise ValueError('Unknown lens {!r}; expected one of {}'
+                                 .format(self.lens, sorted(LENSES)))
+            return LENSES[self.lens](X, self.metric)
+
+        return np.asarray(self.lens)
+
+    def fit(self, X):
+        ''' OUTPUT: MapperGraph '''
+        X = np.asarray(X)
+        values = self.lens_values(X)
+        self.cover.fit(values)
+        cover = self.cover.membership(values).tocsr()
+
+        if self.clusterer is None:
+            clusters = self._single_linkage(X, cover)
+        else:
+            clusters = self._clustered(X, cover.tocsc())
+
+        return self._nerve(clusters, len(X))
+
+    def _single_linkage(self, X, cover):
+        ''' Clusters of every cover element at once: vertices are the
+            (point, element) memberships, joined when the points are within
+            eps and share the element.
+            OUTPUT: point, element and cluster label of every membership
+        '''
+        edges, _ = radius_edges(X, self.eps, self.metric)
+
+        cover.sort_indices()
+        point = np.repeat(np.arange(cover.shape[0]), np.diff(cover.indptr))
+        element = cover.indices
+        key = point * cover.shape[1] + element
+
+        # Elements shared by the two ends of every edge.
+        shared = cover[edges[:, 0]].multiply(cover[edges[:, 1]]).tocoo()
+        u = edges[shared.row, 0] * cover.shape[1] + shared.col
+        v = edges[shared.row, 1] * cover.shape[1] + shared.col
+        u, v = np.searchsorted(key, u), np.searchsorted(key, v)
+
+        n = len(key)
+        lifted = sparse.coo_matrix((np.ones(len(u), dtype=bool), (u, v)),
+                                   shape=(n, n))
+        _, labels = connected_components(lifted, directed=False)
+
+        return point, element, labels
+
+    def _clustered(self, X, cover):
+        ''' Clusters every cover element with the clusterer, on a pool of
+            workers that share X.
+        '''
+        elements = np.flatnonzero(np.diff(cover.indptr))
+        groups = [cover.indices[cover.indptr[e]:cover.indptr[e + 1]]
+                  for e in elements]
+        n_jobs = self.n_jobs or multiprocessing.cpu_count()
+        size = max(1, len(groups) // (4 * n_jobs))
+        tasks = [(self.clusterer, groups[start:start + size])
+                 for start in range(0, len(groups), size)]
+
+        if n_jobs == 1:
+            _init_worker(X)
+            results = list(map(_cluster_elements, tasks))
+        else:
+            pool = multiprocessing.Pool(n_jobs, initializer=_init_worker,
+                                        initargs=(X,))
+            try:
+                results = pool.map(_cluster_elements, tasks)
+            finally:
+                pool.terminate()
+                pool.join()
+
+        labels = [np.asarray(l) for block in results for l in block]
+        point = np.concatenate(groups) if groups else np.empty(0, np.int64)
+        element = np.repeat(elements, [len(g) for g in groups])
+        labels = np.concatenate(labels) if labels else point
+
+        # Cluster labels are only unique within an element.
+        keep = labels >= 0
+        point, element, labels = point[keep], element[keep], labels[keep]
+        _, labels = np.unique(np.c_[element, labels], axis=0,
+                              return_inverse=True)
+
+        return point, element, labels.ravel()
+
+    def _nerve(self, clusters, n_points):
+        ''' Nodes are the clusters; two are joined when they share points,
+            found as the off-diagonal of M^T M for the point x node
+            membership M.
+        '''
+        point, element, labels = clusters
+        _, node = np.unique(labels, return_inverse=True)
+        node = node.ravel()
+        n_nodes = int(node.max()) + 1 if len(node) else 0
+
+        node_element = np.zeros(n_nodes, dtype=np.int64)
+        node_element[node] = element
+
+        membership = sparse.csr_matrix(
+                        (np.ones(len(point), dtype=np.int64), (point, node)),
+                        shape=(n_points, n_nodes))
+        shared = sparse.triu(membership.T.dot(membership), k=1).tocoo()
+
+        return MapperGraph(membership, node_element,
+                           np.c_[shared.row, shared.col], shared.data)
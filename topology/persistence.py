@@ -1,65 +1,332 @@
-from time import time
+import numbers
 
 import numpy as np
-from dionysus import PairwiseDistances
-from dionysus import ExplicitDistances
-from dionysus import Rips
-from dionysus import Filtration
-from dionysus import DynamicPersistenceChains
+try:
+    from dionysus import Rips
+    from dionysus import Simplex
+    from dionysus import Filtration
+    from dionysus import DynamicPersistenceChains
+    from dionysus import data_dim_cmp
+except ImportError:
+    # Only the numpy engine is available.
+    Rips = None
 
+from .alpha import alpha_complex
+from .cache import PersistenceCache
+from .components import component_persistence
+from .components import graph_components
+from .diagram import PersistenceDiagram
+from .distances import CondensedDistances
+from .estimate import budget_simplices
+from .estimate import check_budget
+from .estimate import estimate_complex
+from .estimate import largest_skeleton
+from .filtration import SimplexFiltration
+from .landmarks import maxmin_landmarks
+from .landmarks import witness_edges
+from .profiling import RunStats
+from .profiling import timeit
+from .reduction import MatrixPersistence
+from .rips import NeighborhoodGraph
+from .rips import expand_cliques
+from .rips import radius_edges
+from .sparse_rips import sparse_block
+from .sparse_rips import sparse_rips_edges
+from .storage import save_run
 
-def timeit(method):
-    def timed(*args, **kw):
-        start = time()
-        result = method(*args, **kw)
-        end = time()
 
-        print "{0}: time {1:0.2f}s".format(method.__name__, end-start)
+CONSTRUCTIONS = ('oracle', 'neighbors', 'alpha')
+ENGINES = ('dionysus', 'numpy')
 
-    return timed
+
+def _simplex_data(simplex):
+    return simplex.data
 
 
 class DynamicPersistence(object):
-    ''' Container class for creating dynamic persistence chains '''
+    ''' Container class for creating dynamic persistence chains.
+
+        construction='oracle' hands the full distance matrix to Dionysus'
+        Rips, which considers every pair.  construction='neighbors' only
+        finds the pairs within 'skeleton' (KD-tree radius query) and expands
+        the cliques of that sparse graph, never holding n^2 distances; the
+        diagrams are the same.  Either way 'evaluator' gives the filtration
+        value of a simplex.
+
+        construction='alpha' (1 to 3 dimensional euclidean points) replaces
+        the Rips complex by the alpha complex of the Delaunay triangulation
+        (see 'alpha'): the same homotopy types as the union of balls, with
+        O(n) simplices.  Its values are squared radii, and 'skeleton',
+        budgets and landmarks do not apply.
+
+        epsilon in (0, 1) replaces the Rips complex by the sparse Rips
+        filtration of a greedy permutation (see 'sparse_rips'), whose
+        diagram is within a factor 1 / (1 - epsilon) of the exact one and
+        whose size grows linearly with the number of points.  The sizes by
+        dimension are in 'simplex_counts_' (for every construction), and
+        the insertion radii in 'insertion_radii_'.  Budgets and the
+        component split do not apply.
+
+        engine='dionysus' pairs with Dionysus' DynamicPersistenceChains.
+        engine='numpy' uses 'reduction.MatrixPersistence' instead: a sparse
+        column reduction with clearing that needs no Dionysus build, and
+        which only keeps cycles and chains when chains=True (with
+        chains=False it reduces the coboundary and returns just the
+        pairing).  Both engines expose the same 'dynamic_persistence',
+        'simplex_map' and 'evaluator' interface.  The numpy engine always
+        builds its complex from the sparse neighbourhood graph.
+
+        With n_landmarks set, that many landmarks are picked by max-min
+        sampling and the lazy witness complex over them (witnessed by all of
+        X, see 'landmarks.witness_edges') replaces the Rips complex.  Vertex
+        indices then refer to 'landmarks_', positions in X, and
+        'covering_radius_' bounds how far any point is from a landmark.
+        By default every witness vouches for all pairs of landmarks, which
+        costs O(N L^2): 32 s for 2x10^5 points and 200 landmarks.  With
+        witness_neighbors=k only pairs among each witness' k nearest
+        landmarks are considered, O(N k^2) (2.3 s with k=8, the same
+        diagram there), at the risk of missing long edges, so that large
+        cycles may stay essential.
+
+        'run' reads the pairing once into 'diagram', a columnar
+        PersistenceDiagram (with representative cycles unless the numpy
+        engine ran with chains=False), which the barcode, feature and
+        network code use.
+
+        With a cache (a PersistenceCache, or a directory for one) 'run'
+        first looks the diagram up by the input and parameters; on a hit only
+        'diagram' is set and the Rips pipeline is skipped, so
+        'dynamic_persistence', 'simplex_map' and friends stay None.
+
+        With stats=True (or a RunStats, e.g. one with logging hooks) every
+        stage records its wall and CPU time, peak memory growth and sizes
+        in 'stats'; see 'profiling'.  It is off (None) by default.
+
+        max_simplices and max_memory (bytes) set a budget: before the
+        complex is generated its size is estimated from a sample of vertex
+        neighbourhoods (see 'estimate'), and 'run' raises ComplexTooLarge
+        if it would not fit.  skeleton='auto' instead picks the largest
+        skeleton that fits, and stores it in 'skeleton'.  The estimate is
+        kept in 'complex_estimate_'.  Budgets only apply to Rips complexes,
+        not to landmark (witness) runs.
+
+        With the numpy engine and n_jobs other than 1 (None for all cores),
+        the neighbourhood graph is split into connected components
+        ('components_' holds each vertex's label) and, when there are
+        several, each is expanded and paired on its own in a worker pool
+        (see 'components').  The diagram is the same; 'filtration',
+        'dynamic_persistence' and 'simplex_map' stay None, and the diagram
+        carries no filtration indices.
+    '''
+
+    def __init__(self, X, y=None, max_dimension=2, skeleton=1.7,
+                 metric='euclidean', dtype=np.float64, distance_file=None,
+                 construction='oracle', engine='dionysus', chains=True,
+                 n_landmarks=None, nu=2, witness_neighbors=None,
+                 random_state=None, cache=None, stats=None,
+                 max_simplices=None, max_memory=None, n_jobs=1,
+                 epsilon=None):
+        if construction not in CONSTRUCTIONS:
+            raise ValueError('construction must be one of {}, got {!r}'
+                             .format(CONSTRUCTIONS, construction))
+        if engine not in ENGINES:
+            raise ValueError('engine must be one of {}, got {!r}'
+                             .format(ENGINES, engine))
+        if skeleton == 'auto' and max_simplices is None and \
+           max_memory is None:
+            raise ValueError("skeleton='auto' needs max_simplices or "
+                             "max_memory")
+        if n_landmarks is not None and not 0 <= nu <= n_landmarks:
+            raise ValueError('nu must be between 0 and n_landmarks ({}), got '
+                             '{}'.format(n_landmarks, nu))
+        if skeleton == 'auto' and n_landmarks is not None:
+            raise ValueError("skeleton='auto' is not available with "
+                             "landmarks")
+        if construction == 'alpha' and (metric != 'euclidean' or
+                                        n_landmarks is not None):
+            raise ValueError("construction='alpha' needs euclidean points "
+                             "and no landmarks")
+        if epsilon is not None and (construction == 'alpha' or
+                                    n_landmarks is not None):
+            raise ValueError('epsilon (sparse Rips) does not apply to alpha '
+                             'or landmark complexes')
+        if skeleton == 'auto' and (construction == 'alpha' or
+                                   epsilon is not None):
+            raise ValueError("skeleton='auto' needs the exact Rips complex")
+        if engine == 'dionysus' and Rips is None:
+            raise ImportError("engine='dionysus' requires the Dionysus "
+                              "Python bindings; use engine='numpy'")
 
-    def __init__(self, X, y=None, max_dimension=2, skeleton=1.7):
         self.X_ = X
         self.y_ = y
         self.max_dimension = max_dimension
         self.skeleton = skeleton
+        self.metric = metric
+        self.dtype = dtype
+        self.distance_file = distance_file
+        self.construction = construction
+        self.engine = engine
+        self.chains = chains
+        self.n_landmarks = n_landmarks
+        self.nu = nu
+        self.witness_neighbors = witness_neighbors
+        self.random_state = random_state
+        self.max_simplices = max_simplices
+        self.max_memory = max_memory
+        self.n_jobs = n_jobs
+        self.epsilon = epsilon
+        self.complex_estimate_ = None
+        self.components_ = None
+        self.insertion_radii_ = None
+        self.simplex_counts_ = None
+
+        if cache is not None and not isinstance(cache, PersistenceCache):
+            cache = PersistenceCache(cache)
+        self.cache = cache
+
+        if stats is True:
+            stats = RunStats()
+        elif stats is False:
+            stats = None
+        self.stats = stats
+
+        self.landmarks_ = None
+        self.covering_radius_ = None
 
         self.distances = None
-        self._set_distances(X)
+        # Sparse Rips never reads the n^2 distances.
+        if construction == 'oracle' and n_landmarks is None and \
+           epsilon is None:
+            self._set_distances(X)
 
+        self.graph = None
+        self.evaluator = None
         self.rips = None
         self.filtration = None
         self.dynamic_persistence = None
         self.simplex_map = None
+        self.diagram = None
 
     def _set_distances(self, X):
-        d = self._pairwise_distances(X.tolist())
-        d = self._explicit_distances(d)
+        self._pairwise_distances(X)
+
+
+    @timeit
+    def _pairwise_distances(self, X):
+        self.distances = CondensedDistances.from_points(
+                            X, metric=self.metric, dtype=self.dtype,
+                            filename=self.distance_file)
+
+
+    @timeit
+    def _select_landmarks(self):
+        self.landmarks_, _, self.covering_radius_ = maxmin_landmarks(
+                            self.X_, self.n_landmarks, metric=self.metric,
+                            random_state=self.random_state)
+
+
+    @timeit
+    def _check_budget(self):
+        options = dict(metric=self.metric, engine=self.engine,
+                       chains=self._tracks_chains(),
+                       random_state=self.random_state)
+        if self.distances is not None:
+            options['distance_bytes'] = self.distances.condensed.nbytes
+
+        if self.skeleton == 'auto':
+            self.skeleton, self.complex_estimate_ = largest_skeleton(
+                                self.X_, self.max_dimension,
+                                max_simplices=self.max_simplices,
+                                max_memory=self.max_memory, **options)
+            return
+
+        stop_above = budget_simplices(self.max_simplices, self.max_memory,
+                                      options['engine'], options['chains'],
+                                      options.get('distance_bytes', 0))
+        self.complex_estimate_ = estimate_complex(
+                                    self.X_, self.skeleton,
+                                    self.max_dimension,
+                                    stop_above=stop_above, **options)
+        check_budget(self.complex_estimate_, self.max_simplices,
+                     self.max_memory)
+
+
+    @timeit
+    def _neighborhood_graph(self):
+        if self.epsilon is not None:
+            edges, lengths, self.insertion_radii_ = sparse_rips_edges(
+                                self.X_, self.epsilon, self.skeleton,
+                                metric=self.metric)
+            n_vertices = len(self.X_)
+        elif self.landmarks_ is not None:
+            edges, lengths = witness_edges(self.X_, self.landmarks_,
+                                           self.skeleton, nu=self.nu,
+                                           metric=self.metric,
+                                           n_neighbors=self.witness_neighbors)
+            n_vertices = len(self.landmarks_)
+        else:
+            edges, lengths = radius_edges(self.X_, self.skeleton,
+                                          metric=self.metric,
+                                          distances=self.distances)
+            n_vertices = len(self.X_)
+
+        self.graph = NeighborhoodGraph(n_vertices, edges, lengths)
 
 
     @timeit
-    def _pairwise_distances(self, X_list):
-        self.distances = PairwiseDistances(X_list)
+    def _find_components(self):
+        self.components_ = graph_components(self.graph)
 
 
     @timeit
-    def _explicit_distances(self, d):
-        self.distances = ExplicitDistances(self.distances)
+    def _pair_components(self):
+        self.diagram = component_persistence(self.graph, self.components_,
+                                             self.max_dimension, self.chains,
+                                             self.n_jobs)
 
 
     @timeit
     def _rips_generate(self):
-        self.rips.generate(self.max_dimension, self.skeleton,
-                           self.filtration.append)
+        if self.rips is not None:
+            self.rips.generate(self.max_dimension, self.skeleton,
+                               self.filtration.append)
+            return
+
+        if self.construction == 'alpha':
+            simplices, values = alpha_complex(self.X_, self.max_dimension)
+        else:
+            block = None
+            if self.epsilon is not None:
+                block = sparse_block(self.insertion_radii_, self.epsilon)
+            simplices, values = expand_cliques(self.graph,
+                                               self.max_dimension, block)
+        self.simplex_counts_ = [len(S) for S in simplices]
+
+        if self.engine == 'numpy':
+            self.filtration = SimplexFiltration(simplices, values)
+            return
+
+        # Append already in (value, dimension) order, so the sort below has
+        # little to do.
+        dimension = np.repeat(np.arange(len(values)),
+                              [len(v) for v in values])
+        row = np.concatenate([np.arange(len(v)) for v in values])
+        value = np.concatenate(values)
+
+        for ii in np.lexsort((dimension, value)):
+            vertices = simplices[dimension[ii]][row[ii]]
+            self.filtration.append(Simplex([int(v) for v in vertices],
+                                           float(value[ii])))
 
 
     @timeit
     def _filtration_sort(self):
-        self.filtration.sort(self.rips.cmp)
+        if self.engine == 'numpy':
+            self.filtration.sort()
+        elif self.rips is not None:
+            self.filtration.sort(self.rips.cmp)
+        else:
+            self.filtration.sort(data_dim_cmp)
 
 
     @timeit
@@ -73,15 +340,152 @@ class DynamicPersistence(object):
                             self.filtration)
 
 
+    def _stage_counts(self, stage):
+        ''' Sizes reported with the timings of 'stage' (see 'profiling'). '''
+        if stage == '_check_budget':
+            return {'skeleton': self.skeleton,
+                    'estimated_simplices': self.complex_estimate_.simplices}
+        if stage == '_pairwise_distances':
+            return {'points': len(self.distances)}
+        if stage == '_select_landmarks':
+            return {'landmarks': len(self.landmarks_)}
+        if stage == '_neighborhood_graph':
+            return {'edges': len(self.graph.edges)}
+        if stage == '_find_components':
+            return {'components': int(self.components_.max()) + 1
+                                  if len(self.components_) else 0}
+        if stage == '_pair_components':
+            return {'diagram_pairs': len(self.diagram)}
+        if stage in ('_rips_generate', '_filtration_sort',
+                     '_make_simplex_map'):
+            return {'simplices': len(self.filtration)}
+        if stage == '_pair_simplices':
+            return {'pairs': self._count_pairs()}
+        if stage in ('run', '_make_diagram') and self.diagram is not None:
+            return {'diagram_pairs': len(self.diagram)}
+
+        return None
+
+    def _count_pairs(self):
+        if self.engine == 'numpy':
+            return len(self.dynamic_persistence.pairs()[0])
+
+        # Only walked when profiling.
+        return sum(1 for node in self.dynamic_persistence if not node.sign())
+
+
+    def _tracks_chains(self):
+        ''' Whether the run tracks chains, and so its diagram has cycles.
+        '''
+        return self.engine == 'dionysus' or self.chains
+
+
+    def _cache_key(self):
+        ''' Cache key of the input and parameters, or None when the result
+            is not reproducible (landmarks or an 'auto' skeleton drawn
+            without an integer seed) or the run needs cycles the cache does
+            not keep.
+        '''
+        if self._tracks_chains() and not self.cache.cycles:
+            return None
+
+        sampled = self.n_landmarks is not None or self.skeleton == 'auto'
+        if sampled and not isinstance(self.random_state,
+                                      (numbers.Integral, np.integer)):
+            return None
+
+        params = dict(max_dimension=self.max_dimension,
+                      skeleton=self.skeleton,
+                      metric=self.metric,
+                      dtype=np.dtype(self.dtype),
+                      construction=self.construction,
+                      engine=self.engine,
+                      chains=self._tracks_chains(),
+                      n_landmarks=self.n_landmarks)
+        if self.epsilon is not None:
+            params.update(epsilon=self.epsilon)
+        if self.n_landmarks is not None:
+            params.update(nu=self.nu,
+                          witness_neighbors=self.witness_neighbors,
+                          random_state=self.random_state)
+        if self.skeleton == 'auto':
+            params.update(max_simplices=self.max_simplices,
+                          max_memory=self.max_memory,
+                          random_state=self.random_state)
+
+        return self.cache.key(self.X_, **params)
+
+
     @timeit
     def run(self):
-        self.rips = Rips(self.distances)
-        self.filtration = Filtration()
+        key = self._cache_key() if self.cache is not None else None
+        if key is not None:
+            self.diagram = self.cache.get(key, cycles=self._tracks_chains())
+            if self.diagram is not None:
+                return
+
+        self._run_pipeline()
+        self._make_diagram()
+
+        if key is not None:
+            self.cache.put(key, self.diagram)
+
+
+    def save(self, directory, overwrite=False):
+        ''' Writes the run to a directory of .npy files; 'storage.load_run'
+            opens it again, memory-mapped.
+        '''
+        save_run(self, directory, overwrite)
+
+
+    @timeit
+    def _make_diagram(self):
+        if self.dynamic_persistence is None:
+            # Paired by component; the diagram is already merged.
+            return
+
+        cycles = self._tracks_chains()
+        self.diagram = PersistenceDiagram.from_dynamic_persistence(
+                            self, cycles=cycles)
+
+
+    def _run_pipeline(self):
+        if self.engine == 'dionysus':
+            self.filtration = Filtration()
+
+        if self.n_landmarks is not None:
+            self._select_landmarks()
+        elif self.construction != 'alpha' and self.epsilon is None and (
+                self.skeleton == 'auto' or self.max_simplices is not None or
+                self.max_memory is not None):
+            self._check_budget()
+
+        if self.construction == 'alpha':
+            self.evaluator = _simplex_data
+        elif self.distances is not None and self.engine == 'dionysus' and \
+             self.epsilon is None:
+            self.rips = Rips(self.distances)
+            self.evaluator = self.rips.eval
+        else:
+            self._neighborhood_graph()
+            self.evaluator = _simplex_data
+
+        if self.engine == 'numpy' and self.n_jobs != 1 and \
+           self.graph is not None and self.epsilon is None:
+            self._find_components()
+            if self.components_.max(initial=0) > 0:
+                self._pair_components()
+                return
 
         self._rips_generate()
         self._filtration_sort()
 
-        self.dynamic_persistence = DynamicPersistenceChains(self.filtration)
+        if self.engine == 'numpy':
+            self.dynamic_persistence = MatrixPersistence(self.filtration,
+                                                         chains=self.chains)
+        else:
+            self.dynamic_persistence = DynamicPersistenceChains(
+                                        self.filtration)
 
         self._pair_simplices()
         self._make_simplex_map()
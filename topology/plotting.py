@@ -7,19 +7,24 @@
     is a matplotlib version of function in Dionysus
 
 '''
+import itertools
 from collections import defaultdict
 
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.patches import Polygon
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import LineCollection
+from matplotlib.collections import PolyCollection
 #from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-from dionysus import Simplex
 
-from data import circle_2D
-from data import coffee_mug
-from data import pail
+from .data import circle_2D
+from .data import coffee_mug
+from .data import pail
+from .diagram import PersistenceDiagram
+from .diagram import as_diagram
+from .filtration import FiltrationSimplex
+from .filtration import SimplexFiltration
+from .utils import check_random_state
 
 
 def plot_circle_2D():
@@ -73,123 +78,383 @@ def plot_pail_3D():
     return ax
 
 
-def persistent_cycles(dynamic_persistence, smap, evaluator):
-    pcycle = []
-    for sigma in dynamic_persistence:
-        if not sigma.sign():
-            death = evaluator(smap[sigma])
-            birth = evaluator(smap[sigma.pair()])
+def persistent_cycles(dynamic_persistence, smap=None, evaluator=None):
+    ''' ((birth, death), cycle) for every pair living at least 0.001, with
+        the cycle as a list of simplices, for 'animate_persistence' and
+        'draw_complex'.  Takes a diagram with cycles, a run DynamicPersistence
+        or the legacy (dynamic_persistence, smap, evaluator) triple.
+    '''
+    diagram = as_diagram(dynamic_persistence, smap, evaluator).finite()
 
-            if (death - birth) < 0.001:
-                continue
+    pcycle = []
+    for i, simplices, values in diagram.cycles():
+        if diagram.persistence[i] < 0.001:
+            continue
 
-            cycle = [smap[ii] for ii in sigma.cycle]
-            pcycle.append(((birth, death), cycle))
+        cycle = [FiltrationSimplex(vertices, value)
+                 for vertices, value in zip(simplices.tolist(), values)]
+        pcycle.append(((diagram.birth[i], diagram.death[i]), cycle))
 
     return pcycle
 
 
-def animate_persistence(X, pcycle):
-    ''' Saves a series of .png images of the persistent cycles as the 'time'
-        scale changes.
-        INPUT: Nx2 numpy array(dataset), list (from 'persistent_cycles')
-        OUTPUT: None
+def _alive_frames(pcycle, time):
+    ''' Frame range [start, stop) over which each cycle is alive
+        (birth < t < death), by binary search of its birth and death in the
+        sorted frame times, so no frame scans the list of cycles.
+    '''
+    bd = np.array([list(bd) for bd, cycle in pcycle]).reshape(-1, 2)
+    start = np.searchsorted(time, bd[:, 0], side='right')
+    stop = np.searchsorted(time, bd[:, 1], side='left')
 
-        Commands to create the movie:
+    return start, stop
 
-        $ ffmpeg -f image2 -r 1 -i image%04d.png -vcodec mpeg4 -y
-                 animated_persistence.mp4
 
-        $ convert -delay 40 -loop 0 *.png animaion.gif
+def _cycle_segments(X, cycle):
+    ''' Outline of every simplex of a cycle, as line segments. '''
+    segments = []
+    for s in cycle:
+        points = X[np.array(s.vertices)]
+        if len(points) > 2:
+            points = np.vstack([points, points[:1]])
+        segments.append(points)
+
+    return segments
+
+
+class _AnimationFrames(object):
+    ''' One figure with the point cloud and a hidden LineCollection per
+        cycle; a frame only toggles the collections whose cycle was born or
+        died since the previous one and moves the scale indicator.  It uses
+        the Agg canvas directly, so it works in worker processes without a
+        display.
     '''
-    _, ymin, _, _ = _get_padded_box(X, padding=0.0)
 
-    bd = np.array([list(bd) for bd, cycle in pcycle])
+    def __init__(self, X, pcycle, time, figsize=(6.4, 4.8), dpi=100,
+                 linewidth=20):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
 
-    begin_scale = 0.0
-    end_scale = np.max(bd[:,1])
+        self.time = time
+        self.start, self.stop = _alive_frames(pcycle, time)
 
-    time = np.linspace(begin_scale, end_scale, 50)
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot(111)
 
-    for count, t in enumerate(time):
-        ax = draw_complex(X, [])
+        xmin, ymin, xmax, ymax = _get_padded_box(X, padding=0.1)
+        _, self.ymin, _, _ = _get_padded_box(X, padding=0.0)
 
-        for ((birth, death), cycle) in pcycle:
-            if birth < t and death > t:
-                ax = draw_complex(X, cycle, ax=ax)
+        self.collections = []
+        for _, cycle in pcycle:
+            collection = LineCollection(_cycle_segments(X, cycle),
+                                        linewidths=linewidth, colors='C0',
+                                        visible=False)
+            ax.add_collection(collection)
+            self.collections.append(collection)
+        ax.scatter(X[:,0], X[:,1], c='c')
 
         # Sliding scale indicator
-        ax.plot([0.0, t], [ymin, ymin], lw=2)
+        self.scale, = ax.plot([0.0, 0.0], [self.ymin, self.ymin], lw=2)
+        ax.annotate('scale', xy=(0.0, self.ymin+0.01),
+                    xytext=(0.0, self.ymin+0.01))
+
+        ax.set_xlim(xmin, xmax)
+        ax.set_ylim(ymin, ymax)
         ax.set_xlabel('x')
         ax.set_ylabel('y')
         ax.set_title('Persistent Homology')
 
-        plt.annotate('scale', xy=(0.0, ymin+0.01), xytext=(0.0, ymin+0.01))
-        plt.savefig('image{:04d}.png'.format(count))
+        self.alive = np.zeros(len(self.collections), dtype=bool)
+
+    def draw(self, frame):
+        alive = (self.start <= frame) & (frame < self.stop)
+        for i in np.flatnonzero(alive != self.alive):
+            self.collections[i].set_visible(alive[i])
+        self.alive = alive
+
+        self.scale.set_xdata([0.0, self.time[frame]])
+        self.canvas.draw()
+
+    def rgba(self, frame):
+        self.draw(frame)
+
+        return bytes(self.canvas.buffer_rgba())
+
+    @property
+    def size(self):
+        width, height = self.canvas.get_width_height()
+
+        return int(width), int(height)
+
+
+_worker_frames = None
+
+
+def _init_animation_worker(args):
+    global _worker_frames
+    _worker_frames = _AnimationFrames(*args)
+
 
+def _render_frames(frames):
+    return [_worker_frames.rgba(frame) for frame in frames]
 
 
-def draw_complex(X, simplicial_complex, ax=None):
+def _encoder(filename, size, fps):
+    ''' ffmpeg reading raw RGBA frames on stdin.  For gifs a palette is
+        built from the frames, which looks much better than the default.
+    '''
+    import shutil
+    import subprocess
+
+    if shutil.which('ffmpeg') is None:
+        raise RuntimeError('Writing {} needs ffmpeg on the PATH; save .png '
+                           'frames instead'.format(filename))
+
+    command = ['ffmpeg', '-loglevel', 'error', '-y',
+               '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', '{}x{}'.format(*size), '-r', str(fps), '-i', '-']
+    if filename.endswith('.gif'):
+        command += ['-vf', 'split[a][b];[a]palettegen[p];[b][p]paletteuse',
+                    '-loop', '0']
+    else:
+        command += ['-pix_fmt', 'yuv420p', '-vf',
+                    'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+    command.append(filename)
+
+    return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+
+def animate_persistence(X, pcycle, filename='image{:04d}.png', n_frames=50,
+                        fps=4, n_jobs=1, dpi=100, chunk_size=10):
+    ''' Animates the persistent cycles as the 'time' scale changes.
+        INPUT: Nx2 numpy array(dataset), list (from 'persistent_cycles'),
+               output file: an .mp4 or .gif (written through ffmpeg) or a
+               format pattern for one .png per frame, number of frames,
+               frames per second, worker processes (all cores when None),
+               resolution, frames per task
+        OUTPUT: None
+
+        The figure is drawn once; frames only toggle the cycles alive at
+        their scale.  With several workers each builds its own figure and
+        renders a contiguous block of frames at a time, and the blocks are
+        written out in order.
+
+        To make a movie of existing .png frames by hand:
+
+        $ ffmpeg -f image2 -r 1 -i image%04d.png -vcodec mpeg4 -y
+                 animated_persistence.mp4
+
+        $ convert -delay 40 -loop 0 *.png animaion.gif
+    '''
+    bd = np.array([list(bd) for bd, cycle in pcycle]).reshape(-1, 2)
+
+    begin_scale = 0.0
+    end_scale = np.max(bd[:,1]) if len(bd) else 1.0
+
+    time = np.linspace(begin_scale, end_scale, n_frames)
+    args = (X, pcycle, time, (6.4, 4.8), dpi)
+
+    frames = _AnimationFrames(*args)
+    width, height = frames.size
+
+    if filename.endswith('.png'):
+        for frame, rgba in _rendered_frames(frames, args, n_frames, n_jobs,
+                                            chunk_size):
+            image = np.frombuffer(rgba, dtype=np.uint8)
+            plt.imsave(filename.format(frame),
+                       image.reshape(height, width, 4))
+        return
+
+    encoder = _encoder(filename, (width, height), fps)
+    try:
+        for _, rgba in _rendered_frames(frames, args, n_frames, n_jobs,
+                                        chunk_size):
+            encoder.stdin.write(rgba)
+    finally:
+        encoder.stdin.close()
+        encoder.wait()
+
+    if encoder.returncode:
+        raise RuntimeError('ffmpeg failed writing {} (exit code {})'
+                           .format(filename, encoder.returncode))
+
+
+def _rendered_frames(frames, args, n_frames, n_jobs, chunk_size):
+    ''' (frame, RGBA bytes) in frame order, rendered here by 'frames' or,
+        a block of frames per task, on a pool of workers.
+    '''
+    if n_jobs == 1:
+        for frame in range(n_frames):
+            yield frame, frames.rgba(frame)
+        return
+
+    import multiprocessing
+
+    blocks = [range(start, min(start + chunk_size, n_frames))
+              for start in range(0, n_frames, chunk_size)]
+
+    pool = multiprocessing.Pool(n_jobs or multiprocessing.cpu_count(),
+                                initializer=_init_animation_worker,
+                                initargs=(args,))
+    try:
+        for block, rendered in zip(blocks,
+                                   pool.imap(_render_frames, blocks)):
+            for frame, rgba in zip(block, rendered):
+                yield frame, rgba
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def complex_arrays(simplicial_complex):
+    ''' Edges and triangles of a complex as vertex index arrays.
+        INPUT: list of simplices (anything with 'vertices'), a
+               SimplexFiltration, a PersistenceDiagram with cycles, an
+               (m, k+1) index array (rows may be padded with -1, as the
+               diagram's cycle_simplices) or a list of such arrays
+        OUTPUT: (m, 2) edges, (m, 3) triangles
+
+        Vertices are left out (every point is drawn anyway) and simplices
+        above dimension 2 are drawn through their triangles.
+    '''
+    if isinstance(simplicial_complex, PersistenceDiagram):
+        simplicial_complex = simplicial_complex.cycle_simplices
+        if simplicial_complex is None:
+            raise ValueError('This diagram holds no cycles; run with '
+                             'chains=True')
+    elif isinstance(simplicial_complex, SimplexFiltration):
+        simplicial_complex = simplicial_complex.simplices
+
+    if isinstance(simplicial_complex, np.ndarray):
+        blocks = [simplicial_complex]
+    else:
+        blocks = [s for s in simplicial_complex
+                  if isinstance(s, np.ndarray)]
+        objects = defaultdict(list)
+        for s in simplicial_complex:
+            if not isinstance(s, np.ndarray):
+                objects[len(s.vertices)].append(list(s.vertices))
+        blocks += [np.array(rows) for rows in objects.values()]
+
+    by_width = defaultdict(list)
+    for block in blocks:
+        block = np.asarray(block, dtype=np.int64)
+        block = block.reshape(-1, block.shape[-1]) if block.ndim else block
+        if block.ndim < 2 or not block.size:
+            continue
+        widths = (block >= 0).sum(axis=1)
+        for width in np.unique(widths):
+            by_width[width].append(block[widths == width, :width])
+
+    edges = [np.empty((0, 2), dtype=np.int64)]
+    triangles = [np.empty((0, 3), dtype=np.int64)]
+    for width, rows in by_width.items():
+        rows = np.concatenate(rows)
+        if width == 2:
+            edges.append(rows)
+        elif width > 2:
+            faces = list(itertools.combinations(range(width), 3))
+            triangles.append(rows[:, faces].reshape(-1, 3))
+
+    edges = np.unique(np.sort(np.concatenate(edges), axis=1), axis=0)
+    triangles = np.unique(np.sort(np.concatenate(triangles), axis=1), axis=0)
+
+    return edges, triangles
+
+
+def _decimate(X, simplices, resolution):
+    ''' Level of detail: snaps the vertices to a resolution x resolution
+        grid over the data and keeps one simplex per distinct set of cells,
+        dropping those that fall inside a single cell.  At about the
+        resolution of the image this is invisible, and the number of
+        simplices drawn is bounded by the grid instead of the complex.
+    '''
+    if not len(simplices):
+        return simplices
+
+    low, high = X.min(axis=0), X.max(axis=0)
+    scale = resolution / np.where(high > low, high - low, 1.0)
+    cells = np.minimum(((X - low) * scale).astype(np.int64), resolution - 1)
+    cell = cells[:, 0] * resolution + cells[:, 1]
+
+    keys = np.sort(cell[simplices], axis=1)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    first = first[(keys[first] != keys[first, :1]).any(axis=1)]
+
+    return simplices[np.sort(first)]
+
+
+def draw_complex(X, simplicial_complex=(), ax=None, linewidth=20,
+                 resolution=None, max_simplices=None, random_state=0):
+    ''' Draws the points of X with the edges and triangles of a complex: one
+        scatter, one LineCollection and one PolyCollection however large the
+        complex.
+        INPUT: Nx2 numpy array, complex (see 'complex_arrays'), axes (a new
+               figure when None), edge width, grid resolution for level of
+               detail decimation (none when None), cap on the simplices drawn
+               (a random sample of each kind beyond it), seed of the sample
+        OUTPUT: axes
+    '''
     xmin, ymin, xmax, ymax = _get_padded_box(X, padding=0.1)
 
     if ax is None:
         fig = plt.figure()
         ax = fig.add_subplot(111)
 
-    point_complex = [Simplex([i]) for i in range(len(X))]
-    sc = point_complex + simplicial_complex
-
-    sc.sort(lambda s1, s2: -cmp(s1.dimension(), s2.dimension()))
-    for s in sc:
-        vertices = [v for v in s.vertices]
-        points = X[np.array(vertices)]
-
-        if s.dimension() == 0:
-            ax.scatter(X[:,0], X[:,1], c='c')
-        else:
-            polygon = Polygon(points, closed=False, linewidth=20)
-            p = PatchCollection([polygon])
-            ax.add_collection(p)
-            
+    edges, triangles = complex_arrays(simplicial_complex)
+    if resolution is not None:
+        edges = _decimate(X, edges, resolution)
+        triangles = _decimate(X, triangles, resolution)
+    if max_simplices is not None and \
+            len(edges) + len(triangles) > max_simplices:
+        rng = check_random_state(random_state)
+        share = max_simplices / float(len(edges) + len(triangles))
+        edges, triangles = [S[np.sort(rng.choice(len(S),
+                                                 int(share * len(S)),
+                                                 replace=False))]
+                            for S in (edges, triangles)]
+
+    if len(triangles):
+        ax.add_collection(PolyCollection(X[triangles], facecolors='C0',
+                                         edgecolors='C0', zorder=1))
+    if len(edges):
+        ax.add_collection(LineCollection(X[edges], linewidths=linewidth,
+                                         colors='C0', zorder=2))
+    ax.scatter(X[:,0], X[:,1], c='c', zorder=3)
+
     ax.set_xlim(xmin, xmax)
     ax.set_ylim(ymin, ymax)
 
     return ax
 
 
-def draw_barcode(dynamic_persistence, smap, evaluator):
-    bcode_data = defaultdict(list)
-    for sigma in dynamic_persistence:
-        if not sigma.sign():
-            death = evaluator(smap[sigma])
-            birth = evaluator(smap[sigma.pair()])
-
-            if (death - birth) < 0.001:
-                continue
-
-            cycle = [smap[ii] for ii in sigma.cycle]
-            chain = [smap[ii] for ii in sigma.chain]
-
-            if not chain or not cycle:
-                continue
-
-            dim = chain[0].dimension()
+def draw_barcode(dynamic_persistence, smap=None, evaluator=None):
+    ''' Bars of the finite pairs living at least 0.001, by homology
+        dimension.  Takes a diagram, a run DynamicPersistence or the legacy
+        (dynamic_persistence, smap, evaluator) triple.
+    '''
+    diagram = as_diagram(dynamic_persistence, smap, evaluator).finite()
+    keep = diagram.persistence >= 0.001
 
-            bcode_data[dim].append([birth, death])
+    bcode_data = defaultdict(list)
+    for dim, birth, death in zip(diagram.dimension[keep], diagram.birth[keep],
+                                 diagram.death[keep]):
+        bcode_data[dim].append([birth, death])
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
-    ccolor = {1: 'b', 2: 'r', 3: 'g'}
+    ccolor = {0: 'b', 1: 'r', 2: 'g'}
 
-    for dim, bds in bcode_data.iteritems():
-        yoffset = dim-1
+    for dim, bds in bcode_data.items():
+        yoffset = dim
         for i, (b, d) in enumerate(bds):
             y = yoffset + i/float(len(bds))
             ax.plot([b, d], [y, y], c=ccolor[dim])
 
     y_major_ticks = np.arange(0, 3)
-    y_minor_ticks = np.arange(0.5, 2.5, 1)
+    y_minor_ticks = np.arange(0.5, 3, 1)
     y_labels = ['$H_{}$'.format(i) for i in range(0,3)]
 
     ax.set_xlabel('Distance Scale')
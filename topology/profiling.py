@@ -0,0 +1,159 @@
+''' Per-stage timings and sizes of a persistence run.
+
+    Methods wrapped in 'timeit' record, when the instance has a 'stats'
+    object (a 'RunStats'), the wall and CPU time of the call, how much it
+    raised the process' peak resident set size, and whatever counts the
+    instance reports for the stage through '_stage_counts' (points,
+    simplices, filtration size, pairs).  With stats=None the wrapper only
+    makes one attribute lookup, so profiling is off by default at no cost.
+
+    Hooks are called with each finished 'StageRecord', e.g. to log it or to
+    forward it to a metrics sink.
+
+    Example:
+        >>> stats = RunStats(hooks=[log_hook()])
+        >>> dp = DynamicPersistence(X, engine='numpy', stats=stats)
+        >>> dp.run()
+        >>> dp.stats['_pair_simplices'].wall, dp.stats.as_dict()
+
+'''
+
+import functools
+import logging
+import sys
+from time import perf_counter
+from time import process_time
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows; peak memory is then not recorded.
+    resource = None
+
+
+def peak_rss():
+    ''' Peak resident set size of this process in bytes (None when the
+        platform does not report it).
+    '''
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageRecord(object):
+    ''' One timed call: wall and CPU seconds, growth of the peak RSS in
+        bytes (0 when the stage stayed under the earlier peak) and counts.
+    '''
+
+    def __init__(self, name, wall, cpu, peak_rss_delta=None, counts=None):
+        self.name = name
+        self.wall = wall
+        self.cpu = cpu
+        self.peak_rss_delta = peak_rss_delta
+        self.counts = counts or {}
+
+    def __repr__(self):
+        counts = ''.join(' {}={}'.format(k, v)
+                         for k, v in sorted(self.counts.items()))
+
+        return '<StageRecord {}: wall {:0.3f}s cpu {:0.3f}s{}>'.format(
+                    self.name, self.wall, self.cpu, counts)
+
+    def as_dict(self):
+        record = {'name': self.name,
+                  'wall': self.wall,
+                  'cpu': self.cpu,
+                  'peak_rss_delta': self.peak_rss_delta}
+        record.update(self.counts)
+
+        return record
+
+
+class RunStats(object):
+    ''' The records of the profiled stages, in the order they finished.
+        Indexing by stage name gives its most recent record.
+    '''
+
+    def __init__(self, hooks=None):
+        self.records = []
+        self.hooks = list(hooks or [])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, name):
+        for record in reversed(self.records):
+            if record.name == name:
+                return record
+
+        raise KeyError(name)
+
+    def __repr__(self):
+        return '<RunStats {}>'.format(', '.join(
+                    '{}: {:0.3f}s'.format(r.name, r.wall)
+                    for r in self.records))
+
+    def add(self, record):
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    def total(self, name):
+        ''' Wall time summed over every record of stage 'name'. '''
+        return sum(r.wall for r in self.records if r.name == name)
+
+    def as_dict(self):
+        ''' Latest record of each stage, as plain dicts by stage name. '''
+        return dict((r.name, r.as_dict()) for r in self.records)
+
+    def clear(self):
+        del self.records[:]
+
+
+def log_hook(logger=None, level=logging.INFO):
+    ''' Hook writing each record to 'logger' (this module's by default). '''
+    logger = logger or logging.getLogger(__name__)
+
+    def hook(record):
+        logger.log(level, '%r', record)
+
+    return hook
+
+
+def timeit(method):
+    ''' Records the call in self.stats, when set, and returns its result.
+    '''
+    name = method.__name__
+
+    @functools.wraps(method)
+    def timed(self, *args, **kw):
+        stats = self.stats
+        if stats is None:
+            return method(self, *args, **kw)
+
+        rss = peak_rss()
+        cpu = process_time()
+        start = perf_counter()
+
+        result = method(self, *args, **kw)
+
+        wall = perf_counter() - start
+        cpu = process_time() - cpu
+        if rss is not None:
+            rss = peak_rss() - rss
+
+        counts = getattr(self, '_stage_counts', None)
+        counts = counts(name) if counts is not None else None
+
+        stats.add(StageRecord(name, wall, cpu, rss, counts))
+
+        return result
+
+    return timed
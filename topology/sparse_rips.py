@@ -0,0 +1,197 @@
+''' Sparse Rips filtrations: a linear-size approximation of the Rips
+    filtration from a greedy permutation (Cavanna, Jahanseir and Sheehy, "A
+    geometric perspective on sparse filtrations", with the edge and
+    blocking rules of the Gudhi implementation).
+
+    The points are ordered by farthest point sampling, each with its
+    insertion radius lambda (its distance to the points before it).  A
+    point stops taking part in new simplices once the scale passes about
+    2 lambda / epsilon, when the points before it cover its neighbourhood
+    to within the error.  So edge (i, j), lambda_i >= lambda_j, at distance
+    d:
+
+        * enters at d when d epsilon <= 2 lambda_j,
+        * is left out when d epsilon > lambda_i + lambda_j,
+        * and otherwise enters late, at 2 (d - lambda_j / epsilon), unless
+          that is after point j is gone;
+
+    and a higher simplex is blocked once its value alpha has
+    lambda_v < alpha epsilon (1 - epsilon) / 2 for one of its vertices v.
+    For 0 < epsilon < 1 the persistence diagram is within a multiplicative
+    factor 1 / (1 - epsilon) (about 1 + epsilon) of the Rips one, and in
+    doubling spaces the complex has O(n) simplices for fixed epsilon and
+    dimension.  Building it takes about n log n for the KD-tree metrics
+    (the greedy permutation and the neighbour search are ball queries);
+    other metrics take n^2 distance evaluations for both.
+
+    Example:
+        >>> simplices, values = sparse_rips_complex(X, epsilon=0.2,
+        ...                                         max_dimension=3)
+        >>> sum(len(s) for s in simplices)
+
+'''
+
+import heapq
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .landmarks import _distances_to
+from .landmarks import maxmin_landmarks
+from .rips import KDTREE_METRICS
+from .rips import NeighborhoodGraph
+from .rips import expand_cliques
+
+
+def greedy_permutation(X, metric='euclidean', start=0):
+    ''' Farthest point ordering of X.  For the KD-tree metrics a chosen
+        point only updates the points within its insertion radius (a ball
+        query), and the next one comes off a heap, so the cost follows the
+        size of those balls: about n log n for well spread points in low
+        dimension.  Other metrics go through 'maxmin_landmarks', which
+        takes n^2 distance evaluations.
+        OUTPUT: the order, insertion radius of every point (indexed by
+                point, inf for the first)
+    '''
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    if metric not in KDTREE_METRICS or n < 2:
+        order, radii, _ = maxmin_landmarks(X, n, metric=metric, start=start)
+        insertion = np.empty(n)
+        insertion[order] = radii
+        return order, insertion
+
+    p = KDTREE_METRICS[metric]
+    tree = cKDTree(X)
+    order = np.empty(n, dtype=np.int64)
+    insertion = np.empty(n)
+    order[0], insertion[start] = start, np.inf
+
+    nearest = np.linalg.norm(X - X[start], ord=p, axis=1)
+    nearest[start] = -1.0
+    # Max-heap on the distance to the points chosen so far; an entry is
+    # stale once its point's distance has dropped (or it was chosen).
+    heap = list(zip((-nearest).tolist(), range(n)))
+    heapq.heapify(heap)
+
+    for k in range(1, n):
+        while True:
+            key, current = heapq.heappop(heap)
+            if -key == nearest[current]:
+                break
+        radius = nearest[current]
+        order[k], insertion[current] = current, radius
+        nearest[current] = -1.0
+
+        ball = np.asarray(tree.query_ball_point(X[current], radius, p=p),
+                          dtype=np.int64)
+        d = np.linalg.norm(X[ball] - X[current], ord=p, axis=1)
+        closer = d < nearest[ball]
+        ball, d = ball[closer], d[closer]
+        nearest[ball] = d
+        for key, point in zip((-d).tolist(), ball.tolist()):
+            heapq.heappush(heap, (key, point))
+
+    return order, insertion
+
+
+def _candidates(X, order, insertion, epsilon, metric, chunk_size=1024):
+    ''' Pairs (i, j), i before j in the order, within
+        (lambda_i + lambda_j) / epsilon <= 2 lambda_i / epsilon, with their
+        distances.  Each point only searches the ball its own radius
+        allows, so the later (small radius) points search small balls.
+    '''
+    n = len(X)
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    tree = None
+    if metric in KDTREE_METRICS:
+        tree = cKDTree(X)
+        p = KDTREE_METRICS[metric]
+        # The first point's radius is infinite: any ball holding the
+        # whole cloud will do.
+        span = np.abs(X.max(axis=0) - X.min(axis=0)).sum() + 1.0
+
+    pairs, distances = [], []
+    for start in range(0, n, chunk_size):
+        rows = order[start:start + chunk_size]
+        radius = 2.0 * insertion[rows] / epsilon
+
+        if tree is not None:
+            balls = tree.query_ball_point(X[rows], np.minimum(radius, span),
+                                          p=p)
+            counts = np.array([len(b) for b in balls], dtype=np.int64)
+            j = np.concatenate([np.asarray(b, dtype=np.int64)
+                                for b in balls] + [np.empty(0, np.int64)])
+            i = np.repeat(rows, counts)
+            later = rank[j] > rank[i]
+            i, j = i[later], j[later]
+            d = np.linalg.norm(X[i] - X[j], ord=p, axis=1)
+        else:
+            D = _distances_to(X[rows], X, np.arange(n), metric)
+            r, j = np.nonzero((D <= radius[:, np.newaxis]) &
+                              (rank[np.newaxis, :] > rank[rows, np.newaxis]))
+            i, d = rows[r], D[r, j]
+
+        pairs.append(np.c_[i, j])
+        distances.append(d)
+
+    return np.concatenate(pairs), np.concatenate(distances)
+
+
+def sparse_rips_edges(X, epsilon, skeleton=np.inf, metric='euclidean',
+                      start=0):
+    ''' Edges of the sparse Rips filtration with their entry values.
+        INPUT: NxD numpy array (NxN for metric='precomputed'), epsilon in
+               (0, 1), largest edge value kept, metric, first point of the
+               greedy permutation
+        OUTPUT: Mx2 edges (i < j), length M values, insertion radius of
+                every point
+    '''
+    if not 0 < epsilon < 1:
+        raise ValueError('epsilon must be in (0, 1), got {!r}'
+                         .format(epsilon))
+    X = np.asarray(X, dtype=np.float64)
+
+    order, insertion = greedy_permutation(X, metric, start)
+    pairs, d = _candidates(X, order, insertion, epsilon, metric)
+
+    # i comes first in the order, so lambda_i >= lambda_j.
+    li, lj = insertion[pairs[:, 0]], insertion[pairs[:, 1]]
+    early = d * epsilon <= 2 * lj
+    late = ~early & (d * epsilon <= li + lj)
+
+    values = np.where(early, d, 2 * (d - lj / epsilon))
+    # The same test as 'sparse_block': j, the point that goes first, must
+    # still be there at the edge's value.
+    late &= epsilon * (1 - epsilon) * values <= 2 * lj
+    keep = (early | late) & (values <= skeleton)
+
+    return np.sort(pairs[keep], axis=1), values[keep], insertion
+
+
+def sparse_block(insertion, epsilon):
+    ''' The blocking rule for 'expand_cliques': a simplex is left out once
+        one of its vertices is gone at its value.
+    '''
+    factor = epsilon * (1 - epsilon) / 2.0
+
+    def block(simplices, values):
+        return (insertion[simplices] < factor *
+                values[:, np.newaxis]).any(axis=1)
+
+    return block
+
+
+def sparse_rips_complex(X, epsilon, max_dimension=2, skeleton=np.inf,
+                        metric='euclidean', start=0):
+    ''' Sparse Rips complex of X, as per-dimension arrays (see
+        'rips.expand_cliques').
+    '''
+    edges, values, insertion = sparse_rips_edges(X, epsilon, skeleton,
+                                                 metric, start)
+    graph = NeighborhoodGraph(len(X), edges, values)
+
+    return expand_cliques(graph, max_dimension,
+                          block=sparse_block(insertion, epsilon))
@@ -0,0 +1,361 @@
+''' Saving a computed run to disk and opening it again without re-running.
+
+    A run is stored as a directory of .npy files, one per array, plus a
+    small meta.json:
+
+        simplices.<k>.npy, values.<k>.npy   the filtration, per dimension
+        positions.<k>.npy                   filtration index of every row
+        dimension.npy, row.npy              dimension and row of every
+                                            filtration index
+        partner.npy                         the pairing (-1: unpaired)
+        cycle_ptr.npy, cycle_indices.npy    reduced columns of the deaths,
+        chain_ptr.npy, chain_indices.npy    and their chains, as CSR over
+                                            filtration indices
+        diagram.<field>.npy                 the PersistenceDiagram
+
+    'load_run' memory-maps every file and only opens it when first used, so
+    pulling one cycle out of a multi-GB result reads a few pages of three
+    files.  The returned StoredRun has the 'filtration',
+    'dynamic_persistence', 'simplex_map', 'evaluator' and 'diagram' of the
+    run, so the plotting, feature and network code take it as they take a
+    DynamicPersistence.
+
+    Example:
+        >>> dp.run()
+        >>> save_run(dp, 'results/circle')
+        >>> run = load_run('results/circle')
+        >>> simplices, values = run.cycle_simplices(run.diagram.death_index[0])
+
+'''
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .diagram import CYCLE_FIELDS
+from .diagram import FIELDS
+from .diagram import PersistenceDiagram
+from .filtration import SimplexFiltration
+from .reduction import MatrixPersistence
+
+
+FORMAT_VERSION = 1
+
+
+def _csr(columns, n):
+    ''' CSR arrays of a {filtration index: index array} dict. '''
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    if not columns:
+        return ptr, np.empty(0, dtype=np.int64)
+
+    keys = np.array(sorted(columns), dtype=np.int64)
+    counts = np.zeros(n, dtype=np.int64)
+    counts[keys] = [len(columns[j]) for j in keys]
+    np.cumsum(counts, out=ptr[1:])
+
+    indices = np.concatenate([np.asarray(columns[j], dtype=np.int64)
+                              for j in keys])
+
+    return ptr, indices
+
+
+def _dionysus_arrays(dynamic_persistence):
+    ''' Filtration, pairing, cycles and chains of a Dionysus run as arrays,
+        in the layout of the numpy engine.
+    '''
+    smap = dynamic_persistence.simplex_map
+    evaluator = dynamic_persistence.evaluator
+    nodes = list(dynamic_persistence.dynamic_persistence)
+
+    simplices = [smap[node] for node in nodes]
+    index_of = dict((tuple(sorted(s.vertices)), i)
+                    for i, s in enumerate(simplices))
+
+    def index(element):
+        return index_of[tuple(sorted(smap[element].vertices))]
+
+    partner = np.full(len(nodes), -1, dtype=np.int64)
+    cycles, chains = {}, {}
+    for i, node in enumerate(nodes):
+        if node.unpaired():
+            continue
+        partner[i] = index(node.pair())
+        if not node.sign():
+            cycles[i] = np.sort([index(e) for e in node.cycle])
+            chains[i] = np.sort([index(e) for e in node.chain])
+
+    dimension = np.array([s.dimension() for s in simplices], dtype=np.int64)
+    top = int(dimension.max()) + 1 if len(dimension) else 1
+    vertices = [[] for _ in range(top)]
+    values = [[] for _ in range(top)]
+    row = np.empty(len(nodes), dtype=np.int64)
+    for i, s in enumerate(simplices):
+        k = dimension[i]
+        row[i] = len(vertices[k])
+        vertices[k].append(sorted(s.vertices))
+        values[k].append(evaluator(s))
+
+    filtration = SimplexFiltration(
+                    [np.array(v, dtype=np.int64).reshape(-1, k + 1)
+                     for k, v in enumerate(vertices)], values)
+    filtration.dimension = dimension
+    filtration.row = row
+    filtration.positions = [np.flatnonzero(dimension == k)
+                            for k in range(top)]
+
+    return filtration, partner, cycles, chains
+
+
+def save_run(dynamic_persistence, directory, overwrite=False):
+    ''' Writes a run DynamicPersistence (either engine) to 'directory'.  It
+        is written next to it first and renamed into place, so readers
+        never see half a run, and with overwrite=True the old run is only
+        deleted once the new one has replaced it.  Runs paired by
+        component, or read from a cache, only have their diagram saved.
+    '''
+    dp = dynamic_persistence
+    directory = os.path.expanduser(directory)
+    if os.path.exists(directory) and not overwrite:
+        raise ValueError('{} exists; pass overwrite=True to replace it'
+                         .format(directory))
+
+    arrays = {}
+    if dp.dynamic_persistence is not None:
+        if hasattr(dp.dynamic_persistence, 'partner'):
+            filtration = dp.filtration
+            persistence = dp.dynamic_persistence
+            partner = persistence.partner
+            cycles = persistence.cycles or {}
+            chains = persistence.chains or {}
+        else:
+            filtration, partner, cycles, chains = _dionysus_arrays(dp)
+
+        n = len(filtration)
+        for k in range(len(filtration.simplices)):
+            arrays['simplices.{}'.format(k)] = filtration.simplices[k]
+            arrays['values.{}'.format(k)] = filtration.values[k]
+            arrays['positions.{}'.format(k)] = filtration.positions[k]
+        arrays['dimension'] = filtration.dimension
+        arrays['row'] = filtration.row
+        arrays['partner'] = partner
+        arrays['cycle_ptr'], arrays['cycle_indices'] = _csr(cycles, n)
+        arrays['chain_ptr'], arrays['chain_indices'] = _csr(chains, n)
+
+    if dp.diagram is not None:
+        for name, array in dp.diagram.to_dict().items():
+            arrays['diagram.' + name] = array
+
+    meta = {'format_version': FORMAT_VERSION,
+            'max_dimension': dp.max_dimension,
+            'skeleton': dp.skeleton,
+            'metric': dp.metric if isinstance(dp.metric, str) else None,
+            'construction': dp.construction,
+            'engine': dp.engine,
+            'simplices': len(dp.filtration) if 'dimension' in arrays else 0,
+            'has_cycles': bool('dimension' in arrays and
+                               len(arrays['cycle_indices'])),
+            'has_chains': bool('dimension' in arrays and
+                               len(arrays['chain_indices']))}
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    temporary = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, name + '.npy'),
+                    np.ascontiguousarray(array))
+        with open(os.path.join(temporary, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+
+        # The old run is moved aside (over an empty directory, which
+        # rename replaces) and only removed once the new one is in place.
+        previous = None
+        if os.path.exists(directory):
+            previous = tempfile.mkdtemp(dir=parent, suffix='.old')
+            os.rename(directory, previous)
+        try:
+            os.rename(temporary, directory)
+        except BaseException:
+            if previous is not None:
+                os.rename(previous, directory)
+            raise
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+class _CSRColumns(object):
+    ''' Read-only {filtration index: index array} view of CSR arrays, as
+        MatrixPersistence keeps its cycles and chains; only the requested
+        column is read.
+    '''
+
+    def __init__(self, ptr, indices):
+        self.ptr = ptr
+        self.indices = indices
+
+    def get(self, j, default=None):
+        start, stop = self.ptr[j], self.ptr[j + 1]
+        if start == stop:
+            return default
+
+        return np.asarray(self.indices[start:stop])
+
+    def __getitem__(self, j):
+        column = self.get(j)
+        if column is None:
+            raise KeyError(j)
+
+        return column
+
+    def __contains__(self, j):
+        return self.ptr[j] != self.ptr[j + 1]
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.ptr)))
+
+
+def _simplex_data(simplex):
+    return simplex.data
+
+
+class StoredRun(object):
+    ''' A run saved by 'save_run', opened lazily; arrays are memory-mapped
+        (mmap_mode=None reads them into memory instead).
+    '''
+
+    def __init__(self, directory, mmap_mode='r'):
+        self.directory = os.path.expanduser(directory)
+        self.mmap_mode = mmap_mode
+
+        with open(os.path.join(self.directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['format_version'] > FORMAT_VERSION:
+            raise ValueError('{} was written by a newer version (format {})'
+                             .format(self.directory,
+                                     self.meta['format_version']))
+
+        self.max_dimension = self.meta['max_dimension']
+        self.skeleton = self.meta['skeleton']
+        self.evaluator = _simplex_data
+
+        self._arrays = {}
+        self._filtration = None
+        self._persistence = None
+        self._diagram = None
+
+    def __repr__(self):
+        return '<StoredRun {}: {} simplices>'.format(self.directory,
+                                                     self.meta['simplices'])
+
+    def array(self, name):
+        ''' One stored array, opened on first use (None if absent). '''
+        if name not in self._arrays:
+            path = os.path.join(self.directory, name + '.npy')
+            self._arrays[name] = np.load(path, mmap_mode=self.mmap_mode) \
+                                 if os.path.exists(path) else None
+
+        return self._arrays[name]
+
+    @property
+    def has_filtration(self):
+        return self.array('dimension') is not None
+
+    @property
+    def filtration(self):
+        ''' The sorted SimplexFiltration, over the stored arrays. '''
+        if self._filtration is None and self.has_filtration:
+            top = self.max_dimension + 1
+            while self.array('simplices.{}'.format(top - 1)) is None:
+                top -= 1
+            filtration = SimplexFiltration(
+                            [self.array('simplices.{}'.format(k))
+                             for k in range(top)],
+                            [self.array('values.{}'.format(k))
+                             for k in range(top)])
+            filtration.dimension = self.array('dimension')
+            filtration.row = self.array('row')
+            filtration.positions = [self.array('positions.{}'.format(k))
+                                    for k in range(top)]
+            self._filtration = filtration
+
+        return self._filtration
+
+    @property
+    def dynamic_persistence(self):
+        ''' A MatrixPersistence with the stored pairing, cycles and chains
+            (read column by column as they are asked for).
+        '''
+        if self._persistence is None and self.has_filtration:
+            persistence = MatrixPersistence(self.filtration,
+                                            chains=self.meta['has_chains'])
+            persistence.partner = self.array('partner')
+            if self.meta['has_cycles']:
+                persistence.cycles = _CSRColumns(self.array('cycle_ptr'),
+                                                 self.array('cycle_indices'))
+            if self.meta['has_chains']:
+                persistence.chains = _CSRColumns(self.array('chain_ptr'),
+                                                 self.array('chain_indices'))
+            self._persistence = persistence
+
+        return self._persistence
+
+    @property
+    def simplex_map(self):
+        persistence = self.dynamic_persistence
+        if persistence is None:
+            return None
+
+        return persistence.make_simplex_map(self.filtration)
+
+    @property
+    def diagram(self):
+        if self._diagram is None and self.array('diagram.birth') is not None:
+            names = FIELDS + CYCLE_FIELDS
+            arrays = dict((name, self.array('diagram.' + name))
+                          for name in names
+                          if self.array('diagram.' + name) is not None)
+            self._diagram = PersistenceDiagram.from_dict(arrays)
+
+        return self._diagram
+
+    def cycle(self, j):
+        ''' Filtration indices of the reduced column of death index j. '''
+        return self.dynamic_persistence.cycles.get(
+                    j, np.empty(0, dtype=np.int64))
+
+    def chain(self, j):
+        return self.dynamic_persistence.chains.get(
+                    j, np.empty(0, dtype=np.int64))
+
+    def simplices_at(self, indices):
+        ''' Vertices (padded with -1) and values of filtration indices.
+            OUTPUT: (m, max dimension + 1) vertex array, length m values
+        '''
+        filtration = self.filtration
+        indices = np.asarray(indices, dtype=np.int64)
+        dimension = np.asarray(filtration.dimension[indices])
+        row = np.asarray(filtration.row[indices])
+
+        vertices = np.full((len(indices), len(filtration.simplices)), -1,
+                           dtype=np.int64)
+        values = np.empty(len(indices))
+        for k in np.unique(dimension):
+            mask = dimension == k
+            vertices[mask, :k + 1] = filtration.simplices[k][row[mask]]
+            values[mask] = filtration.values[k][row[mask]]
+
+        return vertices, values
+
+    def cycle_simplices(self, j):
+        ''' Simplices of the cycle of death index j, as 'simplices_at'. '''
+        return self.simplices_at(self.cycle(j))
+
+
+def load_run(directory, mmap_mode='r'):
+    return StoredRun(directory, mmap_mode)
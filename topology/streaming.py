@@ -0,0 +1,236 @@
+''' Rips persistence over a sliding window of a point stream.
+
+    'SlidingWindowPersistence' keeps the neighbourhood graph and the Rips
+    complex of the points in the window between updates.  Appending points
+    only measures distances from the new points to the window and expands
+    the cliques that contain a new point (all their vertices are neighbours
+    of it); expiring points drops the simplices that touch them.  Nothing
+    else in the complex changes, as Rips values do not depend on the rest
+    of the cloud.
+
+    The pairing reuses the previous reduction: a reduced boundary column
+    only depends on the columns of its dimension that come before it, so
+    for every dimension the leading run of columns that is the same as last
+    time (the part of the filtration below the first simplex added or
+    removed) is carried over, and only the rest is reduced.  That works best
+    when updates touch the long edges, e.g. a slowly drifting cloud; new
+    points in dense regions add short edges and little can be reused.
+
+    Vertices are numbered by arrival (the ids returned by 'append'); the
+    window's points and ids are in 'points' and 'ids'.
+
+    Example:
+        >>> window = SlidingWindowPersistence(window=500, skeleton=0.5)
+        >>> for batch in stream:
+        ...     diagram = window.push(batch)
+
+'''
+
+import numpy as np
+
+from .diagram import PersistenceDiagram
+from .distances import get_metric
+from .filtration import SimplexFiltration
+from .profiling import RunStats
+from .profiling import timeit
+from .reduction import MatrixPersistence
+from .rips import NeighborhoodGraph
+from .rips import expand_cliques
+
+
+def _match_rows(table, queries):
+    ''' Row index in 'table' of each row of 'queries', -1 where absent. '''
+    if not len(table) or not len(queries):
+        return np.full(len(queries), -1, dtype=np.int64)
+
+    stacked = np.concatenate([table, queries])
+    _, inverse = np.unique(stacked, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    position = np.full(inverse.max() + 1, -1, dtype=np.int64)
+    position[inverse[:len(table)]] = np.arange(len(table))
+
+    return position[inverse[len(table):]]
+
+
+def _lexsorted(simplices, values):
+    order = np.lexsort(simplices.T[::-1])
+
+    return simplices[order], values[order]
+
+
+class SlidingWindowPersistence(object):
+    ''' Incrementally maintained Rips persistence of a window of points.
+        With window=None points stay until expired explicitly.
+    '''
+
+    def __init__(self, window=None, max_dimension=2, skeleton=1.7,
+                 metric='euclidean', stats=None):
+        self.window = window
+        self.max_dimension = max_dimension
+        self.skeleton = skeleton
+        self.metric = metric
+
+        if stats is True:
+            stats = RunStats()
+        elif stats is False:
+            stats = None
+        self.stats = stats
+
+        self.points = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.next_id = 0
+
+        self.edges = np.empty((0, 2), dtype=np.int64)
+        self.lengths = np.empty(0)
+        self.simplices = [np.empty((0, k + 1), dtype=np.int64)
+                          for k in range(max_dimension + 1)]
+        self.values = [np.empty(0) for _ in range(max_dimension + 1)]
+
+        self.filtration = None
+        self.dynamic_persistence = None
+        self.diagram = None
+        self.reused_ = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @timeit
+    def append(self, points):
+        ''' Adds points to the window (expiring the oldest ones beyond
+            'window').
+            OUTPUT: ids of the new points
+        '''
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        new_ids = np.arange(self.next_id, self.next_id + len(points))
+        self.next_id += len(points)
+
+        if self.points is None:
+            self.points = np.empty((0, points.shape[1]))
+
+        # Edges from the new points to the window and among themselves.
+        D = get_metric(self.metric)(points, np.vstack([self.points, points]))
+        w = len(self.ids)
+        i, j = np.nonzero(D[:, :w] <= self.skeleton)
+        ii, jj = np.nonzero(np.triu(D[:, w:] <= self.skeleton, k=1))
+
+        edges = np.r_[np.c_[self.ids[j], new_ids[i]],
+                      np.c_[new_ids[ii], new_ids[jj]]]
+        lengths = np.r_[D[i, j], D[ii, w + jj]]
+
+        self.points = np.vstack([self.points, points])
+        self.ids = np.r_[self.ids, new_ids]
+        self.edges = np.r_[self.edges, edges]
+        self.lengths = np.r_[self.lengths, lengths]
+
+        self._add_cofaces(new_ids, edges)
+
+        if self.window is not None and len(self.ids) > self.window:
+            self.expire(self.ids[:len(self.ids) - self.window])
+
+        return new_ids
+
+    def _add_cofaces(self, new_ids, new_edges):
+        ''' Adds the simplices with a vertex in new_ids.  They live on the
+            new points and their neighbours, so the cliques are only
+            expanded there.
+        '''
+        local = np.union1d(new_ids, new_edges.ravel())
+        inside = np.isin(self.edges, local).all(axis=1)
+        graph = NeighborhoodGraph(len(local),
+                                  np.searchsorted(local, self.edges[inside]),
+                                  self.lengths[inside])
+        simplices, values = expand_cliques(graph, self.max_dimension)
+
+        # New ids are the largest, so they sort last in 'local' and are
+        # the last vertex of any simplex holding one.
+        first_new = len(local) - len(new_ids)
+        for k in range(self.max_dimension + 1):
+            keep = simplices[k][:, -1] >= first_new
+            S = np.r_[self.simplices[k], local[simplices[k][keep]]]
+            v = np.r_[self.values[k], values[k][keep]]
+            self.simplices[k], self.values[k] = _lexsorted(S, v)
+
+    @timeit
+    def expire(self, ids):
+        ''' Removes the points with the given ids and their simplices. '''
+        keep = ~np.isin(self.ids, ids)
+        self.ids = self.ids[keep]
+        self.points = self.points[keep]
+
+        keep = ~np.isin(self.edges, ids).any(axis=1)
+        self.edges = self.edges[keep]
+        self.lengths = self.lengths[keep]
+
+        for k in range(self.max_dimension + 1):
+            keep = ~np.isin(self.simplices[k], ids).any(axis=1)
+            self.simplices[k] = self.simplices[k][keep]
+            self.values[k] = self.values[k][keep]
+
+    @timeit
+    def update(self):
+        ''' Pairs the current complex, reusing what it can of the last
+            reduction, and returns the window's diagram.
+        '''
+        filtration = SimplexFiltration(self.simplices, self.values)
+        filtration.sort()
+
+        reduced = self._reduced_prefix(filtration)
+        persistence = MatrixPersistence(filtration, chains=False)
+        persistence.pair_simplices(reduced=reduced)
+
+        self.reused_ = len(reduced)
+        self.filtration = filtration
+        self.dynamic_persistence = persistence
+        self.diagram = PersistenceDiagram.from_dynamic_persistence(self)
+
+        return self.diagram
+
+    def push(self, points):
+        ''' append, then update.  OUTPUT: the new diagram '''
+        self.append(points)
+
+        return self.update()
+
+    def _reduced_prefix(self, filtration):
+        ''' Reduced columns of the last update still valid in 'filtration',
+            by new filtration index.
+        '''
+        old = self.filtration
+        if old is None:
+            return {}
+
+        # New filtration index of every old simplex, -1 if it is gone.
+        old_to_new = np.full(len(old), -1, dtype=np.int64)
+        for k in range(self.max_dimension + 1):
+            rows = _match_rows(filtration.simplices[k], old.simplices[k])
+            found = rows >= 0
+            old_to_new[old.positions[k][found]] = \
+                filtration.positions[k][rows[found]]
+
+        cycles = self.dynamic_persistence.cycles
+        empty = np.empty(0, dtype=np.int64)
+
+        reduced = {}
+        for k in range(1, self.max_dimension + 1):
+            old_columns = np.sort(old.positions[k])
+            new_columns = np.sort(filtration.positions[k])
+
+            m = min(len(old_columns), len(new_columns))
+            same = old_to_new[old_columns[:m]] == new_columns[:m]
+            prefix = m if same.all() else int(np.argmin(same))
+
+            for old_j, j in zip(old_columns[:prefix], new_columns[:prefix]):
+                column = cycles.get(old_j)
+                reduced[j] = empty if column is None else \
+                             np.sort(old_to_new[column])
+
+        return reduced
+
+    def _stage_counts(self, stage):
+        if stage == 'update':
+            return {'simplices': len(self.filtration),
+                    'reused_columns': self.reused_,
+                    'diagram_pairs': len(self.diagram)}
+
+        return {'points': len(self.ids)}
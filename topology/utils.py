@@ -1,13 +1,59 @@
+import numbers
+
 import numpy as np
 
+
+def check_random_state(seed):
+    ''' Turns 'seed' into a numpy.random.Generator.
+        INPUT: None, int, numpy.random.Generator or numpy.random.RandomState
+        OUTPUT: numpy.random.Generator
+
+        Passing the same integer gives reproducible draws; None draws fresh
+        entropy from the operating system.
+    '''
+    if isinstance(seed, np.random.Generator):
+        return seed
+
+    if seed is None or isinstance(seed, (numbers.Integral, np.integer)):
+        return np.random.default_rng(seed)
+
+    if isinstance(seed, np.random.RandomState):
+        return np.random.default_rng(seed.randint(np.iinfo(np.int32).max))
+
+    raise ValueError('{!r} cannot be used to seed a numpy.random.Generator'
+                     .format(seed))
+
+
+def concatenated_ranges(starts, counts):
+    ''' Concatenation of range(s, s + c) for each (s, c), vectorized. '''
+    counts = np.asarray(counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+
+    return np.arange(counts.sum()) - offsets + np.repeat(starts, counts)
+
+
 def pixel_to_xy(array, min_x=-1.0, min_y=-1.0, max_x=1.0, max_y=1.0):
-    x = np.linspace(min_x, max_x, array.shape[1])
-    y = np.linspace(min_y, max_y, array.shape[0])
+    ''' Point cloud of the non-zero pixels of an image, in row-major order,
+        on [min_x, max_x] x [min_y, max_y] (rows going down).
+    '''
+    points, _ = images_to_xy(np.asarray(array)[np.newaxis], min_x, min_y,
+                             max_x, max_y)
+
+    return points
+
+
+def images_to_xy(images, min_x=-1.0, min_y=-1.0, max_x=1.0, max_y=1.0):
+    ''' 'pixel_to_xy' for a whole (n_images, rows, columns) stack at once.
+        OUTPUT: Mx2 points of all images, length M array of the image each
+                point comes from (ascending, so
+                np.split(points, np.cumsum(np.bincount(
+                    owner, minlength=len(images)))[:-1])
+                gives the clouds, empty images included)
+    '''
+    images = np.asarray(images)
+    x = np.linspace(min_x, max_x, images.shape[2])
+    y = np.linspace(min_y, max_y, images.shape[1])
 
-    points = []
-    for j, row in enumerate(array):
-        for i, entry in enumerate(row):
-            if entry:
-                points.append([x[i], -y[j]])
+    owner, j, i = np.nonzero(images)
 
-    return np.array(points)
+    return np.c_[x[i], -y[j]], owner
@@ -0,0 +1,374 @@
+''' Fixed-length vectors from persistence diagrams, as scikit-learn
+    transformers.
+
+    Every transformer takes a list of diagrams: 'PersistenceDiagram'
+    objects, (k, 3) arrays of (dimension, birth, death) rows as from
+    'PersistenceDiagram.to_array', or (k, 2) arrays of (birth, death) rows.
+    A padded (n, k, 2 or 3) array with NaN rows for the padding works too,
+    and so does a sparse (CSR style) batch: a mapping, such as an .npz
+    file, with 'rows', the (k, 2 or 3) rows of all diagrams one after the
+    other, and 'ptr', where diagram i is rows[ptr[i]:ptr[i + 1]].
+    The diagrams are flattened into one set of columns with the index of the
+    owning diagram, so a batch of any mix of sizes is vectorized in a few
+    numpy calls rather than a loop over diagrams.  Essential (infinite)
+    pairs are ignored.  Features are summed in float64 a chunk at a time
+    and kept in 'dtype' (e.g. np.float32 to halve the output).
+
+    With 'dimensions' (e.g. (0, 1)) each homology dimension gets its own
+    block of features, side by side; with dimensions=None all pairs go into
+    one block, and plain (birth, death) arrays are accepted.
+
+    Example:
+        >>> pipeline = make_pipeline(PersistenceImage(dimensions=(0, 1)),
+        ...                          PCA(n_components=2))
+        >>> X_pca = pipeline.fit_transform([dp.diagram for dp in runs])
+
+'''
+
+import numpy as np
+from scipy import sparse
+from scipy.special import ndtr
+from sklearn.base import BaseEstimator
+from sklearn.base import TransformerMixin
+
+from .diagram import PersistenceDiagram
+
+
+def diagram_columns(diagrams):
+    ''' Flattens a batch of diagrams.
+        INPUT: list of diagrams (see module docstring) or padded array
+        OUTPUT: owner (diagram index of each pair), dimension (-1 where
+                unknown), birth, death, number of diagrams
+    '''
+    if isinstance(diagrams, PersistenceDiagram):
+        raise ValueError('Expected a list of diagrams, got a single one')
+
+    if hasattr(diagrams, 'keys') and 'ptr' in diagrams:
+        return _csr_columns(diagrams['ptr'], diagrams['rows'])
+
+    if isinstance(diagrams, np.ndarray) and diagrams.ndim == 3:
+        diagrams = [rows[~np.isnan(rows).any(axis=1)] for rows in diagrams]
+
+    owner, dimension, birth, death = [], [], [], []
+    for i, diagram in enumerate(diagrams):
+        if isinstance(diagram, PersistenceDiagram):
+            d, b, e = diagram.dimension, diagram.birth, diagram.death
+        else:
+            rows = np.asarray(diagram, dtype=np.float64)
+            if rows.size == 0:
+                continue
+            d, b, e = _row_columns(rows, i)
+
+        owner.append(np.full(len(b), i))
+        dimension.append(d)
+        birth.append(b)
+        death.append(e)
+
+    n_diagrams = len(diagrams)
+    if not owner:
+        empty = np.empty(0)
+        return (empty.astype(np.int64), empty.astype(np.int64), empty, empty,
+                n_diagrams)
+
+    owner = np.concatenate(owner).astype(np.int64)
+    dimension = np.concatenate(dimension).astype(np.int64)
+    birth = np.concatenate(birth).astype(np.float64)
+    death = np.concatenate(death).astype(np.float64)
+
+    finite = np.isfinite(death)
+
+    return (owner[finite], dimension[finite], birth[finite], death[finite],
+            n_diagrams)
+
+
+def _row_columns(rows, i):
+    ''' Dimension (-1 when unknown), birth and death of (k, 2 or 3) rows.
+    '''
+    if rows.ndim != 2 or rows.shape[1] not in (2, 3):
+        raise ValueError('Diagram {} has shape {}; expected (k, 2) '
+                         'or (k, 3) rows'.format(i, rows.shape))
+    if rows.shape[1] == 3:
+        return rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+
+    return np.full(len(rows), -1), rows[:, 0], rows[:, 1]
+
+
+def _csr_columns(ptr, rows):
+    ptr = np.asarray(ptr, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.float64)
+    n_diagrams = len(ptr) - 1
+    if rows.size == 0:
+        rows = rows.reshape(0, 2)
+    if n_diagrams < 0 or len(rows) != ptr[-1]:
+        raise ValueError("'ptr' must have one more entry than there are "
+                         "diagrams and end at len(rows)")
+
+    owner = np.repeat(np.arange(n_diagrams), np.diff(ptr))
+    dimension, birth, death = _row_columns(rows, 'rows')
+    finite = np.isfinite(death)
+
+    return (owner[finite], dimension[finite], birth[finite], death[finite],
+            n_diagrams)
+
+
+def _owner_chunks(owner, chunk_size):
+    ''' Slices of at most chunk_size pairs, with the diagrams they touch
+        and a sparse (touched diagrams x pairs) matrix for summing weighted
+        pairs into them (call it with the chunk's weights).
+    '''
+    for start in range(0, len(owner), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        touched, local = np.unique(owner[chunk], return_inverse=True)
+
+        def owner_matrix(weights, local=local.ravel(), size=len(touched)):
+            return sparse.csr_matrix((weights,
+                                      (local, np.arange(len(local)))),
+                                     shape=(size, len(local)))
+
+        yield chunk, touched, owner_matrix
+
+
+def _tents(birth, death, grid):
+    ''' Landscape tent of each pair sampled on 'grid' (pairs x samples). '''
+    tents = np.minimum(grid - birth[:, np.newaxis],
+                       death[:, np.newaxis] - grid)
+
+    return np.maximum(tents, 0.0, out=tents)
+
+
+class _DiagramTransformer(BaseEstimator, TransformerMixin):
+    ''' Shared fit/transform: one block of features per homology dimension.
+        Subclasses implement _fit_block and _transform_block.
+    '''
+
+    def fit(self, X, y=None):
+        owner, dimension, birth, death, n = diagram_columns(X)
+
+        self.dimensions_ = self._check_dimensions(dimension)
+        self.ranges_ = [self._fit_block(*self._block(dimension, d, birth,
+                                                     death))
+                        for d in self.dimensions_]
+
+        return self
+
+    def transform(self, X):
+        owner, dimension, birth, death, n = diagram_columns(X)
+        self._check_dimensions(dimension)
+
+        blocks = []
+        for d, fitted in zip(self.dimensions_, self.ranges_):
+            mask = self._mask(dimension, d)
+            blocks.append(self._transform_block(owner[mask], birth[mask],
+                                                death[mask], n, fitted))
+
+        if len(blocks) == 1:
+            return blocks[0]
+
+        return np.hstack(blocks)
+
+    def _check_dimensions(self, dimension):
+        if self.dimensions is None:
+            return [None]
+
+        if np.any(dimension < 0):
+            raise ValueError('dimensions={} needs diagrams that carry the '
+                             'homology dimension (PersistenceDiagram or '
+                             '(dimension, birth, death) rows)'
+                             .format(self.dimensions))
+
+        return list(self.dimensions)
+
+    @staticmethod
+    def _mask(dimension, d):
+        if d is None:
+            return np.ones(len(dimension), dtype=bool)
+
+        return dimension == d
+
+    def _block(self, dimension, d, birth, death):
+        mask = self._mask(dimension, d)
+
+        return birth[mask], death[mask]
+
+
+def _span(values, given):
+    ''' 'given' if set, else the range of 'values' (never empty). '''
+    if given is not None:
+        return tuple(given)
+
+    if len(values) == 0:
+        return (0.0, 1.0)
+
+    low, high = float(values.min()), float(values.max())
+    if high <= low:
+        high = low + 1.0
+
+    return (low, high)
+
+
+class PersistenceImage(_DiagramTransformer):
+    ''' Persistence images (Adams et al. 2017).
+
+        Each pair becomes a Gaussian of width 'sigma' at (birth, death -
+        birth), weighted by 'weight': 'persistence' (linear in death - birth,
+        so pairs on the diagonal vanish), None for uniform weights, or a
+        callable of (birth, persistence) arrays.  The Gaussians are
+        integrated exactly over each pixel of a resolution[0] x
+        resolution[1] grid (birth x persistence) spanning birth_range x
+        persistence_range, learnt by 'fit' when None.
+
+        OUTPUT of transform: (n_diagrams, len(dimensions) * pixels), each
+        image flattened with persistence as the slow axis.
+    '''
+
+    def __init__(self, resolution=(20, 20), sigma=0.1, weight='persistence',
+                 birth_range=None, persistence_range=None, dimensions=None,
+                 dtype=np.float64, chunk_size=4096):
+        self.resolution = resolution
+        self.sigma = sigma
+        self.weight = weight
+        self.birth_range = birth_range
+        self.persistence_range = persistence_range
+        self.dimensions = dimensions
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+
+    def _fit_block(self, birth, death):
+        return (_span(birth, self.birth_range),
+                _span(death - birth, self.persistence_range))
+
+    def _weights(self, birth, persistence):
+        if self.weight is None:
+            return np.ones(len(birth))
+        if self.weight == 'persistence':
+            return persistence
+        if callable(self.weight):
+            return np.asarray(self.weight(birth, persistence),
+                              dtype=np.float64)
+
+        raise ValueError('Unknown weight {!r}'.format(self.weight))
+
+    def _pixel_mass(self, centers, edges):
+        ''' Gaussian mass of each center in each interval between edges
+            (pairs x pixels).
+        '''
+        cdf = ndtr((edges[np.newaxis, :] - centers[:, np.newaxis])
+                   / self.sigma)
+
+        return np.diff(cdf, axis=1)
+
+    def _transform_block(self, owner, birth, death, n_diagrams, fitted):
+        (bmin, bmax), (pmin, pmax) = fitted
+        nx, ny = self.resolution
+        x_edges = np.linspace(bmin, bmax, nx + 1)
+        y_edges = np.linspace(pmin, pmax, ny + 1)
+
+        persistence = death - birth
+        weights = self._weights(birth, persistence)
+
+        images = np.zeros((n_diagrams, nx * ny), dtype=self.dtype)
+        for chunk, touched, owner_matrix in _owner_chunks(owner,
+                                                          self.chunk_size):
+            mx = self._pixel_mass(birth[chunk], x_edges)
+            my = self._pixel_mass(persistence[chunk], y_edges)
+            pixels = (my[:, :, np.newaxis] * mx[:, np.newaxis, :])
+            images[touched] += owner_matrix(weights[chunk]) \
+                               .dot(pixels.reshape(len(mx), -1))
+
+        return images
+
+
+class PersistenceLandscape(_DiagramTransformer):
+    ''' Persistence landscapes (Bubenik 2015): the n_layers largest tent
+        functions min(t - birth, death - t)+ at each of 'resolution' evenly
+        spaced t in sample_range (learnt by 'fit' when None).
+
+        OUTPUT of transform: (n_diagrams, len(dimensions) * n_layers *
+        resolution), layer by layer.
+    '''
+
+    def __init__(self, n_layers=5, resolution=100, sample_range=None,
+                 dimensions=None, dtype=np.float64, max_elements=2**24):
+        self.n_layers = n_layers
+        self.resolution = resolution
+        self.sample_range = sample_range
+        self.dimensions = dimensions
+        self.dtype = dtype
+        self.max_elements = max_elements
+
+    def _fit_block(self, birth, death):
+        return _span(np.r_[birth, death], self.sample_range)
+
+    def _transform_block(self, owner, birth, death, n_diagrams, fitted):
+        grid = np.linspace(fitted[0], fitted[1], self.resolution)
+        k = self.n_layers
+        landscapes = np.zeros((n_diagrams, k, self.resolution),
+                              dtype=self.dtype)
+
+        if len(owner) == 0:
+            return landscapes.reshape(n_diagrams, -1)
+
+        order = np.argsort(owner, kind='stable')
+        owner, birth, death = owner[order], birth[order], death[order]
+
+        counts = np.bincount(owner, minlength=n_diagrams)
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(owner)) - starts[owner]
+
+        # Pad each diagram's tents to a common height and sort the columns,
+        # a group of diagrams at a time to bound the padded array.
+        height = max(int(counts.max()), k)
+        step = max(1, self.max_elements // (height * self.resolution))
+        for first in range(0, n_diagrams, step):
+            last = min(first + step, n_diagrams)
+            rows = slice(starts[first], starts[last - 1] + counts[last - 1])
+
+            padded = np.zeros((last - first, height, self.resolution))
+            padded[owner[rows] - first, rank[rows]] = \
+                _tents(birth[rows], death[rows], grid)
+
+            padded = -np.partition(-padded, k - 1, axis=1)[:, :k]
+            landscapes[first:last] = -np.sort(-padded, axis=1)
+
+        return landscapes.reshape(n_diagrams, -1)
+
+
+class PersistenceSilhouette(_DiagramTransformer):
+    ''' Power-weighted silhouettes (Chazal et al. 2014): the average of the
+        tent functions weighted by (death - birth)**power, sampled at
+        'resolution' points of sample_range (learnt by 'fit' when None).
+
+        OUTPUT of transform: (n_diagrams, len(dimensions) * resolution).
+    '''
+
+    def __init__(self, power=1.0, resolution=100, sample_range=None,
+                 dimensions=None, dtype=np.float64, chunk_size=4096):
+        self.power = power
+        self.resolution = resolution
+        self.sample_range = sample_range
+        self.dimensions = dimensions
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+
+    def _fit_block(self, birth, death):
+        return _span(np.r_[birth, death], self.sample_range)
+
+    def _transform_block(self, owner, birth, death, n_diagrams, fitted):
+        grid = np.linspace(fitted[0], fitted[1], self.resolution)
+        weights = (death - birth) ** self.power
+
+        # Each diagram's weighted sum is divided by its total weight as it
+        # is added, so only float64 chunks are ever held.
+        total = np.bincount(owner, weights=weights, minlength=n_diagrams)
+        total[total == 0] = 1.0
+
+        silhouettes = np.zeros((n_diagrams, self.resolution),
+                               dtype=self.dtype)
+        for chunk, touched, owner_matrix in _owner_chunks(owner,
+                                                          self.chunk_size):
+            silhouettes[touched] += owner_matrix(weights[chunk]) \
+                                    .dot(_tents(birth[chunk], death[chunk],
+                                                grid)) \
+                                    / total[touched, np.newaxis]
+
+        return silhouettes